@@ -0,0 +1,263 @@
+# ---------------------------------------------------------------------------
+# Пакетное выполнение скрипта на большом источнике данных
+# Таблица источника данных делится на части (шарды) по строкам, для каждой части
+# создается копия проекта, запускается виртуальный дисплей Xvfb и на нем отдельный
+# процесс программы, который выполняет скрипт на своей части данных (main.py --run ... --report ...).
+# После завершения всех процессов их отчеты объединяются в один отчет в папке проекта.
+# Работает только в Linux, нужен установленный Xvfb.
+# ---------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+from datetime import datetime
+
+from exceptions import BatchError
+from settings import settings
+from define_platform import system
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+class RunReport(logging.Handler):
+    """ Отчет о выполнении скрипта в процессе-исполнителе
+
+    Подключается к логгеру программы при запуске с ключом --report и собирает все сообщения.
+    По завершении скрипта отчет записывается в json файл, который читает пакетный исполнитель.
+    Сервис (daemon) так же собирает отчет о выполнении и возвращает его клиенту.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path  # Куда записать отчет
+        self.started = time.time()
+        self.records = []  # Все сообщения (уровень, время от старта, текст)
+
+    def emit(self, record):
+        self.records.append((record.levelname, round(record.created - self.started, 3), record.getMessage()))
+
+    def result(self, data) -> dict:
+        """ Отчет в словаре, принимает объект с данными о скрипте """
+        errors = [mess for level, _, mess in self.records if level in ('ERROR', 'CRITICAL')]
+        return {
+            'project': settings.project_name,
+            'started': datetime.fromtimestamp(self.started).strftime('%d.%m.%Y %H:%M:%S'),
+            'duration': round(time.time() - self.started, 3),
+            'completed': data.finished,  # Скрипт дошел до конца списка команд
+            'errors': errors,
+            'pointers_data_source': data.pointers_data_source,
+            'log': self.records,
+        }
+
+    def save(self, data):
+        """ Запись отчета, принимает объект с данными о скрипте """
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.result(data), f, ensure_ascii=False, indent=2, default=str)
+
+
+class VirtualDisplay:
+    """ Виртуальный дисплей Xvfb для одного исполнителя """
+
+    start_timeout = 10  # Сколько секунд ждать запуска Xvfb
+
+    def __init__(self, number, screen):
+        self.number = number  # Номер дисплея :N
+        self.screen = screen  # Разрешение и глубина цвета, например 1920x1080x24
+        self.process = None
+
+    @property
+    def name(self):
+        return f':{self.number}'
+
+    @staticmethod
+    def is_free(number) -> bool:
+        """ Дисплей не занят другим X сервером """
+        return not os.path.exists(f'/tmp/.X{number}-lock') and not os.path.exists(f'/tmp/.X11-unix/X{number}')
+
+    def start(self):
+        """ Запуск Xvfb и ожидание, пока он начнет принимать подключения """
+        self.process = subprocess.Popen(['Xvfb', self.name, '-screen', '0', self.screen, '-nolisten', 'tcp'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + self.start_timeout
+        while not os.path.exists(f'/tmp/.X11-unix/X{self.number}'):
+            if self.process.poll() is not None or time.time() > deadline:
+                self.stop()
+                raise BatchError(f'Не удалось запустить виртуальный дисплей {self.name}.')
+            time.sleep(0.05)
+
+    def stop(self):
+        """ Остановка Xvfb """
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+class Shard:
+    """ Часть источника данных и процесс, который ее обрабатывает """
+
+    def __init__(self, number, first_row, data_frame):
+        self.number = number  # Номер части
+        self.first_row = first_row  # Номер первой строки части в исходной таблице
+        self.data_frame = data_frame  # Строки части
+        self.path_to_project = ''  # Путь к копии проекта (с папкой проекта)
+        self.data_file = ''  # Имя файла части в папке data копии проекта
+        self.report_file = ''  # Куда процесс-исполнитель запишет отчет
+        self.display = None  # Виртуальный дисплей
+        self.app = None  # Процесс приложения, с которым работает скрипт (если указано)
+        self.process = None  # Процесс программы, выполняющей скрипт
+        self.started = 0
+        self.duration = 0
+
+    def prepare(self, project, data_file, work_dir):
+        """ Копирование проекта и запись части таблицы в папку данных копии """
+        name = os.path.basename(project)
+        self.path_to_project = os.path.join(work_dir, f'shard_{self.number}', name)
+        # Копируем проект без старых данных, таблица у каждой части своя
+        shutil.copytree(project, self.path_to_project, ignore=shutil.ignore_patterns(settings.data_folder))
+        os.makedirs(os.path.join(self.path_to_project, settings.data_folder), exist_ok=True)
+        # Старый формат xls pandas не записывает, часть всегда сохраняется в xlsx
+        self.data_file = f'{os.path.splitext(data_file)[0]}.xlsx'
+        self.data_frame.to_excel(os.path.join(self.path_to_project, settings.data_folder, self.data_file), index=False)
+        self.report_file = os.path.join(work_dir, f'report_{self.number}.json')
+
+    def start(self, display, app=None):
+        """ Запуск приложения и исполнителя скрипта на виртуальном дисплее """
+        self.display = display
+        env = dict(os.environ, DISPLAY=display.name)
+        if app:
+            self.app = subprocess.Popen(app, shell=True, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        program = os.path.dirname(os.path.abspath(__file__))
+        self.started = time.time()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(program, 'main.py'),
+             '--run', self.path_to_project, self.data_file, '--report', self.report_file],
+            cwd=program, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def stop(self):
+        """ Завершение исполнителя и приложения, если они еще работают """
+        for process in (self.process, self.app):
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def wait(self, timeout=None):
+        """ Ожидание завершения исполнителя, возвращает часть общего отчета """
+        if timeout is not None:
+            timeout = max(0, timeout - (time.time() - self.started))  # Время считается от запуска
+        try:
+            _, stderr = self.process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            _, stderr = self.process.communicate()
+            stderr = 'Превышено время выполнения.\n'.encode() + stderr
+        self.duration = round(time.time() - self.started, 3)
+        if self.app and self.app.poll() is None:
+            self.app.terminate()
+
+        result = {'shard': self.number,
+                  'rows': [self.first_row, self.first_row + len(self.data_frame) - 1],
+                  'display': self.display.name,
+                  'returncode': self.process.returncode,
+                  'duration': self.duration,
+                  'completed': False,
+                  'errors': []}
+        try:
+            with open(self.report_file, encoding='utf-8') as f:
+                report = json.load(f)
+            result['completed'] = report['completed']
+            result['errors'] = report['errors']
+            result['pointers_data_source'] = report['pointers_data_source']
+            result['log'] = report['log']
+        except (OSError, ValueError, KeyError):
+            # Процесс завершился аварийно и не успел записать отчет
+            result['errors'].append(stderr.decode(errors='replace')[-2000:] or 'Отчет не получен.')
+        return result
+
+
+def split_data(path_to_file, workers) -> list:
+    """ Деление таблицы на части по строкам, возвращает список объектов Shard """
+    import pandas as pd  # Загружается только при пакетном выполнении
+
+    data_frame = pd.read_excel(path_to_file)
+    rows = len(data_frame)
+    if not rows:
+        raise BatchError('Источник данных пуст.')
+    workers = max(1, min(workers, rows))
+    size = -(-rows // workers)  # Округление вверх
+    return [Shard(number, start, data_frame.iloc[start:start + size])
+            for number, start in enumerate(range(0, rows, size))]
+
+
+def run_batch(project, data_file, workers=2, app=None, screen=None, timeout=None, keep=False) -> str:
+    """ Пакетное выполнение скрипта
+
+    project - полный путь к папке проекта, data_file - имя файла в папке data проекта,
+    workers - количество параллельных исполнителей, app - команда запуска приложения,
+    с которым работает скрипт (запускается на каждом дисплее), screen - разрешение дисплеев,
+    timeout - ограничение времени работы одного исполнителя (сек.), keep - не удалять копии проекта.
+    Возвращает путь к общему отчету.
+    """
+    if system.os != 'Linux':
+        raise BatchError('Пакетное выполнение поддерживается только в Linux.')
+    if not shutil.which('Xvfb'):
+        raise BatchError('Не найден Xvfb, установите его для пакетного выполнения.')
+    project = os.path.abspath(project)
+    path_to_file = os.path.join(project, settings.data_folder, data_file)
+    if not os.path.exists(path_to_file):
+        raise BatchError(f'Файл {data_file} не найден.')
+
+    started = time.time()
+    shards = split_data(path_to_file, workers)
+    work_dir = tempfile.mkdtemp(prefix='swd_batch_')
+    displays = []
+    try:
+        number = settings.batch_first_display
+        for shard in shards:
+            shard.prepare(project, data_file, work_dir)
+            while not VirtualDisplay.is_free(number):
+                number += 1
+            display = VirtualDisplay(number, screen or settings.batch_screen)
+            display.start()
+            displays.append(display)
+            shard.start(display, app)
+            number += 1
+        logger.warning(f'Пакетное выполнение: запущено исполнителей {len(shards)}.')
+
+        results = [shard.wait(timeout) for shard in shards]
+    finally:
+        for shard in shards:
+            shard.stop()  # Если запуск прервался, уже запущенные исполнители не остаются работать
+        for display in displays:
+            display.stop()
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    duration = round(time.time() - started, 3)
+    report = {'project': os.path.basename(project),
+              'data_file': data_file,
+              'workers': len(shards),
+              'rows': sum(len(shard.data_frame) for shard in shards),
+              'started': datetime.fromtimestamp(started).strftime('%d.%m.%Y %H:%M:%S'),
+              'duration': duration,
+              'completed': sum(result['completed'] for result in results),
+              'failed': sum(not result['completed'] for result in results),
+              'shards': results}
+    path_report = os.path.join(project, f'batch_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    with open(path_report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    logger.warning(f'Пакетное выполнение завершено за {duration} сек. '
+                   f'Успешно частей: {report["completed"]}, с ошибками: {report["failed"]}. Отчет: {path_report}')
+    return path_report
@@ -0,0 +1,523 @@
+# ---------------------------------------------------------------------------
+# Замеры производительности
+# Каждый замер - функция, зарегистрированная декоратором benchmark. Она возвращает словарь
+# с результатами, а если результат хуже допустимого - поле failed с описанием.
+# Запуск всех замеров:      python benchmark.py
+# Запуск отдельных замеров: python benchmark.py stop_latency startup
+# Программа завершается с кодом 1, если хотя бы один замер не уложился в норму.
+# ---------------------------------------------------------------------------
+import os
+import sys
+import json
+import shutil
+import time
+import threading
+import tracemalloc
+import statistics
+import subprocess
+
+BENCHMARKS = dict()  # Зарегистрированные замеры: имя -> функция
+
+
+def benchmark(func):
+    """ Декоратор регистрирует функцию замера """
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+@benchmark
+def stop_latency(repeats=20, pause=5.0, limit=0.05):
+    """ Задержка остановки скрипта
+
+    Поток выполняет скрипт с командой Пауза на pause сек., затем - проверку изображения, которое не появляется
+    (повторные попытки раз в секунду). Основной поток в разные моменты останавливает скрипт так же, как
+    кнопка Стоп (data.script_started = False, см. Tracker.stop_btn), и замеряет, через сколько поток
+    выполнения вернулся. Остановка не ошибка команды: пауза завершается без ошибки, проверка
+    изображения - NoCommandOrStop (без реакции на ошибку и диалога). Норма - не больше limit сек.
+    """
+    import tempfile
+    import cv2
+    import numpy as np
+    import element_images
+    from commands import CommandClasses
+    from components import data
+    from data_types import eres
+    from exceptions import NoCommandOrStop
+    from settings import settings
+
+    CommandClasses.data = data
+    data.work_settings = settings.get_dict_settings()
+    data.load_commands([CommandClasses.create_command(pause, command='PauseCmd'),
+                        CommandClasses.create_command(0, command='PauseCmd')])
+    folder = tempfile.mkdtemp(prefix='swd_bench_')
+    template = os.path.join(folder, 'element.png')
+    cv2.imwrite(template, np.random.default_rng(0).integers(0, 256, (48, 48), dtype=np.uint8))
+    search_args = (100, 100, template, True, True, 48, int(pause) + 1, False, 'Не найдено', eres('stop:'), '')
+
+    def run_script():
+        data.pointer_command = 0
+        data.run_command()
+
+    def run_search():
+        element_images.pattern_search(*search_args)
+
+    screenshot = element_images.screenshot
+    element_images.screenshot = lambda *args: np.zeros((48, 48, 3), dtype=np.uint8)  # Экран без элемента
+    result = {'repeats': repeats}
+    try:
+        for name, target, expected in (('pause', run_script, None), ('search', run_search, NoCommandOrStop)):
+            latencies, errors = [], []
+
+            def worker():
+                try:
+                    target()
+                except Exception as err:
+                    errors.append(err)
+
+            for i in range(repeats):
+                errors.clear()
+                data.script_started = True
+                thread = threading.Thread(target=worker)
+                thread.start()
+                time.sleep(0.01 + 0.005 * i)  # Поток уже выполняет команду
+                start = time.perf_counter()
+                data.script_started = False  # Как кнопка Стоп
+                thread.join(pause + 1)
+                latencies.append(time.perf_counter() - start)
+                if [type(err) for err in errors] != ([expected] if expected else []):
+                    result['failed'] = f'{name}: остановка завершилась ошибкой {errors}.'
+            result[f'{name}_mean_ms'] = round(statistics.mean(latencies) * 1000, 3)
+            result[f'{name}_max_ms'] = round(max(latencies) * 1000, 3)
+            if 'failed' not in result and max(latencies) > limit:
+                result['failed'] = f'{name}: остановка заметна через {result[f"{name}_max_ms"]} мс, ' \
+                                   f'норма {limit * 1000:.0f} мс.'
+    finally:
+        element_images.screenshot = screenshot
+        data.script_started = False
+        shutil.rmtree(folder, ignore_errors=True)
+    return result
+
+
+@benchmark
+def startup(repeats=5, limit=3.0):
+    """ Время запуска программы до появления окна быстрого запуска
+
+    Программа запускается repeats раз отдельными процессами с ключом --bench-startup и сама сообщает
+    время загрузки модулей (import) и время до отрисовки первого окна (first_window).
+    Отдельно замеряется загрузка тяжелых модулей, которые не должны загружаться при запуске.
+    Норма - медиана first_window не больше limit сек. Нужен графический дисплей.
+    """
+    work_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeats):
+        process = subprocess.run([sys.executable, 'main.py', '--bench-startup'], cwd=work_dir,
+                                 capture_output=True, text=True, timeout=60)
+        if process.returncode:
+            return {'failed': f'Программа не запустилась. {process.stderr.strip()[-500:]}'}
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+    result = {'repeats': repeats,
+              'import_s': round(statistics.median(run['import'] for run in runs), 3),
+              'first_window_s': round(statistics.median(run['first_window'] for run in runs), 3)}
+
+    # Стоимость отложенных модулей: каждый загружается в чистом процессе
+    deferred = dict()
+    for module in ('pandas', 'cv2', 'numpy', 'pyautogui', 'barcode'):
+        code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+        process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60)
+        deferred[module] = round(float(process.stdout), 3) if not process.returncode else None
+    result['deferred_s'] = deferred
+
+    if result['first_window_s'] > limit:
+        result['failed'] = f'Окно открывается через {result["first_window_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def load_script(commands=50000, labels_every=10, limit=2.0):
+    """ Загрузка большого скрипта с метками
+
+    Скрипт из commands команд, каждая labels_every-я - метка, остальные - паузы и переходы к меткам.
+    Загружается тем же методом, что и файл проекта (SaveLoad.change_script_and_settings),
+    но без вывода в список команд. Норма - не больше limit сек.
+    """
+    from types import SimpleNamespace
+    from components import SaveLoad, data
+
+    script = []
+    for i in range(commands):
+        if i % labels_every == 0:
+            script.append({'cmd': 'LabelCmd', 'val': [f'Метка {i}'], 'des': ''})
+        elif i % labels_every == 1:
+            script.append({'cmd': 'RunCmd', 'val': [f'Метка {i - 1}'], 'des': ''})
+        else:
+            script.append({'cmd': 'PauseCmd', 'val': [0.1], 'des': ''})
+
+    stub = SimpleNamespace(display_commands=SimpleNamespace(out_commands=lambda: None))
+    start = time.perf_counter()
+    SaveLoad.change_script_and_settings(stub, {'script': script, 'settings': {}})
+    elapsed = time.perf_counter() - start
+
+    result = {'commands': len(data.queue_command), 'labels': commands // labels_every, 'load_s': round(elapsed, 3)}
+    if elapsed > limit:
+        result['failed'] = f'Скрипт загружается {result["load_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def select_delete(commands=50000, lines=10000, limit=1.0):
+    """ Выделение и удаление строк в большом скрипте
+
+    В очереди команд из commands строк находятся номера lines строк (как при выделении и копировании
+    в списке команд), затем эти строки удаляются по одной (как DataForWorker.del_command).
+    Для сравнения те же операции выполняются со списком. Норма - не больше limit сек.
+    """
+    import random
+    from sequence import IndexedSequence
+
+    ids = [f'cmd{i}' for i in range(commands)]
+    selected = random.Random(0).sample(ids, lines)
+    result = {'commands': commands, 'lines': lines}
+    for name, queue in (('sequence', IndexedSequence(ids)), ('list', list(ids))):
+        start = time.perf_counter()
+        [str(queue.index(i) + 1) for i in selected]  # Номера выделенных строк
+        for i in selected:
+            queue.remove(i)
+        result[f'{name}_s'] = round(time.perf_counter() - start, 3)
+
+    if result['sequence_s'] > limit:
+        result['failed'] = f'Строки удаляются {result["sequence_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def command_memory(repeats=2000, limit=400):
+    """ Память на один объект команды
+
+    Создается repeats наборов типичных команд (клик, клавиши, текст, пауза, поле, конец цикла)
+    так же, как при загрузке скрипта, без окна программы. Память замеряется tracemalloc.
+    Норма - в среднем не больше limit байт на команду.
+    """
+    from commands import CommandClasses
+    from components import data
+
+    CommandClasses.data = data
+    mix = [('MouseClickLeft', [100, 200, 'element.png']), ('KeyDown', ['a']), ('KeyUp', ['a']),
+           ('WriteCmd', ['Текст']), ('PauseCmd', [0.5]), ('WriteDataFromField', ['']), ('CycleEnd', [])]
+    source, data.data_source = data.data_source, {'Поле': ['']}  # Без источника команда поля пишет ошибку в лог
+    try:
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        commands = [CommandClasses.create_command(*val, command=cmd, description='')
+                    for _ in range(repeats) for cmd, val in mix]
+        size = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+    finally:
+        data.data_source = source
+
+    result = {'commands': len(commands), 'bytes_per_command': round(size / len(commands))}
+    if result['bytes_per_command'] > limit:
+        result['failed'] = f'Команда занимает {result["bytes_per_command"]} байт, норма {limit} байт.'
+    return result
+
+
+@benchmark
+def undo_history(commands=20000, edits=200, limit=0.05):
+    """ Отмена и возврат правок в большом скрипте
+
+    В скрипт из commands команд вносится edits правок (вставка, удаление, замена, перенос строк),
+    каждая записывается в историю шагом. Затем все правки отменяются и возвращаются.
+    Норма - в среднем не больше limit сек. на шаг (время не должно зависеть от длины скрипта).
+    """
+    import random
+    from commands import CommandClasses
+    from components import data
+    from history import History
+
+    CommandClasses.data = data
+    data.load_commands([CommandClasses.create_command(0.1, command='PauseCmd') for _ in range(commands)])
+    history = History()
+    data.listeners.append(history.record)
+    rnd = random.Random(0)
+    try:
+        history.commit([], {})
+        for i in range(edits):
+            key = data.queue_command[rnd.randrange(len(data.queue_command))]
+            kind = i % 4
+            if kind == 0:
+                data.pointer_command = rnd.randrange(len(data.queue_command))
+                data.add_new_command(CommandClasses.create_command(0.2, command='PauseCmd'))
+            elif kind == 1:
+                data.del_command(key)
+            elif kind == 2:
+                data.replace_command(key, CommandClasses.create_command(0.3, command='PauseCmd'))
+            else:
+                data.move_commands([key], rnd.randrange(len(data.queue_command)))
+            history.commit([], {})
+        final = list(data.queue_command)
+
+        start = time.perf_counter()
+        while history.can_undo():
+            history.undo(data)
+        while history.can_redo():
+            history.redo(data)
+        elapsed = (time.perf_counter() - start) / (2 * edits)
+    finally:
+        data.listeners.remove(history.record)
+
+    result = {'commands': commands, 'edits': edits, 'step_s': round(elapsed, 5),
+              'history_kb': round(history.size / 1024)}
+    if list(data.queue_command) != final:
+        result['failed'] = 'После отмены и возврата скрипт отличается от исходного.'
+    elif elapsed > limit:
+        result['failed'] = f'Шаг истории выполняется {result["step_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def block_move(commands=50000, block=50, steps=500, limit=0.002):
+    """ Перенос блока строк вниз по скрипту (Ctrl+Down)
+
+    Блок из block строк в начале скрипта из commands команд переносится на строку вниз steps раз
+    с записью каждого шага в историю, как DisplayCommands.down. Норма - не больше limit сек. на шаг.
+    """
+    from commands import CommandClasses
+    from components import data
+    from history import History
+
+    CommandClasses.data = data
+    data.load_commands([CommandClasses.create_command(0.1, command='PauseCmd') for _ in range(commands)])
+    history = History()
+    data.listeners.append(history.record)
+    keys = list(data.queue_command[:block])
+    try:
+        history.commit([], {})
+        start = time.perf_counter()
+        for _ in range(steps):
+            data.move_commands(keys, data.queue_command.index(keys[0]) + 1)
+            history.commit([], {})
+        elapsed = (time.perf_counter() - start) / steps
+    finally:
+        data.listeners.remove(history.record)
+
+    result = {'commands': commands, 'block': block, 'step_s': round(elapsed, 5)}
+    if data.queue_command.index(keys[0]) != steps:
+        result['failed'] = 'Блок оказался не на своем месте.'
+    elif elapsed > limit:
+        result['failed'] = f'Шаг переноса выполняется {result["step_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def project_catalogue(projects=20, commands=20000, limit=0.01):
+    """ Чтение списка проектов (менеджер проектов)
+
+    В папку записываются projects проектов по commands команд в json и в компактном формате.
+    Для каждого формата замеряется чтение данных всех проектов без скрипта (project_file.read_header),
+    а также размер файла и полное чтение одного проекта. Норма - не больше limit сек. на весь список
+    в компактном формате.
+    """
+    import tempfile
+    import project_file
+
+    script = [{'cmd': 'MouseClickLeft', 'val': [i % 1920, i % 1080, f'elem_{i}.png'], 'des': ''} if i % 3 == 0
+              else {'cmd': 'PauseCmd', 'val': [0.1], 'des': 'Пауза'} for i in range(commands)]
+    project = {'script': script, 'settings': {'s_description': 'Проект для замера'}, 'data_source': '',
+               'saved': '01.01.2024', 'updated': '02.01.2024'}
+    result = {'projects': projects, 'commands': commands}
+    with tempfile.TemporaryDirectory() as folder:
+        for compact, name in ((False, 'json'), (True, 'compact')):
+            paths = [project_file.new_path(folder, f'p{i}', compact) for i in range(projects)]
+            for path in paths:
+                project_file.write(path, project)
+            start = time.perf_counter()
+            for path in paths:
+                project_file.read_header(path)
+            result[f'{name}_catalogue_s'] = round(time.perf_counter() - start, 4)
+            start = time.perf_counter()
+            if project_file.read(paths[0])['script'] != script:
+                result['failed'] = f'Скрипт в формате {name} прочитан с ошибками.'
+            result[f'{name}_read_s'] = round(time.perf_counter() - start, 4)
+            result[f'{name}_kb'] = round(os.path.getsize(paths[0]) / 1024)
+
+    if 'failed' not in result and result['compact_catalogue_s'] > limit:
+        result['failed'] = f'Список проектов читается {result["compact_catalogue_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def autosave(commands=50000, edits=20, limit=0.02):
+    """ Автосохранение правок большого скрипта
+
+    В скрипт из commands команд вносится edits правок, затем они дописываются в журнал проекта
+    (Journal.flush). Для сравнения замеряется полное атомарное сохранение того же скрипта.
+    Норма - автосохранение не дольше limit сек.
+    """
+    import tempfile
+    import project_file
+    from commands import CommandClasses
+    from components import data
+    from journal import Journal
+    from settings import settings
+
+    CommandClasses.data = data
+    data.load_commands([CommandClasses.create_command(0.1, command='PauseCmd') for _ in range(commands)])
+    journal = Journal(data)
+    data.listeners.append(journal.record)
+    path_to_script, project_name = settings.path_to_script, settings.project_name
+    result = {'commands': commands, 'edits': edits}
+    with tempfile.TemporaryDirectory() as folder:
+        settings.path_to_script, settings.project_name = folder, 'bench'
+        try:
+            journal.open('')
+            for i in range(edits):
+                data.pointer_command = i * (commands // edits)
+                data.add_new_command(CommandClasses.create_command(0.2, command='PauseCmd'))
+            start = time.perf_counter()
+            journal.flush()
+            elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            project_file.write(os.path.join(folder, 'bench.json'),
+                               {'script': [data.obj_command[key].command_to_dict() for key in data.queue_command],
+                                'settings': settings.get_dict_settings()})
+            result['full_save_s'] = round(time.perf_counter() - start, 4)
+        finally:
+            journal.stop()
+            data.listeners.remove(journal.record)
+            settings.path_to_script, settings.project_name = path_to_script, project_name
+
+    result['autosave_s'] = round(elapsed, 4)
+    if elapsed > limit:
+        result['failed'] = f'Автосохранение занимает {result["autosave_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def command_search(commands=50000, limit=0.05):
+    """ Поиск команд в большом скрипте
+
+    Скрипт из commands команд: щелчки по изображениям, вывод из полей, метки и переходы к ним, паузы
+    с описаниями. Запросы выполняются по индексам поиска (search.CommandIndex), после правки скрипта
+    индексы обновляются наблюдателем. Для сравнения замеряется перебор скрипта с проверкой каждой команды.
+    Норма - самый долгий запрос не дольше limit сек.
+    """
+    from types import SimpleNamespace
+    from components import SaveLoad, data
+    from commands import CommandClasses
+    from search import CommandIndex
+
+    CommandClasses.data = data
+    script = []
+    for i in range(commands):
+        kind = i % 5
+        if kind == 0:
+            script.append({'cmd': 'MouseClickLeft', 'val': [i % 1920, i % 1080, f'elem_{i % 500}.png'], 'des': ''})
+        elif kind == 1:
+            script.append({'cmd': 'WriteDataFromField', 'val': [f'Поле {i % 20}'], 'des': ''})
+        elif kind == 2:
+            script.append({'cmd': 'LabelCmd', 'val': [f'Метка {i}'], 'des': ''})
+        elif kind == 3:
+            script.append({'cmd': 'RunCmd', 'val': [f'Метка {i - 1}'], 'des': ''})
+        else:
+            script.append({'cmd': 'PauseCmd', 'val': [0.1], 'des': f'Ожидание отчета {i}'})
+    stub = SimpleNamespace(display_commands=SimpleNamespace(out_commands=lambda: None))
+    source, data.data_source = data.data_source, {f'Поле {i}': [''] for i in range(20)}  # Поля команд вывода
+    SaveLoad.change_script_and_settings(stub, {'script': script, 'settings': {}})
+
+    start = time.perf_counter()
+    index = CommandIndex(data)
+    result = {'commands': commands, 'build_s': round(time.perf_counter() - start, 3)}
+    data.listeners.append(index.update)
+    try:
+        for i in range(0, 200, 5):
+            data.replace_command(data.queue_command[i], CommandClasses.create_command(
+                10, 20, 'elem_new.png', command='MouseClickLeft'))
+        queries = ['cmd:MouseClickLeft image:elem_7.png', 'cmd:WriteDataFromField field:"Поле 3"',
+                   'cmd:RunCmd label:"Метка 102"', 'x:100-300 y:50-60', 'cmd:MouseClick* x:10 y:20',
+                   'ожидание 4999', 'отчета', 'image:elem_new.png']
+        times = []
+        for query in queries:
+            start = time.perf_counter()
+            index.find(query)
+            times.append(time.perf_counter() - start)
+        if len(index.find('image:elem_new.png')) != 40:
+            result['failed'] = 'Индексы поиска не обновились после правки скрипта.'
+
+        start = time.perf_counter()
+        [key for key in data.queue_command if data.obj_command[key].__class__.__name__ == 'MouseClickLeft'
+         and data.obj_command[key].image == 'elem_7.png']
+        result['scan_s'] = round(time.perf_counter() - start, 4)
+    finally:
+        data.listeners.remove(index.update)
+        data.data_source = source
+
+    result['max_query_s'] = round(max(times), 4)
+    if 'failed' not in result and max(times) > limit:
+        result['failed'] = f'Запрос выполняется {result["max_query_s"]} сек., норма {limit} сек.'
+    return result
+
+
+@benchmark
+def library_include(commands=5000, projects=20, limit=0.001):
+    """ Вызов блока библиотеки из многих проектов
+
+    В рабочей папке проект-библиотека с блоком из commands команд. Блок запрашивается так же, как его
+    вызывают команды Подпрограмма projects проектов, выполняемых в одном процессе. Первый запрос
+    компилирует блок, остальные берут его из кэша. Норма - запрос из кэша не дольше limit сек.,
+    все проекты получают один и тот же скомпилированный блок.
+    """
+    import tempfile
+    import project_file
+    from commands import CommandClasses
+    from components import data
+    from library import libraries
+    from settings import settings
+
+    CommandClasses.data = data
+    script = [{'cmd': 'BlockCmd', 'val': ['Вход'], 'des': ''}]
+    script += [{'cmd': 'KeyDown', 'val': ['a'], 'des': ''} for _ in range(commands)]
+    script.append({'cmd': 'BlockEnd', 'val': [], 'des': ''})
+    work_dir = settings.work_dir
+    result = {'commands': commands, 'projects': projects}
+    with tempfile.TemporaryDirectory() as folder:
+        settings.work_dir = folder
+        try:
+            os.makedirs(os.path.join(folder, 'lib', settings.elements_folder))
+            project_file.write(os.path.join(folder, 'lib', 'lib.json'), {'script': script, 'settings': {}})
+            start = time.perf_counter()
+            first = libraries.get('lib', 'Вход', data)
+            result['compile_s'] = round(time.perf_counter() - start, 4)
+            tracemalloc.start()
+            start = time.perf_counter()
+            programs = [libraries.get('lib', 'Вход', data) for _ in range(projects)]
+            elapsed = (time.perf_counter() - start) / projects
+            result['cached_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+        finally:
+            settings.work_dir = work_dir
+
+    result['cached_s'] = round(elapsed, 6)
+    if any(program is not first for program in programs):
+        result['failed'] = 'Проекты получили разные копии блока библиотеки.'
+    elif elapsed > limit:
+        result['failed'] = f'Блок из кэша запрашивается {result["cached_s"]} сек., норма {limit} сек.'
+    return result
+
+
+def main(names):
+    """ Запуск замеров по именам (все, если имена не указаны), возвращает код завершения """
+    failed = False
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f'{name}: замер не найден. Доступны: {", ".join(BENCHMARKS)}')
+            failed = True
+            continue
+        result = BENCHMARKS[name]()
+        failed = failed or 'failed' in result
+        print(f'{name}: {result}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
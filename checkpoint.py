@@ -0,0 +1,128 @@
+# ---------------------------------------------------------------------------
+# Точка восстановления выполнения скрипта
+# На границах циклов (после команды Конец цикла) состояние исполнителя записывается
+# в небольшой файл в папке проекта: указатель команды, стек циклов и блоков,
+# указатели источника данных и текущие реакции на ошибки.
+# При запуске с ключом --resume выполнение продолжается с последней сохраненной точки.
+# Файл записывается атомарно: сначала во временный файл, затем замена, поэтому
+# при аварийном завершении программы остается либо старая, либо новая точка целиком.
+# ---------------------------------------------------------------------------
+import os
+import json
+import hashlib
+import logging
+from collections import deque
+from datetime import datetime
+
+from data_types import eres
+from settings import settings
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+
+class Checkpoint:
+    """ Сохранение и восстановление состояния исполнителя скрипта """
+    data_source = None  # Ссылка на объект источник данных (реализация паттерна Наблюдатель)
+
+    version = 1  # Версия формата файла
+    reactions = ('s_error_no_element', 's_error_no_data')  # Реакции на ошибки, которые меняются командами скрипта
+
+    def __init__(self):
+        self.hash = None  # Отпечаток выполняемого скрипта, вычисляется один раз при запуске (см. start)
+
+    @property
+    def path(self):
+        """ Путь к файлу точки восстановления """
+        return os.path.join(settings.path_to_script, f'{settings.project_name}.checkpoint')
+
+    @staticmethod
+    def script_hash(data) -> str:
+        """ Отпечаток скрипта и структуры источника данных
+
+        Точка восстановления годится только для того же скрипта и таблицы с теми же полями и длиной.
+        """
+        script = [data.obj_command[key].command_to_dict() for key in data.queue_command]
+        source = {field: len(values) for field, values in data.data_source.items()} if data.data_source else {}
+        text = json.dumps([script, source], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def start(self, data):
+        """ Запуск скрипта: отпечаток вычисляется один раз, во время выполнения скрипт не меняется """
+        self.hash = self.script_hash(data)
+
+    def save(self, data):
+        """ Атомарная запись точки восстановления, принимает объект с данными о скрипте """
+        if not data.work_settings['s_checkpoint']:
+            return
+        state = {'version': self.version,
+                 'saved': datetime.now().strftime('%d.%m.%Y %H:%M:%S'),
+                 'script_hash': self.hash,
+                 'data_source_file': self.data_source.data_source_file if self.data_source else '',
+                 'pointer_command': data.pointer_command,  # Команда, которая будет выполнена следующей
+                 'stack': list(data.stack),
+                 'pointers_data_source': data.pointers_data_source,
+                 'error_reactions': {key: str(data.work_settings[key]) for key in self.reactions}}
+        temp = f'{self.path}.tmp'
+        try:
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        except OSError as err:
+            logger.error(f'Не удалось сохранить точку восстановления. {err}')
+
+    def load(self):
+        """ Чтение точки восстановления, возвращает словарь или None, если ее нет """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            logger.error(f'Точка восстановления повреждена. {err}')
+            return None
+        return state if state.get('version') == self.version else None
+
+    def restore(self, data) -> bool:
+        """ Восстановление состояния исполнителя из точки восстановления
+
+        Вызывается перед запуском потока выполнения, когда рабочие настройки уже созданы.
+        Возвращает True, если состояние восстановлено.
+        """
+        state = self.load()
+        if not state:
+            logger.warning('Точки восстановления нет, скрипт выполняется сначала.')
+            return False
+        if state['script_hash'] != self.hash:
+            logger.warning('Скрипт или источник данных изменились после сохранения точки восстановления, '
+                           'скрипт выполняется сначала.')
+            return False
+        if self.data_source and state['data_source_file'] != self.data_source.data_source_file:
+            logger.warning(f'Точка восстановления сохранена для источника данных {state["data_source_file"]}, '
+                           f'скрипт выполняется сначала.')
+            return False
+
+        data.pointer_command = state['pointer_command']
+        data.stack = deque(state['stack'])
+        if state['pointers_data_source'] is not None:
+            data.pointers_data_source = state['pointers_data_source']
+        for key, value in state['error_reactions'].items():
+            data.work_settings[key] = eres(value)
+        logger.warning(f'Продолжение выполнения со строки {data.pointer_command + 1} '
+                       f'(точка восстановления от {state["saved"]}).')
+        return True
+
+    def clear(self):
+        """ Удаление точки восстановления после полного выполнения скрипта """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logger.error(f'Не удалось удалить точку восстановления. {err}')
+
+
+checkpoint = Checkpoint()  # Создаем объект точки восстановления
@@ -16,13 +16,17 @@ from tktooltip import ToolTip
 from tkinter import filedialog as fd
 import os
 import logging
-import pyautogui
 
 from data_types import llist, eres
 from data_input import DataInput
 from settings import settings
-from exceptions import DataError, NoCommandOrStop, TemplateNotFoundError, ElementNotFound
-from element_images import generate_image_name, pattern_search
+from exceptions import DataError, NoCommandOrStop, TemplateNotFoundError, ElementNotFound, LoadError, CommandTimeout
+from element_images import generate_image_name, pattern_search, confirmations
+from profiler import profiler
+from checkpoint import checkpoint
+from delays import delays
+from executor import executor
+from library import libraries
 from define_platform import system
 
 
@@ -30,12 +34,28 @@ from define_platform import system
 logger = logging.getLogger('logger')
 
 
+def press_hotkey(*keys):
+    """ Нажатие комбинации клавиш, после него прежние подтверждения изображений недействительны """
+    import pyautogui  # Загружается при первом нажатии, а не при запуске программы
+
+    executor.check_cancelled()  # Команда снята сторожевым потоком, клавиши не нажимаем
+    confirmations.invalidate()
+    pyautogui.hotkey(*keys)
+
+
 class CommandClasses(ABC):
     """ Класс, для создания классов команд
 
     Свойства класса необходимо определить до создания экземпляров команд
 
+    Параметры команды хранятся в слотах (__slots__ каждого класса), объекты команд создаются
+    без Tk и занимают мало памяти. Виджеты редактора и переменные Tk создаются только в paint_widgets,
+    при открытии команды в редакторе, и попадают в словарь экземпляра, который до этого не создается.
+    Значения виджетов по умолчанию (None) - атрибуты класса.
+
     """
+    __slots__ = ('description', '__dict__')
+
     root = None  # Родительский виджет, куда выводятся виджеты ввода
     data = None  # Объект с данными о выполнении скрипта
     tracker = None  # Объект для записи скрипта
@@ -97,6 +117,14 @@ class CommandClasses(ABC):
         """ Выполнение команды """
         pass
 
+    async def run_command_async(self):
+        """ Выполнение команды в асинхронном исполнителе
+
+        По умолчанию блокирующий run_command выполняется в пуле потоков, чтобы цикл событий
+        исполнителя в это время мог выполнять другую работу. Команды могут переопределить метод.
+        """
+        await executor.call(self.run_command)
+
     @classmethod
     def get_all_subclasses(cls):
         """ Возвращает список всех подклассов класса и их подклассов """
@@ -128,6 +156,32 @@ class MouseClickRight(CommandClasses):
     command_name = 'Клик правой кнопкой мыши'
     command_description = 'x, y - координаты на экране.'
     for_sort = 20
+    __slots__ = ('x', 'y', 'image', 'local_settings', 'local_check', 'local_check_size', 'repeat',
+                 'full_screen', 'condition', 'action', 'message')
+
+    # Виджеты, создаются при открытии команды в редакторе
+    widget_x = None
+    widget_y = None
+    label_x = None
+    label_y = None
+    element_image = None
+    icon_edit = None
+    icon_del = None
+    widget_button = None
+    widget_button_edit = None
+    widget_button_del = None
+    widget_button_more = None  # Виджет кнопки "еще"
+    # Виджеты для дополнительных настроек
+    widget_local_settings = None  # Виджет для использования локальных настроек
+    widget_local_check = None  # Виджет для включения локальной проверки
+    widget_local_check_size = None  # Виджет для ввода размера зоны локальной проверки
+    widget_repeat = None  # Виджет для ввода количества повторений
+    widget_full_screen = None  # Виджет для включения поиска на всем экране
+    widget_condition = None  # Виджет для выбора условия выполнения действия
+    widget_action = None  # Виджет для выбора действия
+    widget_message = None  # Виджет для ввода сообщения
+    window = None  # Окно с дополнительными настройками
+    widget_frame = None  # Фрейм для виджетов дополнительных настроек
 
     def __init__(self, *args, description):
         """ Принимает параметры в списке и пользовательское описание команды
@@ -148,22 +202,11 @@ class MouseClickRight(CommandClasses):
         except:
             self.x = 0
             self.y = 0
-        self.widget_x = None
-        self.widget_y = None
-        self.label_x = None
-        self.label_y = None
 
         # Для изображения
         self.image = args[2]
-        self.element_image = None
-        self.icon_edit = None
-        self.icon_del = None
-        self.widget_button = None
-        self.widget_button_edit = None
-        self.widget_button_del = None
 
         # Дополнительные параметры
-        self.widget_button_more = None  # Виджет кнопки "еще"
         self.local_settings = bool(args[3])  # Использовать локальные настройки
         self.local_check = True if args[4] == '' else args[4]  # Включить локальную проверку
         self.local_check_size = 96 if not args[5] else args[5]  # Зона локальной проверки (сторона квадрата)
@@ -184,18 +227,6 @@ class MouseClickRight(CommandClasses):
             self.action = 'stop:'
         self.message = args[10]  # Сообщение в случае выполнения действия
 
-        # Виджеты для дополнительных настроек
-        self.widget_local_settings = None  # Виджет для использования локальных настроек
-        self.widget_local_check = None  # Виджет для включения локальной проверки
-        self.widget_local_check_size = None  # Виджет для ввода размера зоны локальной проверки
-        self.widget_repeat = None  # Виджет для ввода количества повторений
-        self.widget_full_screen = None  # Виджет для включения поиска на всем экране
-        self.widget_condition = None  # Виджет для выбора условия выполнения действия
-        self.widget_action = None  # Виджет для выбора действия
-        self.widget_message = None  # Виджет для ввода сообщения
-        self.window = None  # Окно с дополнительными настройками
-        self.widget_frame = None  # Фрейм для виджетов дополнительных настроек
-
     def __str__(self):
         """ Возвращает название команды, иногда с параметрами.
         Но если есть пользовательское описание - то его """
@@ -483,6 +514,7 @@ class MouseClickLeft(MouseClickRight):
                          'в этом месте. Если изображения не будет в этих координатах, будут произведены действия ' \
                          'в соответствии с настройками скрипта.'
     for_sort = 0
+    __slots__ = ()
 
 
 class MouseClickDouble(MouseClickLeft):
@@ -492,6 +524,7 @@ class MouseClickDouble(MouseClickLeft):
                          'в этом месте. Если изображения не будет в этих координатах, будут произведены действия ' \
                          'в соответствии с настройками скрипта.'
     for_sort = 10
+    __slots__ = ()
 
 
 class CheckImage(MouseClickLeft):
@@ -506,6 +539,7 @@ class CheckImage(MouseClickLeft):
                          'в этом месте. Если изображения не будет в этих координатах, будут произведены действия ' \
                          'в соответствии с настройками скрипта.'
     for_sort = 25
+    __slots__ = ()
 
 
 class KeyDown(CommandClasses):
@@ -513,29 +547,28 @@ class KeyDown(CommandClasses):
     command_name = 'Нажать клавишу'
     command_description = 'Нажатие клавиши на клавиатуре. Для отпускания клавиши есть отдельная команда.'
     for_sort = 30
+    __slots__ = ('value',)
+
+    # Клавиши, которые можно выбрать
+    values = ['backspace', 'tab', 'enter', 'esc', 'space', 'shift', 'shift_r', 'shift_l', 'control', 'cmd',
+              'ctrl', 'ctrl_r', 'ctrl_l', 'alt', 'alt_r', 'alt_gr', 'alt_l', 'pause', 'caps_lock',
+              'scroll_lock', 'print_screen', 'insert', 'delete', 'home', 'end', 'page_up', 'page_down',
+              'left', 'up', 'right', 'down', 'menu',
+              'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10', 'f11', 'f12',
+              '1', '2', '3', '4', '5', '6', '7', '8', '9', '0',
+              '`', '-', '=', ']', '[', '\\', ';', "'", ',', '.', '/',
+              'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's',
+              't', 'u', 'v', 'w', 'x', 'y', 'z',
+              'а', 'б', 'в', 'г', 'д', 'е', 'ё', 'ж', 'з', 'и', 'й', 'к', 'л', 'м', 'н', 'о', 'п', 'р', 'с',
+              'т', 'у', 'ф', 'х', 'ц', 'ч', 'ш', 'щ', 'ъ', 'ы', 'ь', 'э']
+
+    widget = None  # Виджет, создается при открытии команды в редакторе
 
     def __init__(self, *args, description):
         """ Принимает название клавиши и пользовательское описание команды"""
         super().__init__(description=description)
-        self.widget = None
-
-        self.values = ['backspace', 'tab', 'enter', 'esc', 'space', 'shift', 'shift_r', 'shift_l', 'control', 'cmd',
-                        'ctrl', 'ctrl_r', 'ctrl_l', 'alt', 'alt_r', 'alt_gr', 'alt_l', 'pause', 'caps_lock',
-                        'scroll_lock', 'print_screen', 'insert', 'delete', 'home', 'end', 'page_up', 'page_down',
-                        'left', 'up', 'right', 'down', 'menu',
-                        'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10', 'f11', 'f12',
-                        '1', '2', '3', '4', '5', '6', '7', '8', '9', '0',
-                        '`', '-', '=', ']', '[', '\\', ';', "'", ',', '.', '/',
-                        'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's',
-                        't', 'u', 'v', 'w', 'x', 'y', 'z',
-                        'а', 'б', 'в', 'г', 'д', 'е', 'ё', 'ж', 'з', 'и', 'й', 'к', 'л', 'м', 'н', 'о', 'п', 'р', 'с',
-                        'т', 'у', 'ф', 'х', 'ц', 'ч', 'ш', 'щ', 'ъ', 'ы', 'ь', 'э']
-        self.value = args[0]
-        if self.value in self.values:
-            self.value_var = StringVar(value=self.value)
-        else:
-            self.value = self.values[0]
-            self.value_var = StringVar(value=self.value)
+        self.value = args[0] if args[0] in self.values else self.values[0]
+
     def __str__(self):
         """ Возвращает название команды, иногда с параметрами.
         Но если есть пользовательское описание - то его """
@@ -545,11 +578,11 @@ class KeyDown(CommandClasses):
 
     def paint_widgets(self):
         """ Отрисовка виджета """
+        self.value_var = StringVar(value=self.value)
         self.widget = ttk.Combobox(self.root, values=self.values, textvariable=self.value_var, state="readonly")
         self.widget.place(x=10, y=71)
         long = len(max(self.values, key=len))  # Длина самого длинного элемента, для задания ширины виджета
         self.widget.configure(width=long)
-        self.value_var.set(self.value)
         self.paint_description()
 
     def save(self):
@@ -576,6 +609,7 @@ class KeyUp(KeyDown):
     command_name = 'Отпустить клавишу'
     command_description = 'Отпускание клавиши клавиатуры. Для нажатия клавиши есть отдельная команда.'
     for_sort = 40
+    __slots__ = ()
 
 
 class WriteDataFromField(CommandClasses):
@@ -585,11 +619,13 @@ class WriteDataFromField(CommandClasses):
                           'и вставлены на место курсора. Переход к следующей строке в столбце осуществляется командой ' \
                           'Следующий элемент поля.'
     for_sort = 60
+    __slots__ = ('value', 'values')
+
+    widget = None  # Виджет, создается при открытии команды в редакторе
 
     def __init__(self, *args, description):
         """ Принимает имя поля и пользовательское описание команды"""
         super().__init__(description=description)
-        self.widget = None
         try:
             self.values = self.data.get_fields()  # Получаем имена всех полей
         except DataError as err:
@@ -597,7 +633,6 @@ class WriteDataFromField(CommandClasses):
             self.values = ['Полей нет']
 
         self.value = args[0] if args[0] else self.values[0]  # Устанавливаем поле которое будет выбрано
-        self.value_var = StringVar()
 
     def __str__(self):
         """ Возвращает название команды, иногда с параметрами.
@@ -608,11 +643,11 @@ class WriteDataFromField(CommandClasses):
 
     def paint_widgets(self):
         """ Отрисовка виджета """
+        self.value_var = StringVar(value=self.value)
         self.widget = ttk.Combobox(self.root, values=self.values, textvariable=self.value_var, state="readonly")
         self.widget.place(x=10, y=71)
         long = len(max(self.values, key=len))  # Длина самого длинного элемента, для задания ширины виджета
         self.widget.configure(width=long)
-        self.value_var.set(self.value)
         self.paint_description()
 
     def save(self):
@@ -645,6 +680,7 @@ class CycleForField(WriteDataFromField):
     command_description = 'Начало блока команд, которые повторятся столько раз, сколько строк до конца ' \
                           'самого длинного поля. Окончание блока - команда Конец цикла.'
     for_sort = 80
+    __slots__ = ()
 
     def __init__(self, *args, description):
         """ Добавление в список 1 пункта - Все поля
@@ -658,7 +694,6 @@ class CycleForField(WriteDataFromField):
         if self.values[0] != 'Полей нет':
             self.values.insert(0, 'Все поля')
         self.value = args[0] if args[0] else self.values[0]  # Устанавливаем поле которое будет выбрано
-        self.value_var = StringVar()
 
     def run_command(self):
         """ Выполнение команды
@@ -683,6 +718,7 @@ class NextElementField(CycleForField):
     command_description = 'Поле таблицы (столбец) представлено в виде списка данных. Эта команда переводит ' \
                           'указатель чтения к следующему элементу списка'
     for_sort = 70
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды
@@ -713,6 +749,9 @@ class PauseCmd(CommandClasses):
     command_name = 'Пауза (секунд)'
     command_description = 'В любом месте скрипта можно сделать паузу, указав количество секунд.'
     for_sort = 170
+    __slots__ = ('value',)
+
+    widget = None  # Виджет, создается при открытии команды в редакторе
 
     def __init__(self, *args, description, value=None ):
         """ Принимает количество секунд, пользовательское описание команды и значение от классов-потомков """
@@ -721,7 +760,6 @@ class PauseCmd(CommandClasses):
         self.value = float(args[0] if args[0] else 0) if value is None else value
 
         super().__init__(description=description)
-        self.widget = None
 
     def __str__(self):
         """ Возвращает название команды, иногда с параметрами.
@@ -751,7 +789,22 @@ class PauseCmd(CommandClasses):
 
     def run_command(self):
         """ Выполнение команды """
-        sleep(self.value)
+        with profiler.phase('sleep'):
+            delays.wait(self.value)  # Остановка скрипта прерывает паузу
+
+
+class PauseRealCmd(PauseCmd):
+    """ Пауза n секунд без ускорения """
+    command_name = 'Пауза без ускорения'
+    command_description = 'Пауза, которая длится указанное количество секунд при любой скорости воспроизведения. ' \
+                          'Нужна там, где приложению требуется реальное время.'
+    for_sort = 175
+    __slots__ = ()
+
+    def run_command(self):
+        """ Выполнение команды """
+        with profiler.phase('sleep'):
+            delays.wait(self.value, scaled=False)  # Множитель скорости не применяется
 
 
 class WriteCmd(PauseCmd):
@@ -760,6 +813,7 @@ class WriteCmd(PauseCmd):
     command_description = 'Эта команда напечатает указанный текст в месте, где установлен курсор. ' \
                           'Длина текста не должна превышать 500 символов.'
     for_sort = 50
+    __slots__ = ()
 
     def __init__(self, *args, description):
         """ Принимает текст и пользовательское описание команды """
@@ -782,6 +836,7 @@ class RunCmd(PauseCmd):
     command_name = 'Выполнить'
     command_description = 'Выполняет блок или совершает переход к метке с указанным именем.'
     for_sort = 140
+    __slots__ = ()
 
     def __init__(self, *args, description):
         """ Принимает значение типа llist и пользовательское описание команды """
@@ -814,6 +869,7 @@ class ErrorNoElement(PauseCmd):
     command_description = 'Меняет текущую реакцию скрипта на возникновение ошибки: ' \
                           'остановить скрипт/игнорировать/выполнить блок или перейти к метке с указанным именем.'
     for_sort = 150
+    __slots__ = ()
 
     def __init__(self, *args, description):
         """ Принимает значение типа eres и пользовательское описание команды """
@@ -838,6 +894,7 @@ class ErrorNoData(ErrorNoElement):
     command_description = 'Меняет текущую реакцию скрипта на возникновение ошибки: ' \
                           'остановить скрипт/игнорировать/выполнить блок или перейти к метке с указанным именем.'
     for_sort = 160
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
@@ -851,6 +908,7 @@ class BlockCmd(WriteCmd):
                           'Он вызывается командой Выполнить или Ошибка. Завершается командой Конец блока. ' \
                           'После чего скрипт выполняется от команды вызвавшей блок.'
     for_sort = 110
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды
@@ -879,6 +937,7 @@ class LabelCmd(WriteCmd):
     command_name = 'Метка'
     command_description = 'Метка в скрипте, куда может быть совершен переход командами Выполнить или Ошибка.'
     for_sort = 130
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
@@ -891,6 +950,7 @@ class CycleCmd(PauseCmd):
     command_description = 'Начало блока команд, которые повторятся указанное количество раз. ' \
                           'Окончание блока - команда Конец цикла.'
     for_sort = 90
+    __slots__ = ()
 
     def __init__(self, *args, description):
         """ Принимает значение типа целое число и пользовательское описание команды """
@@ -920,6 +980,7 @@ class CycleEnd(CommandClasses):
     command_description = 'Конец блока команд повторяющихся столько раз, сколько указано в начале блока, ' \
                           'начатого командой Цикл.'
     for_sort = 100
+    __slots__ = ()
 
     def __init__(self, *args, description):
         """ Принимает пользовательское описание команды"""
@@ -992,6 +1053,7 @@ class BlockEnd(CycleEnd):
     command_description = 'Завершение списка команд относящихся к последнему (перед этой командой) объявленному блоку. ' \
                           'Начало блока - команда Блок.'
     for_sort = 120
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды
@@ -1012,9 +1074,12 @@ class StopCmd(CycleEnd):
     command_name = 'Конец скрипта'
     command_description = 'Остановить выполнение скрипта.'
     for_sort = 180
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
+        checkpoint.clear()  # Скрипт завершен командой, точка восстановления больше не нужна
+        self.data.finished = True  # Для отчета о выполнении это завершение скрипта, как и конец списка команд
         raise NoCommandOrStop(f'Выполнена команда Стоп.')
 
 
@@ -1024,6 +1089,7 @@ class DialogCmd(WriteCmd):
     command_description = 'Остановить выполнение скрипта. Сообщить пользователю по какой причине остановлен скрипт.' \
                           ' Длина сообщения не должна превышать 500 символов.'
     for_sort = 145
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
@@ -1032,15 +1098,133 @@ class DialogCmd(WriteCmd):
             raise NoCommandOrStop('Пользователь остановил выполнение скрипта.')
 
 
+class IncludeCmd(CommandClasses):
+    """ Подпрограмма: блок команд из другого проекта рабочей папки (см. library) """
+    command_name = 'Подпрограмма из проекта'
+    command_description = 'Выполняет блок команд из другого проекта рабочей папки (библиотеки). ' \
+                          'Исправления блока в библиотеке действуют во всех проектах, которые его вызывают.'
+    for_sort = 142
+    __slots__ = ('project', 'block')
+
+    running = []  # Выполняемые сейчас подпрограммы (проект, блок), защита от вызова подпрограммой самой себя
+
+    def __init__(self, *args, description):
+        """ Принимает имя проекта рабочей папки, имя блока в нем и пользовательское описание команды """
+        super().__init__(description=description)
+        self.project = str(args[0])
+        self.block = str(args[1])
+
+    def __str__(self):
+        """ Возвращает название команды, иногда с параметрами.
+        Но если есть пользовательское описание - то его """
+        if self.description:
+            return self.description
+        return f"{self.command_name} {self.project}: {self.block}"
+
+    def paint_widgets(self):
+        """ Отрисовка виджетов: выбор проекта и блока в нем """
+        self.project_var = StringVar(value=self.project)
+        self.block_var = StringVar(value=self.block)
+        self.widget_project = ttk.Combobox(self.root, values=libraries.projects(), textvariable=self.project_var,
+                                           state="readonly", width=30)
+        self.widget_project.place(x=10, y=71)
+        self.widget_block = ttk.Combobox(self.root, values=libraries.blocks(self.project), textvariable=self.block_var,
+                                         state="readonly", width=30)
+        self.widget_block.place(x=10, y=101)
+        self.widget_project.bind('<<ComboboxSelected>>', self.project_selected)
+        self.paint_description()
+
+    def project_selected(self, event=None):
+        """ Выбран проект, список блоков заполняется блоками этого проекта """
+        blocks = libraries.blocks(self.project_var.get())
+        self.widget_block.configure(values=blocks)
+        self.block_var.set(blocks[0] if blocks else '')
+
+    def save(self):
+        """ Записывает содержимое виджетов в объект """
+        self.project = self.project_var.get()
+        self.block = self.block_var.get()
+        self.description = self.widget_description.result
+
+    def command_to_dict(self):
+        """ Возвращает словарь с содержимым команды """
+        return {'cmd': self.__class__.__name__, 'val': [self.project, self.block], 'des': self.description}
+
+    def destroy_widgets(self):
+        """ Удаление виджетов созданных командой в редакторе. И виджета описания, созданного родителем """
+        self.widget_project.destroy()
+        self.widget_block.destroy()
+        self.widget_description.destroy_widgets()
+
+    def run_command(self):
+        """ Выполнение команды, синхронная обертка над run_command_async """
+        executor.run(self.run_command_async())
+
+    async def run_command_async(self):
+        """ Выполнение блока библиотеки
+
+        Команды блока выполняются по очереди в задаче этой команды. На время блока указатель скрипта
+        показывает позицию в блоке (по нему работают циклы блока), затем восстанавливается.
+        Для сторожевого потока каждая команда блока - отдельная команда строки подпрограммы.
+        На ошибку команды блока реакция применяется сразу: при продолжении выполняется следующая
+        команда блока, остановка останавливает скрипт. Если реакция или диалог перевели скрипт
+        на метку основного скрипта, блок прерывается и скрипт продолжается с метки.
+        """
+        name = (self.project, self.block)
+        if name in self.running:
+            raise NoCommandOrStop(f'Подпрограмма "{self.project}: {self.block}" вызывает сама себя.')
+        try:
+            program = libraries.get(self.project, self.block, self.data)
+        except LoadError as err:
+            raise NoCommandOrStop(f'Подпрограмма "{self.project}: {self.block}" не загружена.\n{err}')
+
+        data = self.data
+        pointer, depth = data.pointer_command, len(data.stack)  # Место вызова и глубина стека циклов и блоков
+        jump = None  # Позиция основного скрипта, на которую перешла команда блока
+        self.running.append(name)
+        try:
+            data.pointer_command = 0
+            while data.pointer_command < len(program.commands) and data.script_started:
+                command = program.commands[data.pointer_command]
+                position = data.pointer_command
+                try:
+                    await data.run_watched(pointer + 1, command)
+                except (DataError, ElementNotFound, TemplateNotFoundError, CommandTimeout) as err:
+                    try:
+                        data.react_to_error(err)
+                    except DataError as err:
+                        # Реакция - переход к метке. Основной скрипт выполнит метку следующей командой,
+                        # как после ошибки вне блока (после подпрограммы указатель увеличивается)
+                        logger.error(err)
+                        jump = data.pointer_command - 1
+                        break
+                if data.pointer_command != position and command.__class__.__name__ != 'CycleEnd':
+                    jump = data.pointer_command
+                    break
+                data.pointer_command += 1
+                with profiler.phase('sleep'):
+                    await delays.wait_async(data.work_settings['s_command_pause'])  # Пауза между командами
+        finally:
+            self.running.remove(name)
+            # Переход к блоку основного скрипта возвращается к строке подпрограммы
+            call = jump is not None and len(data.stack) > depth and len(data.stack[-1]) == 1
+            while len(data.stack) > depth:
+                data.stack.pop()  # Циклы блока, прерванные ошибкой
+            if call:
+                data.stack.append([pointer])
+            data.pointer_command = pointer if jump is None else jump
+
+
 class CopyCmd(CycleEnd):
     """ Копировать """
     command_name = 'Копировать Ctrl+C'
     command_description = 'Копирует в буфер обмена (аналог Ctrl+C).'
     for_sort = 190
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('ctrl', 'c')
+        press_hotkey('ctrl', 'c')
 
 
 class CutCmd(CycleEnd):
@@ -1048,20 +1232,22 @@ class CutCmd(CycleEnd):
     command_name = 'Вырезать Ctrl+X'
     command_description = 'Вырезает в буфер обмена (аналог Ctrl+X).'
     for_sort = 200
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('ctrl', 'x')
+        press_hotkey('ctrl', 'x')
 
 class PasteCmd(CycleEnd):
     """ Вставить """
     command_name = 'Вставить Ctrl+V'
     command_description = 'Вставляет из буфера обмена (аналог Ctrl+V).'
     for_sort = 210
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('ctrl', 'v')
+        press_hotkey('ctrl', 'v')
 
 
 class SelectCmd(CycleEnd):
@@ -1069,10 +1255,11 @@ class SelectCmd(CycleEnd):
     command_name = 'Выделить все Ctrl+A'
     command_description = 'Выделяет все (аналог Ctrl+A).'
     for_sort = 220
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('ctrl', 'a')
+        press_hotkey('ctrl', 'a')
 
 
 class LanguageChangeCmd(CycleEnd):
@@ -1080,10 +1267,11 @@ class LanguageChangeCmd(CycleEnd):
     command_name = 'Сменить язык Alt+Shift'
     command_description = 'Сменить язык раскладки клавиатуры (аналог Alt+Shift).'
     for_sort = 230
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('alt', 'shift')
+        press_hotkey('alt', 'shift')
 
 
 class NewTabCmd(CycleEnd):
@@ -1091,10 +1279,11 @@ class NewTabCmd(CycleEnd):
     command_name = 'Новая вкладка Ctrl+T'
     command_description = 'Открывает новую вкладку (аналог Ctrl+T).'
     for_sort = 240
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('ctrl', 't')
+        press_hotkey('ctrl', 't')
 
 
 class NextTabCmd(CycleEnd):
@@ -1102,10 +1291,11 @@ class NextTabCmd(CycleEnd):
     command_name = 'Следующая вкладка Ctrl+Tab'
     command_description = 'Переходит на следующую вкладку (аналог Ctrl+Tab).'
     for_sort = 250
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('ctrl', 'tab')
+        press_hotkey('ctrl', 'tab')
 
 
 class NextWindowCmd(CycleEnd):
@@ -1113,10 +1303,11 @@ class NextWindowCmd(CycleEnd):
     command_name = 'Следующее окно Alt+Tab'
     command_description = 'Переходит на следующее окно (аналог Alt+Tab).'
     for_sort = 260
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
-        pyautogui.hotkey('alt', 'tab')
+        press_hotkey('alt', 'tab')
 
 
 class RollUpWindowsCmd(CycleEnd):
@@ -1124,10 +1315,11 @@ class RollUpWindowsCmd(CycleEnd):
     command_name = 'Свернуть все окна Win+D'
     command_description = 'Свернуть все окна (аналог Cmd+D для Windows и Ctrl+Alt+D для Linux).'
     for_sort = 270
+    __slots__ = ()
 
     def run_command(self):
         """ Выполнение команды """
         if system.os == 'Windows':
-            pyautogui.hotkey('win', 'd')
+            press_hotkey('win', 'd')
         elif system.os == 'Linux':
-            pyautogui.hotkey('ctrl', 'alt', 'd')
+            press_hotkey('ctrl', 'alt', 'd')
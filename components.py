@@ -14,13 +14,16 @@ from datetime import datetime
 from tktooltip import ToolTip
 from collections import deque
 from time import sleep
-import pandas as pd
 import string
 from random import choice, randint
 import json
 import logging
 import shutil
 import re
+import threading
+import asyncio
+import functools
+import uuid
 try:
     import winsound  # В Linux этот модуль не ставится
 except:
@@ -29,8 +32,20 @@ except:
 from commands import CommandClasses
 from data_input import DataInput
 from exceptions import NoCommandOrStop, \
-    LabelAlreadyExists, DataError, ElementNotFound, LoadError, TemplateNotFoundError
+    LabelAlreadyExists, DataError, ElementNotFound, LoadError, TemplateNotFoundError, CommandTimeout
 from data_types import llist
+from sequence import IndexedSequence
+from history import History
+from virtual_list import VirtualList
+from search import CommandIndex
+import project_file
+from journal import Journal
+from optimizer import optimize_script
+from profiler import profiler
+from checkpoint import checkpoint
+from delays import delays
+from executor import executor
+from watchdog import watchdog
 from settings import settings
 from define_platform import system
 
@@ -44,11 +59,20 @@ class CountingDict(dict):
 
     Применяется для контроля списка меток и блоков в скрипте.
     Для ужаления изображений элементов (кнопок, ярлыков) при удалении команд клика мыши.
-    Переопределенные методы обновляют список названий меток и блоков хранящийся в
-    специальном типе данных llist каждый раз, когда происходит манипуляция с
-    меткой или блоком.
+    Переопределенные методы добавляют и удаляют названия меток и блоков в реестре, хранящемся в
+    специальном типе данных llist, каждый раз, когда происходит манипуляция с
+    меткой или блоком. Каждое изменение - O(1), весь скрипт не перебирается.
 
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.label_names = dict()  # Под каким именем записана в реестр метка или блок: ключ -> имя
+
+    @staticmethod
+    def is_label(obj) -> bool:
+        """ Команда - метка или блок """
+        return obj.__class__.__name__ == 'BlockCmd' or obj.__class__.__name__ == 'LabelCmd'
+
     def __setitem__(self, key, value):
         """ Переопределяем метод добавления и изменения элементов словаря
 
@@ -56,29 +80,50 @@ class CountingDict(dict):
         уже существует, возвращает ошибку.
 
         """
-        if value.__class__.__name__ == 'BlockCmd' or value.__class__.__name__ == 'LabelCmd':
-            if value.value in llist.labels:
-                raise LabelAlreadyExists('Такое имя метки или блока уже существует.')
-
-            super().__setitem__(key, value)  # Вызываем базовую реализацию метода
-            names = [obj.value for obj in data.obj_command.values()
-                 if obj.__class__.__name__ == 'BlockCmd' or obj.__class__.__name__ == 'LabelCmd']
-            llist.labels = names
-        else:
-            super().__setitem__(key, value)  # Вызываем базовую реализацию метода
+        if self.is_label(value) and value.value in llist.labels:
+            raise LabelAlreadyExists('Такое имя метки или блока уже существует.')
+
+        if key in self.label_names:
+            llist.labels.discard(self.label_names.pop(key))  # Заменяемая команда была меткой
+        super().__setitem__(key, value)  # Вызываем базовую реализацию метода
+        if self.is_label(value):
+            llist.labels.add(value.value)
+            self.label_names[key] = value.value
 
     def __delitem__(self, key):
         """ Переопределяем метод удаления элементов из словаря """
-        if data.obj_command[key].__class__.__name__ == 'BlockCmd' \
-                or data.obj_command[key].__class__.__name__ == 'LabelCmd':
-            # Удаление меток
-            super().__delitem__(key)  # Вызываем базовую реализацию метода
-            names = [obj.value for obj in data.obj_command.values()
-                 if obj.__class__.__name__ == 'BlockCmd' or obj.__class__.__name__ == 'LabelCmd']
-            llist.labels = names
+        super().__delitem__(key)  # Вызываем базовую реализацию метода
+        if key in self.label_names:
+            llist.labels.discard(self.label_names.pop(key))  # Удаление меток
+
+    def load(self, items):
+        """ Заполнение словаря целиком парами (ключ, команда)
+
+        Прежнее содержимое удаляется, реестр меток записывается один раз для всех команд.
+        """
+        self.clear()
+        dict.update(self, items)  # Без поштучной обработки __setitem__
+        self.label_names = {key: obj.value for key, obj in self.items() if self.is_label(obj)}
+        llist.set_list(self.label_names.values())
+
+    def clear(self):
+        """ Очистка словаря вместе с реестром меток """
+        super().clear()
+        self.label_names.clear()
+        llist.labels.clear()
 
-        else:
-            super().__delitem__(key)  # Вызываем базовую реализацию метода
+
+def script_edit(method):
+    """ Декоратор правки скрипта: изменение и сообщение наблюдателям выполняются под data.edit_lock
+
+    Запись действий правит скрипт из своего потока, снимок скрипта (см. Journal.compact) берется
+    под той же блокировкой и не попадает между правкой и ее записью наблюдателями.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.edit_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class DataForWorker:
@@ -98,7 +143,8 @@ class DataForWorker:
          в виджете для визуального представления. Очередь определяет последовательность исполнения.
 
          """
-        self.queue_command = []  # Очередь команд (ключи - id команды)
+        # Очередь команд (ключи - id команды), позиция id находится за O(log n), см. sequence
+        self.queue_command = IndexedSequence()
         self.obj_command = CountingDict()  # Объекты команд по ключам из очереди
         self.id_command = 0  # Счетчик для идентификаторов команд
         self.pointer_command = -1  # Указатель на исполняемую команду или положение курсора в списке
@@ -126,11 +172,22 @@ class DataForWorker:
 
         # Обеспечение работы модального окна диалога с пользователем
         self.modal_stop = False  # Если в модальном окне диалога с пользователем нажато Остановка
+        self.unattended = False  # Скрипт выполняется без пользователя (пакетное выполнение), диалоги не выводятся
+        self.finished = False  # Скрипт выполнен до конца списка команд (для отчета о выполнении)
         self.widget = None  # Виджет пользовательского типа llist (метка для перехода)
 
         # Флаг обозначающий режим ожидания скоиншота под курсором (все функции программы остановлены)
         self.wait_screenshot = False
 
+        # Наблюдатели изменений скрипта: функции, принимающие операцию (см. History)
+        self.listeners = []
+        self.edit_lock = threading.RLock()  # Правка скрипта вместе с сообщением наблюдателям (script_edit)
+
+    def notify(self, op):
+        """ Сообщение наблюдателям об операции над скриптом """
+        for listener in self.listeners:
+            listener(op)
+
     @property
     def script_started(self):
         """ Флаг запуска скрипта """
@@ -138,9 +195,13 @@ class DataForWorker:
 
     @script_started.setter
     def script_started(self, value):
-        """ Флаг запуска скрипта дублируем """
+        """ Флаг запуска скрипта дублируем, остановка прерывает текущую паузу """
         self._script_started = value
         settings.script_started = value
+        if value:
+            delays.start()
+        else:
+            delays.stop()
 
     def next_id(self):
         """ Генерирует id новой команды """
@@ -168,24 +229,47 @@ class DataForWorker:
         Возвращает id команды
         """
         key = self.next_id()  # Получаем новый id
-        try:
-            self.obj_command[key] = cmd  # Добавляем объект в dict
-            self.pointer_command += 1  # Строка добавляется в позицию за указателем и на нее ставим указатель
-            self.queue_command.insert(self.pointer_command, key)  # Добавляем id в очередь
-            return key  # Возвращаем id команды
-        except LabelAlreadyExists as err:
-            # При неудачном добавлении в случае совпадения имен блоков и меток
-            # добавление отменяется
-            raise
+        # При совпадении имен блоков и меток будет исключение LabelAlreadyExists, добавление отменяется
+        self.insert_command(self.pointer_command + 1, key, cmd)
+        self.pointer_command += 1  # Строка добавляется в позицию за указателем и на нее ставим указатель
+        return key  # Возвращаем id команды
+
+    @script_edit
+    def insert_command(self, position, key, cmd):
+        """ Вставка команды с заданным id в позицию очереди """
+        self.obj_command[key] = cmd  # Добавляем объект в dict
+        self.queue_command.insert(position, key)  # Добавляем id в очередь
+        self.notify(('insert', position, key, cmd))
+
+    @script_edit
+    def load_commands(self, commands, keys=None):
+        """ Замена всего скрипта
+
+        Принимает список объектов команд в порядке выполнения и, при восстановлении из истории, их id.
+        Очередь и словарь команд строятся за один проход, без вставок по одной команде.
+        Указатель ставится в начало.
+        """
+        old = [(key, self.obj_command[key]) for key in self.queue_command] if self.listeners else []
+        if keys is None:
+            keys = [self.next_id() for _ in commands]
+        self.obj_command.load(zip(keys, commands))
+        self.queue_command.clear()
+        self.queue_command.extend(keys)
+        self.pointer_command = -1
+        self.notify(('load', old, list(zip(keys, commands))))
 
+    @script_edit
     def del_command(self, id_cmd: str):
         """ Удаление команды
 
          Принимает id команды
 
          """
-        self.queue_command.remove(id_cmd)  # Удаляем id из очереди
+        position = self.queue_command.index(id_cmd)
+        self.queue_command.pop(position)  # Удаляем id из очереди
+        cmd = self.obj_command[id_cmd]
         del(self.obj_command[id_cmd])  # Удаляем объект команды из словаря
+        self.notify(('delete', position, id_cmd, cmd))
         if len(self.queue_command) == self.pointer_command:
             # При удалении последней строки указатель установить на последнюю
             self.pointer_command -= 1
@@ -193,11 +277,58 @@ class DataForWorker:
     def change_command(self, cmd):
         """ Изменение команды """
         if self.pointer_command >= 0:
-            # Объект удаляется, но пока он на месте, его имя,  если это метка или блок
-            # может совпасть с заменяющим, тогда будет совпадение имен, поэтому меняем имя
-            temp = self.queue_command[self.pointer_command]
-            del self.obj_command[temp]
-            self.obj_command[temp] = cmd  # Меняем объект команды под курсором
+            self.replace_command(self.queue_command[self.pointer_command], cmd)  # Меняем объект команды под курсором
+
+    @script_edit
+    def replace_command(self, key, cmd):
+        """ Замена объекта команды с заданным id """
+        # Объект удаляется, но пока он на месте, его имя,  если это метка или блок
+        # может совпасть с заменяющим, тогда будет совпадение имен, поэтому меняем имя
+        old = self.obj_command[key]
+        del self.obj_command[key]
+        try:
+            self.obj_command[key] = cmd
+        except LabelAlreadyExists:
+            self.obj_command[key] = old  # Имя занято другой меткой, оставляем прежнюю команду
+            raise
+        self.notify(('replace', key, old, cmd))
+
+    @script_edit
+    def move_commands(self, keys, position):
+        """ Перенос строк
+
+        Строки с id из списка keys убираются со своих мест и вставляются подряд, в порядке списка,
+        начиная с позиции position в очереди без них.
+        """
+        old_positions = [self.queue_command.index(key) for key in keys]
+        position = min(position, len(self.queue_command) - len(keys))
+        if self.is_block(old_positions):
+            # Строки идут подряд - переносим их одним блоком
+            self.queue_command.move(old_positions[0], old_positions[0] + len(keys), position)
+        else:
+            for key in keys:
+                self.queue_command.remove(key)
+            for i, key in enumerate(keys):
+                self.queue_command.insert(position + i, key)
+        self.notify(('move', keys, old_positions, position))
+
+    @script_edit
+    def unmove_commands(self, keys, old_positions):
+        """ Отмена переноса строк: возврат на прежние позиции """
+        position = self.queue_command.index(keys[0])  # Где строки стоят после переноса
+        if self.is_block(old_positions):
+            self.queue_command.move(position, position + len(keys), old_positions[0])
+        else:
+            for key in keys:
+                self.queue_command.remove(key)
+            for old, key in sorted(zip(old_positions, keys)):
+                self.queue_command.insert(old, key)
+        self.notify(('unmove', keys, old_positions, position))
+
+    @staticmethod
+    def is_block(positions) -> bool:
+        """ Позиции идут подряд по возрастанию """
+        return all(b - a == 1 for a, b in zip(positions, positions[1:]))
 
     def stop_for_dialog(self, mess):
         """ Остановка скрипта для диалога. Получение указаний от пользователя
@@ -207,13 +338,18 @@ class DataForWorker:
         - Остановить скрипт
         - Перейти к указанной метке или блоку
         - Перезапустить скрипт
-        """
-        # Выводим модальное окно размером 300х200 с заголовком и текстовым сообщением о причине остановки выполнения
-        # скрипта.
-        # Ниже выпадающий список с метками и блоками и кнопкой Перейти.
-        # Еще ниже кнопки Перезапустить, Остановить, Продолжить.
-        # При закрытии окна (можно по Esc), скрипт продолжает выполняться.
 
+        Окно создается в главном потоке программы (Tk не допускает работу с окнами из других потоков),
+        поток выполнения скрипта ждет его закрытия, не расходуя процессорное время.
+        Если метод вызван из главного потока, окно просто ожидается через wait_window.
+        Если задано предельное время команды, а ответа за это время нет (рядом никого),
+        окно закрывается и применяется реакция на зависание (см. dialog_timeout).
+        Без пользователя (unattended) окно не выводится, скрипт останавливается сразу.
+        """
+        if self.unattended:
+            logger.error(f'Диалог без пользователя, скрипт остановлен. {mess}')
+            self.modal_stop = True
+            return
         # Звуковой сигнал при появлении окна.
         if system.os == 'Windows':
             winsound.MessageBeep()
@@ -221,7 +357,45 @@ class DataForWorker:
             os.system('play -nq -t alsa synth {} sine {}'.format(0.5, 440))
 
         self.modal_stop = False  # Сообщаем главной программе, продолжать выполнение скрипта
+        closed = threading.Event()  # Устанавливается при закрытии окна
 
+        if threading.current_thread() is threading.main_thread():
+            self.show_dialog(mess, closed)
+            self.top.wait_window()
+        else:
+            self.root.after(0, self.show_dialog, mess, closed)  # Передаем создание окна в главный поток
+            timeout = self.work_settings['s_command_timeout']
+            watchdog.suspend()  # Время диалога не входит во время команды
+            answered = closed.wait(timeout if timeout > 0 else None)
+            watchdog.resume()
+            if not answered:
+                self.dialog_timeout(mess, closed)
+
+    def dialog_timeout(self, mess, closed):
+        """ На диалог нет ответа дольше предельного времени команды
+
+        Записывается отчет о зависании, окно закрывается, применяется реакция s_error_timeout:
+        ignore - продолжить, run - перейти к метке, stop и dialog - остановить скрипт.
+        """
+        watchdog.report(f'Нет ответа на диалог:\n{mess}')
+        self.root.after(0, lambda: self.top.winfo_exists() and self.top.destroy())
+        closed.wait()
+        reaction = self.work_settings['s_error_timeout']
+        if reaction.react == 'run':
+            CommandClasses.create_command(reaction.label, command='RunCmd').run_command()
+        elif reaction.react != 'ignore':
+            self.modal_stop = True
+
+    def show_dialog(self, mess, closed):
+        """ Создание модального окна диалога, выполняется в главном потоке
+
+        При закрытии окна устанавливается событие closed, которое ждет поток выполнения скрипта.
+        """
+        # Выводим модальное окно размером 300х200 с заголовком и текстовым сообщением о причине остановки выполнения
+        # скрипта.
+        # Ниже выпадающий список с метками и блоками и кнопкой Перейти.
+        # Еще ниже кнопки Перезапустить, Остановить, Продолжить.
+        # При закрытии окна (можно по Esc), скрипт продолжает выполняться.
         self.top = Toplevel(self.root)  # Новое окно
         self.top.title("Остановка скрипта для диалога")  # Заголовок
 
@@ -245,15 +419,11 @@ class DataForWorker:
 
         self.top.focus_set()  # Установка фокуса
         self.top.bind('<Escape>', lambda event: self.top.destroy())  # Закрытие по Esc
+        # Событие Destroy приходит и от вложенных виджетов, реагируем только на само окно
+        top = self.top
+        top.bind('<Destroy>', lambda event: closed.set() if event.widget is top else None)
 
         self.top.grab_set()
-        # self.top.focus_set()
-        # self.top.wait_window()
-        while not self.top.winfo_ismapped():
-            self.top.update()
-        while self.top.winfo_exists():
-            self.top.update()
-            sleep(0.1)
 
     def restart(self):
         """ Перезапуск скрипта сначала """
@@ -274,52 +444,90 @@ class DataForWorker:
             cmd.run_command()
             self.top.destroy()
 
-    def run_command(self):
-        """ Выполнение очередной команды и переход на следующую"""
+    async def run_watched(self, line, command):
+        """ Выполнение команды отдельной задачей, чтобы сторожевой поток мог снять ее при зависании
+
+        Принимает номер строки скрипта и объект команды. Снятая команда - CommandTimeout,
+        превышено время скрипта - NoCommandOrStop.
+        """
+        task = asyncio.ensure_future(command.run_command_async())
+        watchdog.watch(line, command, task, asyncio.get_running_loop())
         try:
-            self.obj_command[self.queue_command[self.pointer_command]].run_command()
-        except IndexError:
+            await task
+        except asyncio.CancelledError:
+            if task.cancelled() and watchdog.breach:
+                kind, message = watchdog.breach
+                raise (NoCommandOrStop if kind == 'script' else CommandTimeout)(message)
+            raise
+        finally:
+            watchdog.release()
+
+    def react_to_error(self, err):
+        """ Реакция на ошибку команды в зависимости от текущих настроек реакции
+
+        Принимает ошибку данных, изображения или зависания команды. Продолжение выполнения
+        (в том числе выбранное в диалоге) - возврат, остановка - NoCommandOrStop,
+        переход к метке - указатель на метке и DataError с сообщением о переходе.
+        """
+        if isinstance(err, DataError):
+            key, reason = 's_error_no_data', 'Реакция на ошибку данных'
+        elif isinstance(err, CommandTimeout):
+            key, reason = 's_error_timeout', 'Реакция на зависание команды'  # Отчет о зависании уже записан
+        else:
+            key, reason = 's_error_no_element', 'Реакция на ошибку изображения'
+        reaction = self.work_settings[key]
+        if reaction.react == 'stop':
+            raise NoCommandOrStop(f'Остановка выполнения скрипта\n{reason}\n"{err}"')
+        elif reaction.react == 'ignore':
+            logger.error(f'Ошибка:\n"{err}"\nРеакция - продолжение выполнения скрипта.')
+        elif reaction.react == 'dialog':
+            # Остановка выполнения скрипта и вывод модального окна
+            self.stop_for_dialog(f'Остановка выполнения скрипта\n{reason}\n"{err}"')
+            if self.modal_stop:
+                raise NoCommandOrStop('Пользователь остановил выполнение скрипта.')
+        else:
+            # Продолжение выполнения скрипта, но с другого места
+            label = reaction.label
+            self.pointer_command = self.work_labels[label.label]
+            raise DataError(f'Ошибка\n"{err}"\nРеакция - переход к метке "{label}".')
+
+    def run_command(self):
+        """ Выполнение очередной команды и переход на следующую
+
+        Синхронная обертка над run_command_async, выполняет ее в постоянном цикле событий исполнителя.
+        """
+        executor.run(self.run_command_async())
+
+    async def run_command_async(self):
+        """ Выполнение очередной команды и переход на следующую
+
+        Пока команда выполняется, в фоне читаются шаблоны изображений следующих команд.
+        """
+        if self.pointer_command >= len(self.queue_command):
+            checkpoint.clear()  # Скрипт выполнен полностью
+            self.finished = True
             raise NoCommandOrStop('Нет команд для выполнения.')
-        except DataError as err:
-            # Обработка ошибок данных в зависимости от текущих настроек реакции
-            if data.work_settings['s_error_no_data'].react == 'stop':
-                raise NoCommandOrStop(f'Остановка выполнения скрипта\nРеакция на ошибку данных\n"{err}"')
-            elif data.work_settings['s_error_no_data'].react == 'ignore':
-                logger.error(f'Ошибка:\n"{err}"\nРеакция - продолжение выполнения скрипта.')
-            elif data.work_settings['s_error_no_data'].react == 'dialog':
-                # Остановка выполнения скрипта и вывод модального окна
-                self.stop_for_dialog(f'Остановка выполнения скрипта\nРеакция на ошибку данных\n"{err}"')
-                if self.modal_stop:
-                    raise NoCommandOrStop('Пользователь остановил выполнение скрипта.')
-            else:
-                # Продолжение выполнения скрипта, но с другого места
-                label = data.work_settings['s_error_no_data'].label
-                self.pointer_command = self.work_labels[label.label]
-                raise DataError(f'Ошибка данных:\n{err}\nРеакция - переход к метке "{label}".')
-
-        except (ElementNotFound, TemplateNotFoundError) as err:
-            # Ошибка связанная с элементами изображения
-            if data.work_settings['s_error_no_element'].react == 'stop':
-                raise NoCommandOrStop(f'Остановка выполнения скрипта\nРеакция на ошибку \n"{err}"')
-            elif data.work_settings['s_error_no_element'].react == 'ignore':
-                logger.error(f'Ошибка:\n"{err}"\nРеакция - продолжение выполнения скрипта.')
-            elif data.work_settings['s_error_no_element'].react == 'dialog':
-                # Остановка выполнения скрипта и вывод модального окна
-                self.stop_for_dialog(f'Остановка выполнения скрипта\nРеакция на ошибку изображения.\n"{err}"')
-                if self.modal_stop:
-                    raise NoCommandOrStop('Пользователь остановил выполнение скрипта.')
-            else:
-                # Продолжение выполнения скрипта, но с другого места
-                label = data.work_settings['s_error_no_element'].label
-                self.pointer_command = self.work_labels[label.label]
-                raise DataError(f'Ошибка\n"{err}"\nРеакция - переход к метке "{label}".')
+        command = self.obj_command[self.queue_command[self.pointer_command]]
+        try:
+            executor.prefetch(self)
+            with profiler.command(self.pointer_command + 1, command):
+                await self.run_watched(self.pointer_command + 1, command)
+        except (DataError, ElementNotFound, TemplateNotFoundError, CommandTimeout) as err:
+            self.react_to_error(err)
+        if not self.script_started:
+            return  # Скрипт остановлен во время команды, она могла не выполниться, это не завершение скрипта
 
         if self.pointer_command+1 < len(self.queue_command):
             # Еще есть команды в очереди
             self.pointer_command += 1
+            if command.__class__.__name__ == 'CycleEnd':
+                checkpoint.save(self)  # Граница цикла, сохраняем точку восстановления
             # Между выполнением команд есть регулируемая пауза
-            sleep(self.work_settings['s_command_pause'])  # Пауза между командами (всеми)
+            with profiler.phase('sleep'):
+                await delays.wait_async(self.work_settings['s_command_pause'])  # Пауза между командами (всеми)
         else:
+            checkpoint.clear()  # Скрипт выполнен полностью
+            self.finished = True
             raise NoCommandOrStop('Нет команд для выполнения.')
 
 
@@ -426,7 +634,7 @@ class Editor:
 
         self.current_cmd.save()
         try:
-            self.data.add_new_command(self.current_cmd)  # Добавление команды в очередь
+            self.data.add_new_command(self.copy_current_cmd())  # Добавление команды в очередь
             self.display_commands.out_commands()  # Обновляем список
             self.save_load.save_history()  # Сохраняем историю
             settings.is_saved = False  # Изменения в проекте не сохранены
@@ -442,11 +650,24 @@ class Editor:
             return  # Операция невозможна при выполнении или записи скрипта
 
         self.current_cmd.save()
-        self.data.change_command(self.current_cmd)  # Изменяем команду
+        try:
+            self.data.change_command(self.copy_current_cmd())  # Изменяем команду
+        except LabelAlreadyExists as err:
+            logger.error(err)  # Имя метки или блока занято, команда не изменена
+            return
         self.display_commands.out_commands()  # Обновляем список
         self.save_load.save_history()  # Сохраняем историю
         settings.is_saved = False  # Изменения в проекте не сохранены
 
+    def copy_current_cmd(self):
+        """ Копия команды редактора для записи в скрипт
+
+        Редактор продолжает работать со своим объектом, а объекты в скрипте не меняются на месте,
+        на них ссылается история изменений.
+        """
+        temp = self.current_cmd.command_to_dict()
+        return CommandClasses.create_command(*temp['val'], command=temp['cmd'], description=temp['des'])
+
     def menu_delete_images(self):
         """ Удаление неиспользуемых изображений элементов.
 
@@ -502,15 +723,21 @@ class DisplayCommands:
         style.theme_use('clam')
 
         self.root = root
-        self.tree = ttk.Treeview(root, show="", columns=('number', 'command'), selectmode="extended", height=28)
-        self.tree.column("#1", stretch=NO, width=80)
-        self.tree.column("#2", stretch=NO, width=300)
-        self.tree.place(x=0, y=0)
+        # В виджете списка существуют только видимые строки, выделение хранится в самом списке
+        self.view = VirtualList(root, data.queue_command, lambda key: self.data.obj_command[key],
+                                height=28, widths=(80, 300), on_select=self.on_select)
+        # Индексы поиска обновляются раньше списка, чтобы он повторял поиск по новым данным
+        self.index = CommandIndex(data)
+        data.listeners.append(self.index.update)
+        data.listeners.append(self.changed)  # Список обновляется по изменениям скрипта
+        self.search_query = ''  # Запрос поиска, найденные строки подсвечены в списке ('' - поиска нет)
+        self.found = []  # id найденных команд в порядке скрипта
+        self.search_pending = False  # Повтор поиска после изменения скрипта запланирован
+        self.search_window = None  # Окно поиска
+        self.search_status = None  # Переменная надписи с результатом поиска
         self.out_commands()
-        # Выделить третью строку в списке
-        self.tree.bind("<Delete>", self.delete)  # Обработка нажатия del на списке
-        self.tree.bind("<<TreeviewSelect>>", self.on_select)  # Обработка выбора строки в списке
-        self.tree.bind("<Control-KeyPress>", self.keypress)  # Обработка нажатия клавиш на списке
+        self.view.tree.bind("<Delete>", self.delete)  # Обработка нажатия del на списке
+        self.view.tree.bind("<Control-KeyPress>", self.keypress)  # Обработка нажатия клавиш на списке
         # Рисуем кнопки для работы со списком
         self.list_copy = []  # Список хранит id скопированных строк
         self.operation = ''  # Может быть copy или cut
@@ -553,7 +780,7 @@ class DisplayCommands:
             # Ctrl+a
             if data.script_started or data.is_listening:
                 return  # Операция невозможна при выполнении или записи скрипта
-            self.tree.selection_set(self.tree.get_children())
+            self.view.select_all()
         elif code == system.hotkeys['Ctrl_C']:
             # Ctrl+c
             self.copy()
@@ -569,25 +796,143 @@ class DisplayCommands:
         elif code == system.hotkeys['Ctrl_Down']:
             # Ctrl+down
             self.down()
+        elif code == system.hotkeys['Ctrl_F']:
+            # Ctrl+f
+            self.menu_search()
 
-    def on_select(self, event):
+    def on_select(self):
         """ Обработка события выбора строки в списке """
         if data.script_started or data.is_listening:
             return  # Операция невозможна при выполнении или записи скрипта
 
-        try:
-            selected_item = event.widget.selection()[0]  # Получаем id команды
-        except:
-            # Иногда не показывает выделение
-            return
+        selected_item = self.view.first_selected()  # Получаем id команды
+        if selected_item is None:
+            return  # Выделение снято
         # Устанавливаем указатель списка
         self.data.pointer_command = -1 if selected_item == 'zero' else self.data.queue_command.index(selected_item)
         self.editor.command_to_editor(selected_item)  # Выводим команду в редактор по ее id
 
+    def changed(self, op):
+        """ Наблюдатель изменений скрипта: точечное обновление списка
+
+        Принимает операцию DataForWorker (см. history.History). Видимые строки перерисовываются
+        один раз после серии изменений.
+        """
+        kind = op[0]
+        if kind == 'insert':
+            self.view.inserted(op[1], op[2])
+        elif kind == 'delete':
+            self.view.deleted(op[1], op[2])
+        elif kind == 'replace':
+            self.view.changed(op[1])
+        elif kind == 'load':
+            self.view.reset()
+        else:
+            self.view.refresh()  # Перенос строк: выделение остается на тех же строках
+        if self.search_query and not self.search_pending:
+            # Найденные строки могли измениться, поиск повторяется один раз после серии изменений
+            self.search_pending = True
+            self.root.after_idle(self.search_refresh)
+
+    def menu_search(self):
+        """ Окно поиска команд (Ctrl+F)
+
+        Запрос выполняется по мере ввода, найденные строки подсвечиваются в списке.
+        Кнопки переходят к следующей и предыдущей найденной строке или выделяют все найденные.
+        При закрытии окна подсветка снимается.
+        """
+        if self.search_window:
+            self.search_window.lift()
+            self.search_window.focus_set()
+            return
+
+        def on_closing():
+            self.search_window.destroy()
+            self.search_window = self.search_status = None
+            self.search('')
+
+        window = self.search_window = Toplevel(self.root)
+        window.title('Поиск команд')
+        window.geometry('470x170')
+        window.transient(self.root)
+        window.resizable(False, False)
+
+        query = StringVar(value=self.search_query)
+        self.search_status = StringVar()
+        entry = Entry(window, textvariable=query)
+        entry.place(x=10, y=10, width=450)
+        Label(window, justify=LEFT, foreground='#083863',
+              text='Условия: cmd:MouseClickLeft  image:elem_1.png  field:Телефон  label:Вход\n'
+                   'x:100-200  y:300  и слова из текста строки. Шаблоны: cmd:MouseClick*').place(x=10, y=40)
+        Label(window, textvariable=self.search_status).place(x=10, y=85)
+        Button(window, text='Предыдущий', width=12, command=lambda: self.search_step(-1)).place(x=10, y=125)
+        Button(window, text='Следующий', width=12, command=lambda: self.search_step(1)).place(x=125, y=125)
+        Button(window, text='Выделить все', width=12, command=self.select_found).place(x=240, y=125)
+        Button(window, text='Закрыть', width=12, command=on_closing).place(x=355, y=125)
+
+        query.trace_add('write', lambda *args: self.search(query.get()))
+        entry.bind('<Return>', lambda event: self.search_step(1))
+        entry.bind('<Shift-Return>', lambda event: self.search_step(-1))
+        window.bind('<Escape>', lambda event: on_closing())
+        window.protocol("WM_DELETE_WINDOW", on_closing)
+        self.search(query.get())
+        entry.focus_set()
+
+    def search(self, query: str):
+        """ Поиск команд по запросу (см. search), найденные строки подсвечиваются в списке """
+        self.search_query = query.strip()
+        try:
+            self.found = self.index.find(self.search_query)
+            status = f'Найдено: {len(self.found)}' if self.search_query else ''
+        except ValueError as err:
+            self.found = []
+            status = str(err)
+        self.view.mark(self.found)
+        if self.search_status:
+            self.search_status.set(status)
+
+    def search_refresh(self):
+        """ Повтор поиска после изменения скрипта """
+        self.search_pending = False
+        if self.search_query:
+            self.search(self.search_query)
+
+    def search_step(self, step: int):
+        """ Переход к следующей (step=1) или предыдущей (step=-1) найденной строке после текущей """
+        if data.script_started or data.is_listening or not self.found:
+            return  # Операция невозможна при выполнении или записи скрипта
+        row = self.view.index(self.view.cursor) if self.view.cursor is not None else 0
+        # Двоичный поиск первой найденной строки ниже текущей, найденные идут в порядке скрипта
+        low, high = 0, len(self.found)
+        while low < high:
+            middle = (low + high) // 2
+            if self.view.index(self.found[middle]) <= row:
+                low = middle + 1
+            else:
+                high = middle
+        if step > 0:
+            key = self.found[low % len(self.found)]
+        else:
+            # Найденная строка перед текущей (текущая может и сама быть найденной)
+            previous = low - 1
+            if previous >= 0 and self.view.index(self.found[previous]) == row:
+                previous -= 1
+            key = self.found[previous % len(self.found)]
+        self.view.selection_set([key])
+        self.view.see(key)
+
+    def select_found(self):
+        """ Выделение всех найденных строк (например, чтобы скопировать или удалить их) """
+        if data.script_started or data.is_listening or not self.found:
+            return  # Операция невозможна при выполнении или записи скрипта
+        self.view.selection_set(self.found)
+        self.view.see(self.found[0])
+
     def out_commands(self):
         """ Вывод строк в виджет (Обновление списка)
 
-        Берет строки из объекта с данными и выводит их в виджет.
+        Изменения скрипта выводятся в список сами (changed), здесь список перерисовывается
+        и выделяется строка под указателем. В виджете выводятся только видимые строки.
         Названия команд запрашивает у их объектов, где при наличии описания возвращается оно, а не название.
 
         Поддерживает умное обновление, только при записи.
@@ -601,13 +946,7 @@ class DisplayCommands:
             if self.start_if_zero < 1:
                 # Отменит все предыдущие обновления, если есть запрос на новое
                 self.start_if_zero = 0
-                self.clear()
-                self.tree.insert('', 0, 'zero', values=('', ''))  # Добавляем пустую строку
-                for i, id in enumerate(data.queue_command):
-                    # Выводим список
-                    self.tree.insert('', 'end', id, values=(i+1, self.data.obj_command[id]))
-                self.tree.selection_set(self.tree.get_children()[data.pointer_command+1])  # Выделяем строку
-                pass
+                self.show_line(data.pointer_command + 1)  # Выделяем строку
         # Запускаем функцию обновления списка, с отсрочкой
         if data.is_listening:
             # Умное обновление работает только при записи
@@ -617,13 +956,32 @@ class DisplayCommands:
             self.start_if_zero = 0
             update_list()
 
-    def clear(self):
-        """ Очистка списка команд """
-        self.tree.delete(*self.tree.get_children())
+    def select_line(self, line: int):
+        """ Выделить строку списка по ее номеру """
+        if data.script_started or data.is_listening:
+            return  # Операция невозможна при выполнении или записи скрипта
+        if 0 < line < len(self.view):
+            self.show_line(line)
+
+    def show_line(self, line: int):
+        """ Выделить строку по номеру (0 - пустая строка) и прокрутить список к ней """
+        key = self.view.rows(line, line + 1)
+        if key:
+            self.view.selection_set(key)
+            self.view.see(key[0])
+
+    def get_selected_lines(self) -> list[int]:
+        """ Номера выделенных строк (пустая строка не входит) """
+        return [self.view.index(key) for key in self.get_selected()]
+
+    def select_lines(self, lines):
+        """ Выделить строки по номерам, несуществующие номера пропускаются """
+        keys = [key for line in lines for key in self.view.rows(line, line + 1)]
+        self.view.selection_set(keys or [self.view.blank])
 
     def get_selected(self):
         """ Возвращает список выделенных в списке id строк """
-        list_copy = list(self.tree.selection())  # id выделенных команд
+        list_copy = self.view.selection()  # id выделенных команд
         if 'zero' in list_copy:
             # Удаляем пустую строку
             list_copy.remove('zero')
@@ -706,15 +1064,9 @@ class DisplayCommands:
                             mess = 'Копирование и перенос меток и блоков произведено с изменением их названий.'
 
             else:
-                # Перенос элементов
-                # Находим индексы элементов по названию
-                old_indexes = [self.data.queue_command.index(elem) for elem in self.list_copy]
-                # Извлекаем элементы из списка в обратном порядке, чтобы не нарушить порядок индексов
-                elements = [self.data.queue_command.pop(i) for i in sorted(old_indexes, reverse=True)]
-                elements.reverse()  # Разворачиваем список
-                # Вставляем элементы на новые позиции
-                for i, elem in enumerate(elements):
-                    self.data.queue_command.insert(self.data.pointer_command+1+i, elem)
+                # Перенос элементов: в порядке следования в скрипте вставляем за указателем
+                elements = sorted(self.list_copy, key=self.data.queue_command.index)
+                self.data.move_commands(elements, self.data.pointer_command + 1)
 
                 list_select = self.list_copy.copy()  # Список строк для выделения
                 # Очищаем данные операции
@@ -722,7 +1074,7 @@ class DisplayCommands:
                 self.operation = ''
 
             self.out_commands()  # Обновляем список
-            self.tree.selection_set(list_select)  # Выделяем вставленные строки
+            self.view.selection_set(list_select)  # Выделяем вставленные строки
             self.save_load.save_history()  # Сохраняем историю
             settings.is_saved = False  # Изменения в проекте не сохранены
 
@@ -753,41 +1105,60 @@ class DisplayCommands:
 
         self.out_commands()  # Обновляем список
 
-    def up(self, event=None):
-        """ Перемещение выделенных строк вверх
+    def optimize(self, event=None, history=True):
+        """ Оптимизация скрипта
 
-        Используя вырезать и вставить переносим выделенные строки на 1 вверх,
-        после вставки выделяем перенесенные строки на новых местах.
+        Серии нажатий клавиш заменяются командами вывода текста, соседние паузы объединяются,
+        пустые нажатия модификаторов удаляются. Выводит отчет о результате.
         """
         if data.script_started or data.is_listening:
             return  # Операция невозможна при выполнении или записи скрипта
 
-        # Определяем индекс строки куда вставлять
-        try:
-            where_to_insert = self.data.queue_command.index(self.get_selected()[0]) - 2
-            if where_to_insert < -1:
-                return
-        except:
-            where_to_insert = -1
-        self.cut()  # Вырезаем выделенные строки
-        self.tree.selection_set(self.tree.get_children()[where_to_insert+1])  # Выделяем строку куда вставлять
-        self.paste()  # Вставляем выделенные строки
+        state = self.save_load.data_preparation()
+        script, report = optimize_script(state['script'], settings.s_key_pause, settings.s_command_pause)
+        if report.removed:
+            state['script'] = script
+            self.save_load.change_script_and_settings(state)  # Заменяем скрипт
+            if history:
+                self.save_load.save_history()  # Сохраняем историю
+            settings.is_saved = False  # Изменения в проекте не сохранены
+        logger.warning(report)
+        return report
+
+    def up(self, event=None):
+        """ Перемещение выделенных строк вверх
+
+        Выделенные строки собираются в блок и переносятся на 1 строку выше первой из них,
+        выделение остается на перенесенных строках.
+        """
+        self.move_selected(-1)
 
     def down(self, event=None):
         """ Перемещение выделенных строк вниз """
+        self.move_selected(1)
+
+    def move_selected(self, shift):
+        """ Перенос выделенных строк на shift строк вверх (-1) или вниз (1)
+
+        Строки переносятся операцией над очередью команд, подряд идущие - одним блоком,
+        время не зависит от длины скрипта. Буфер Копировать/Вырезать не затрагивается.
+        """
         if data.script_started or data.is_listening:
             return  # Операция невозможна при выполнении или записи скрипта
 
-        all_selected =self.get_selected()
-        if not all_selected:
+        selected = self.get_selected()
+        if not selected:
             return
-        where_to_insert = self.data.queue_command.index(self.get_selected()[0]) + 1 # Индекс строки куда вставлять
-        last_index = self.data.queue_command.index(self.get_selected()[-1])  # Индекс последней выделенной строки
-        if last_index == len(self.data.queue_command) - 1:
+        first = self.data.queue_command.index(selected[0])  # Индекс первой выделенной строки
+        if shift < 0 and first == 0:
             return
-        self.cut()
-        self.tree.selection_set(self.tree.get_children()[where_to_insert])  # Выделяем строку куда вставлять
-        self.paste()
+        if shift > 0 and self.data.queue_command.index(selected[-1]) == len(self.data.queue_command) - 1:
+            return
+        self.data.move_commands(selected, first + shift)
+        self.view.selection_set(selected)  # Выделяем перенесенные строки
+        self.view.see(selected[0] if shift < 0 else selected[-1])
+        self.save_load.save_history()  # Сохраняем историю
+        settings.is_saved = False  # Изменения в проекте не сохранены
 
 
 class DataSource:
@@ -838,6 +1209,8 @@ class DataSource:
             path_and_name = os.path.join(settings.path_to_data, name)
             if not os.path.exists(path_and_name):
                 raise DataError(f'Файл {name} не найден.')
+            import pandas as pd  # Загружается только при чтении таблицы
+
             data_frame = pd.read_excel(path_and_name)  # Читаем таблицу в pandas DataFrame
             data.data_source = data_frame.to_dict('list')  # Превращаем DataFrame в словарь
             fields = data.get_fields()  # Список полей данных
@@ -896,9 +1269,13 @@ class SaveLoad:
         self.root = root  # Ссылка на главное окно
 
         settings.is_saved = False  # Изменения в проекте не сохранены
-        # История скрипта, сохраняет каждое предыдущее состояние скрипта в виде списка словарей
-        self.history = deque(maxlen=100)  # Помнит последние 100 состояний скрипта
-        self.history_pointer = -1  # Указатель на текущее состояние скрипта
+        # История скрипта: журнал операций над скриптом, объем ограничен settings.history_limit
+        self.history = History()
+        data.listeners.append(self.history.record)  # Подписываемся на изменения скрипта
+        # Журнал правок между сохранениями проекта (автосохранение)
+        self.journal = Journal(data)
+        data.listeners.append(self.journal.record)
+        self.root.after(int(settings.autosave_interval * 1000), self.autosave)
 
     def load_old_project(self):
         # Проверка файла конфигурации
@@ -910,7 +1287,7 @@ class SaveLoad:
         if self.new_project_name:
             # Если данные о проекте есть, то открываем проект
             try:
-                self.open_project()
+                self.open_project(recover=True)
             except LoadError as err:
                 self.new_project_name = ''
 
@@ -938,10 +1315,10 @@ class SaveLoad:
             os.makedirs(os.path.join(path, name))
             os.makedirs(os.path.join(path, name, 'data'))
             os.makedirs(os.path.join(path, name, 'elements_img'))
-            with open(os.path.join(path, name, f'{name}.json'), 'w') as f:
-                json.dump({"script": [], "settings": {}, 'data_source': '',
-                           'saved': settings.created_project_date,
-                           'updated': settings.updated_project_date}, f, indent=4)
+            project_file.write(project_file.new_path(os.path.join(path, name), name, settings.compact_projects),
+                               {"script": [], "settings": {}, 'data_source': '',
+                                'saved': settings.created_project_date,
+                                'updated': settings.updated_project_date})
 
             logger.warning(f'Создан новый проект {name}.')
             settings.is_saved = True  # Изменения в проекте не сохранены
@@ -971,6 +1348,8 @@ class SaveLoad:
                 self.save_project()
             elif result is None:
                 return
+            else:
+                self.journal.discard()  # Несохраненные правки больше не нужны
 
         self.dialog_new_project()  # Открываем диалоговое окно для выбора пути и имени проекта
         if self.new_project_name:
@@ -988,6 +1367,8 @@ class SaveLoad:
                 self.save_project()
             elif result is None:
                 return
+            else:
+                self.journal.discard()  # Несохраненные правки больше не нужны
 
         # Открываем диалоговое окно для выбора проекта
         print(settings.work_dir)
@@ -996,7 +1377,7 @@ class SaveLoad:
             return
 
         try:
-            self.open_project(path)
+            self.open_project(path, recover=True)
         except LoadError as err:
             logger.error(err)
 
@@ -1019,8 +1400,12 @@ class SaveLoad:
                 new_project = os.path.join(self.new_path_to_project, self.new_project_name)
                 # Копируем содержимое папки проекта  новую папку
                 shutil.copytree(os.path.join(settings.path_to_project, settings.project_name), new_project)
-                # Удаляем в новом проекте файл скрипта
-                os.remove(os.path.join(new_project, f'{settings.project_name}.json'))
+                # Удаляем в новом проекте файл скрипта и журнал правок
+                os.remove(project_file.script_path(new_project, settings.project_name))
+                for file_path in self.journal.paths(new_project, settings.project_name):
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                self.journal.discard()  # Правки сохраняются в новый проект
                 # Сохраняем новые настройки проекта
                 settings.path_to_project = self.new_path_to_project
                 settings.project_name = self.new_project_name
@@ -1035,6 +1420,36 @@ class SaveLoad:
             except Exception:
                 raise
 
+    def menu_export_json(self):
+        """ Пункт меню Экспорт в json: запись скрипта и настроек в json для правки и сравнения """
+        if data.script_started or data.is_listening:
+            return  # Операция невозможна при выполнении или записи скрипта
+
+        path = fd.asksaveasfilename(initialdir=settings.path_to_project, initialfile=f'{settings.project_name}.json',
+                                    defaultextension='.json', filetypes=[('json', '*.json')], title='Экспорт в json')
+        if not path:
+            return
+        project_file.write(path, self.data_preparation())
+        logger.warning(f'Скрипт записан в {path}')
+
+    def menu_import_json(self):
+        """ Пункт меню Импорт из json: замена скрипта и настроек данными из json файла """
+        if data.script_started or data.is_listening:
+            return  # Операция невозможна при выполнении или записи скрипта
+
+        path = fd.askopenfilename(initialdir=settings.path_to_script, filetypes=[('json', '*.json')],
+                                  title='Импорт из json')
+        if not path:
+            return
+        try:
+            self.change_script_and_settings(project_file.read(path))  # Заменяем скрипт и настройки
+        except Exception as err:
+            logger.error(f'Ошибка импорта {path}: {err}')
+            return
+        self.save_history()  # Сохраняем историю
+        settings.is_saved = False  # Изменения в проекте не сохранены
+        logger.warning(f'Скрипт загружен из {path}')
+
     def data_preparation(self):
         """ Подготовка данных для сохранения """
         script = [data.obj_command[label].command_to_dict() for label in data.queue_command]  # Подготовка скрипта
@@ -1047,10 +1462,12 @@ class SaveLoad:
         """ Сохранение проекта """
         settings.updated_project_date = datetime.now().strftime("%d.%m.%Y")  # Когда обновлен проект
         for_save = self.data_preparation()  # Подготовка данных для сохранения
-        # сохраняем в файл
-        file_path = os.path.join(settings.path_to_script, f'{settings.project_name}.json')
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(for_save, f, default=lambda o: o.__json__(), indent=4)
+        for_save['save_id'] = uuid.uuid4().hex  # Метка сохранения, к ней привязан журнал правок
+        # сохраняем в файл (атомарно), в формате, выбранном в настройках программы
+        file_path = project_file.new_path(settings.path_to_script, settings.project_name, settings.compact_projects)
+        project_file.write(file_path, for_save)
+        project_file.remove_other(file_path)  # Файл скрипта в другом формате больше не актуален
+        self.journal.saved(for_save['save_id'])  # Правки сохранены, журнал начинается заново
 
         # Исправляем файл конфигурации
         settings.config_file(action='set', name=settings.project_name, path=settings.path_to_project)
@@ -1070,41 +1487,42 @@ class SaveLoad:
         script = data_dict['script']
         sett = data_dict['settings']
 
-        # Удаляем старый скрипт и записываем новый
-        data.queue_command.clear()  # Очередь команд
-        data.obj_command.clear()  # Список команд
-        llist.labels.clear()  # Список меток
-        data.pointer_command = 0
-
-        # При построении скрипта команды меток и названий блоков должны быть созданы и добавлены в первую очередь
-        # Поэтому создаем их, добавляем
+        # При построении скрипта команды меток и названий блоков должны быть созданы первыми,
+        # команды перехода при создании проверяют наличие метки в реестре.
+        # Объекты создаются сразу на своих местах, имена меток проверяются и записываются в реестр один раз
+        commands = [None] * len(script)
         for i, cmd_dict in enumerate(script):
             # Создаем объект команды с метками по краткой записи
             if cmd_dict['cmd'] == 'BlockCmd' or cmd_dict['cmd'] == 'LabelCmd':
-                insert = CommandClasses.create_command(
+                commands[i] = CommandClasses.create_command(
                     *cmd_dict['val'], command=cmd_dict['cmd'], description=cmd_dict['des'])
-                data.add_new_command(insert)
+        names = [obj.value for obj in commands if obj]
+        if len(set(names)) != len(names):
+            raise LabelAlreadyExists('Такое имя метки или блока уже существует.')
+        llist.set_list(names)
 
-        # Создаем остальные и вставляем на свои места
-        for i, cmd_dict in enumerate(script):
-            # Добавляем остальные команды по краткой записи
-            if cmd_dict['cmd'] != 'BlockCmd' and cmd_dict['cmd'] != 'LabelCmd':
-                data.pointer_command = i - 1  # Указатель, куда вставить команду
-                data.add_new_command(CommandClasses.create_command(
-                    *cmd_dict['val'], command=cmd_dict['cmd'], description=cmd_dict['des']))
+        # Создаем остальные. Старый скрипт остается на месте до записи нового целиком (для истории)
+        try:
+            for i, cmd_dict in enumerate(script):
+                if commands[i] is None:
+                    commands[i] = CommandClasses.create_command(
+                        *cmd_dict['val'], command=cmd_dict['cmd'], description=cmd_dict['des'])
+        except Exception:
+            llist.set_list(data.obj_command.label_names.values())  # Возвращаем метки старого скрипта
+            raise
 
-        # Обновляем список, предварительно установив указатель на начало
-        data.pointer_command = -1
-        self.display_commands.out_commands()
+        data.load_commands(commands)  # Записываем новый скрипт целиком, указатель в начале
+        self.display_commands.out_commands()  # Список выводится один раз
 
         settings.set_settings_from_dict(sett)  # Устанавливаем настройки
 
-    def open_project(self, path=None, data_source=None):
+    def open_project(self, path=None, data_source=None, recover=False):
         """ Загрузка проекта
 
         Если path не указан, то используем переменные заранее установленные,
         а если указан, то это должен быть полный путь к проекту, устанавливаем переменные.
         При явном указании источника данных (файла), открывается указанный. По умолчанию из настроек.
+        Если recover, восстанавливаются несохраненные правки из журнала проекта (открытие в редакторе).
         """
         if path:
             # Последней в пути папка проекта, отделяем ее от пути
@@ -1112,15 +1530,16 @@ class SaveLoad:
             self.new_path_to_project = os.path.dirname(path)  # получаем путь к проекту
 
         # Папка проекта должна содержать 2 вложенные папки: data и elements_img и файл скрипта
-        # с таким же именем, как и папка проекта, но с расширением .json, проверим это
+        # с таким же именем, как и папка проекта (.json или компактный .swd), проверим это
         this_project = True
         if not os.path.exists(os.path.join(self.new_path_to_project, self.new_project_name, settings.data_folder)):
             this_project = False
         if not os.path.exists(os.path.join(
                 self.new_path_to_project, self.new_project_name, settings.elements_folder)):
             this_project = False
-        if not os.path.exists(os.path.join(
-                self.new_path_to_project, self.new_project_name, f'{self.new_project_name}.json')):
+        file_path = project_file.script_path(
+            os.path.join(self.new_path_to_project, self.new_project_name), self.new_project_name)
+        if not file_path:
             this_project = False
         if not this_project:
             raise LoadError(f'Выбранная папка не является проектом {self.new_path_to_project}, {self.new_project_name}')
@@ -1128,10 +1547,9 @@ class SaveLoad:
         self.data_source.menu_delete_data_source()  # Отключаем источник данных
 
         try:
-            file_path = os.path.join(self.new_path_to_project, self.new_project_name, f'{self.new_project_name}.json')
+            self.journal.stop()  # Правки прежнего проекта больше не записываются
             # Загружаем данные из файла в переменную
-            with open(file_path, "r") as f:
-                data_dict = json.load(f)
+            data_dict = project_file.read(file_path)
 
             # Запоминаем путь к проекту и его имя в настройках
             settings.path_to_project = self.new_path_to_project
@@ -1155,6 +1573,10 @@ class SaveLoad:
                 # raise
 
             self.change_script_and_settings(data_dict)  # Заменяем скрипт и настройки
+            # Начинаем журнал правок, восстанавливая несохраненные
+            recovered = self.journal.open(data_dict.get('save_id', ''), self if recover else None)
+            if recovered:
+                mess += f'\nВосстановлены несохраненные правки ({recovered}).'
             settings.created_project_date = data_dict.get('saved')  # Получаем дату создания проекта
             if not settings.created_project_date:
                 settings.created_project_date = datetime.now().strftime("%d.%m.%Y")
@@ -1165,7 +1587,7 @@ class SaveLoad:
             logger.warning(mess)
             self.root.title(f'Редактор скриптов ({self.new_project_name})')
             self.save_history()  # Сохраняем историю
-            settings.is_saved = True
+            settings.is_saved = not recovered
 
         except Exception as err:
             raise LoadError(f'Ошибка загрузки проекта {err}')
@@ -1192,8 +1614,9 @@ class SaveLoad:
                 return
 
             # Переименовываем файл скрипта
-            os.rename(os.path.join(settings.path_to_script, f'{settings.project_name}.json'),
-                      os.path.join(settings.path_to_script, f'{text}.json'))
+            file_path = project_file.script_path(settings.path_to_script, settings.project_name)
+            os.rename(file_path, os.path.join(settings.path_to_script, text + os.path.splitext(file_path)[1]))
+            self.journal.rename(settings.project_name, text)  # И журнал правок
             # Переименовываем папку проекта
             os.rename(os.path.join(settings.path_to_project, settings.project_name),
                       os.path.join(settings.path_to_project, text))
@@ -1295,61 +1718,47 @@ class SaveLoad:
         window.focus_set()
         window.wait_window()
 
+    def autosave(self):
+        """ Автосохранение: правки дописываются в журнал проекта, выполняется периодически """
+        self.journal.flush()
+        self.root.after(int(settings.autosave_interval * 1000), self.autosave)
+
     def save_history(self):
         """ Сохранение истории
 
-        История изменений сохраняется в свойстве self.history. Имеет лимит записей, старые
-        записи уничтожаются по мере добавления новых. Записи добавляются после совершения операций.
+        Операции над скриптом, выполненные после прошлого сохранения, записываются одним шагом истории
+        вместе с выделенными строками и настройками (если они изменились). Скрипт целиком не копируется.
+        Записи добавляются после совершения операций.
         """
-        state = self.data_preparation()
-        selected = self.display_commands.get_selected()  # Находим выделенные строки
-        # Определяем их номера в списке и записываем в историю
-        state['selected'] = [self.display_commands.tree.index(item) for item in selected]
-        self.history.append(state)
-        self.history_pointer = len(self.history)-1  # Указатель истории на последнюю запись
+        # Номера выделенных строк записываем в историю
+        self.history.commit(self.display_commands.get_selected_lines(), settings.get_dict_settings())
 
     def undo_button(self):
         """ Отмена последнего изменения """
         if data.script_started or data.is_listening:
             return  # Операция невозможна при выполнении или записи скрипта
 
-        if self.history_pointer > 0:
-            self.history_pointer -= 1
-            state = self.history[self.history_pointer]
-            self.change_script_and_settings(state)  # Заменяем скрипт и настройки
-            # Получаем номера выделенных строк, формируем список индексов в списке и выделяем
-            selected = []
-            for item in state['selected']:
-                try:
-                    selected.append(self.display_commands.tree.get_children()[item])
-                except IndexError:
-                    # Предотвращаем ошибки если не найдет индекса
-                    pass
-            if not selected:
-                selected = ['zero']
-            self.display_commands.tree.selection_set(selected)
-            logger.warning(f'Состояние {self.history_pointer+1}')
+        if self.history.can_undo():
+            self.show_history_state(*self.history.undo(data))
 
     def return_button(self):
         """ Возврат к более позднему изменению (отмененному ранее) """
-        if data.script_started or data.is_listening or self.history_pointer == len(self.history) - 1:
+        if data.script_started or data.is_listening or not self.history.can_redo():
             return  # Возврат невозможен, если запущен скрипт или слушатель или указатель на последней записи
 
-        self.history_pointer += 1
-        state = self.history[self.history_pointer]
-        self.change_script_and_settings(state)  # Заменяем скрипт и настройки
-        # Получаем номера выделенных строк, формируем список индексов в списке и выделяем
-        selected = []
-        for item in state['selected']:
-            try:
-                selected.append(self.display_commands.tree.get_children()[item])
-            except IndexError:
-                # Предотвращаем ошибки если не найдет индекса
-                pass
-        if not selected:
-            selected = ['zero']
-        self.display_commands.tree.selection_set(selected)
-        logger.warning(f'Состояние {self.history_pointer+1}')
+        self.show_history_state(*self.history.redo(data))
+
+    def show_history_state(self, sett, selected_numbers):
+        """ Вывод состояния скрипта после отмены или возврата
+
+        Принимает настройки (None, если не менялись) и номера выделенных строк.
+        """
+        if sett is not None:
+            settings.set_settings_from_dict(sett)  # Устанавливаем настройки
+        data.pointer_command = -1
+        self.display_commands.out_commands()
+        self.display_commands.select_lines(selected_numbers)  # Выделяем строки, выделенные в этом состоянии
+        logger.warning(f'Состояние {self.history.pointer+1}')
 
     def select_work_dir(self):
         """ Выбор рабочей папки """
@@ -0,0 +1,134 @@
+# ---------------------------------------------------------------------------
+# Сервис (резидентный режим) программы
+# main.py --daemon запускает программу один раз за сеанс: тяжелые модули (pandas, OpenCV,
+# pyautogui, pynput, Tk) загружены, кэш шаблонов изображений сохраняется между запусками.
+# Последующие запуски main.py (быстрый запуск, --run <код>) в самом начале, до загрузки
+# тяжелых модулей, передают запрос сервису через локальный сокет (Unix socket в Linux,
+# именованный канал в Windows) и завершаются. Если сервис не запущен, программа работает как раньше.
+# Этот модуль импортирует только стандартную библиотеку.
+# Запросы и ответы - json: {'cmd': 'run' | 'quick_start' | 'shutdown' | 'ping', ...}
+# Запрос run передает аргументы и текущую папку клиента: {'cmd': 'run', 'argv': [...], 'cwd': ...}
+# ---------------------------------------------------------------------------
+import os
+import sys
+import json
+import tempfile
+import threading
+from multiprocessing.connection import Listener, Client
+
+
+def address():
+    """ Адрес сервиса для текущего пользователя """
+    if sys.platform == 'win32':
+        return rf'\\.\pipe\swd_daemon_{os.getlogin()}'
+    return os.path.join(tempfile.gettempdir(), f'swd_daemon_{os.getuid()}.sock')
+
+
+def family():
+    """ Тип соединения: именованный канал в Windows, Unix socket в остальных системах """
+    return 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+
+
+def request(message: dict):
+    """ Отправка запроса сервису и ожидание ответа
+
+    Возвращает словарь ответа или None, если сервис не запущен.
+    """
+    try:
+        conn = Client(address(), family())
+    except OSError:
+        return None
+    with conn:
+        conn.send_bytes(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+        try:
+            return json.loads(conn.recv_bytes().decode('utf-8'))
+        except (EOFError, OSError):
+            return {'status': 'error', 'message': 'Сервис закрыл соединение.'}
+
+
+def forward(argv: list) -> bool:
+    """ Передача запуска программы работающему сервису
+
+    Принимает аргументы командной строки. Передаются запуск без ключей и с -c (окно быстрого запуска),
+    --run (выполнение скрипта, ответ приходит по завершении) и --daemon-stop.
+    Возвращает True, если запрос выполнен сервисом и программе больше ничего делать не нужно.
+    """
+    if any(arg in argv for arg in ('--daemon', '--report', '-h', '--help')):
+        return False
+    if not argv or argv[0] in ('-c', '--code'):
+        message = {'cmd': 'quick_start'}
+    elif argv[0] in ('-r', '--run'):
+        message = {'cmd': 'run', 'argv': argv, 'cwd': os.getcwd()}  # Относительный путь - от папки клиента
+    elif argv[0] == '--daemon-stop':
+        message = {'cmd': 'shutdown'}
+    else:
+        return False
+
+    response = request(message)
+    if response is None:
+        return False  # Сервис не запущен
+
+    if response.get('status') not in ('ok', 'finished'):
+        print(response.get('message', response))
+        sys.exit(1)
+    for error in response.get('errors', []):
+        print(error)
+    if message['cmd'] == 'run' and not response.get('completed'):
+        sys.exit(1)
+    return True
+
+
+class DaemonServer:
+    """ Сервер, принимающий запросы от других запусков программы
+
+    Каждое соединение обрабатывается в своем потоке функцией handler(request) -> response.
+    Работа с окнами handler должен передавать в главный поток (root.after).
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.listener = None
+
+    def start(self):
+        """ Открытие сокета и запуск потока приема соединений """
+        if family() == 'AF_UNIX' and os.path.exists(address()):
+            if request({'cmd': 'ping'}) is not None:
+                raise OSError('Сервис уже запущен.')
+            os.remove(address())  # Сокет остался от аварийно завершенного сервиса
+        self.listener = Listener(address(), family())
+        if family() == 'AF_UNIX':
+            os.chmod(address(), 0o600)  # Подключаться может только текущий пользователь
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        """ Прием соединений """
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return  # Сокет закрыт
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        """ Обработка одного запроса """
+        with conn:
+            try:
+                message = json.loads(conn.recv_bytes().decode('utf-8'))
+                if message.get('cmd') == 'ping':
+                    response = {'status': 'ok'}
+                else:
+                    response = self.handler(message)
+            except (EOFError, OSError):
+                return
+            except Exception as err:
+                response = {'status': 'error', 'message': str(err)}
+            try:
+                conn.send_bytes(json.dumps(response, ensure_ascii=False, default=str).encode('utf-8'))
+            except OSError:
+                pass
+
+    def close(self):
+        """ Закрытие сокета """
+        if self.listener:
+            self.listener.close()
+            self.listener = None
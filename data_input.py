@@ -246,7 +246,7 @@ class FieldLlist(DataInput):
     def __init__(self, root, value, x, y, func_event, **kwargs):
         super().__init__(root, value, x=x, y=y, func_event=func_event)
 
-        values = self.value.labels  # Список для вывода
+        values = list(self.value.labels)  # Список для вывода
         self.value = StringVar(value=self.value)
         long = 5
         if len(values):
@@ -6,17 +6,46 @@
 # А поскольку программа ориентируется по типам данных, какие виджеты применять, нужны новые типы.
 # ---------------------------------------------------------------------------
 
+class LabelRegistry:
+    """ Реестр имен меток и блоков скрипта
+
+    Упорядоченное множество на основе dict: проверка наличия, добавление и удаление имени за O(1),
+    перебор в порядке добавления (для выпадающего списка меток).
+    """
+
+    def __init__(self, names=()):
+        self.names = dict.fromkeys(names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        self.names[name] = None
+
+    def discard(self, name):
+        self.names.pop(name, None)
+
+    def clear(self):
+        self.names.clear()
+
+
 class llist:
     """ Тип данных представляет выпадающий список label list для меток в скрипте и имен блоков
 
-    Класс хранит актуальный список данных об именах для перехода, экземпляры класса
-    пользуются этим списком и помнят выбранный элемент. Обновляется каждый раз при изменении,
+    Класс хранит актуальный реестр имен для перехода, экземпляры класса
+    пользуются этим реестром и помнят выбранный элемент. Обновляется каждый раз при изменении,
     удалении или добавлении нужных объектов в словарь с переопределенными методами, см. CountingDict в components
     Данные на входе и выходе просто строка, обязательное условие присутствие строки в хранимом списке меток.
 
      """
 
-    labels = []
+    labels = LabelRegistry()
 
     def __init__(self, label: str = ''):
         label = str(label)
@@ -35,8 +64,8 @@ class llist:
 
     @classmethod
     def set_list(cls, l):
-        """ Записываем метки в список класса """
-        cls.labels = l
+        """ Записываем метки в реестр класса """
+        cls.labels = LabelRegistry(l)
 
 
 class eres:
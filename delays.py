@@ -0,0 +1,76 @@
+# ---------------------------------------------------------------------------
+# Паузы при выполнении скрипта
+# Все ожидания исполнителя (паузы между командами, после клика, между нажатиями клавиш,
+# команда Пауза, повторы поиска изображения) выполняются через этот модуль.
+# Пауза - это ожидание события остановки скрипта, поэтому остановка прерывает
+# любую паузу сразу, а не после ее окончания.
+# Длительность пауз делится на множитель скорости воспроизведения (настройка s_speed или ключ --speed).
+# Паузы, которые должны длиться реальное время (ожидание появления изображения, команда
+# Пауза без ускорения), выполняются с scaled=False.
+# ---------------------------------------------------------------------------
+import asyncio
+import threading
+
+
+class Delays:
+    """ Прерываемые паузы
+
+    Событие stop_event установлено, пока скрипт не выполняется. Флаг запуска скрипта
+    (DataForWorker.script_started) сбрасывает его при запуске и устанавливает при остановке.
+    """
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.stop_event.set()  # Скрипт не запущен
+        self.speed = 1.0  # Множитель скорости воспроизведения, 2 - паузы вдвое короче
+
+    def set_speed(self, speed):
+        """ Установка множителя скорости, неверные значения заменяются на 1 """
+        try:
+            speed = float(speed)
+        except (TypeError, ValueError):
+            speed = 1.0
+        self.speed = speed if speed > 0 else 1.0
+
+    def scale(self, seconds) -> float:
+        """ Длительность паузы с учетом скорости воспроизведения """
+        return seconds / self.speed
+
+    def start(self):
+        """ Скрипт запущен, паузы выполняются полностью """
+        self.stop_event.clear()
+
+    def stop(self):
+        """ Скрипт остановлен, все текущие и будущие паузы прерываются """
+        self.stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        """ Скрипт остановлен """
+        return self.stop_event.is_set()
+
+    def wait(self, seconds, scaled=True) -> bool:
+        """ Пауза, прерываемая остановкой скрипта
+
+        Если scaled, длительность делится на множитель скорости.
+        Возвращает True, если скрипт остановлен (пауза прервана), иначе False.
+        """
+        if scaled:
+            seconds = self.scale(seconds)
+        if seconds <= 0:
+            return self.stop_event.is_set()
+        return self.stop_event.wait(seconds)
+
+    async def wait_async(self, seconds, scaled=True) -> bool:
+        """ Пауза для асинхронного исполнителя, прерываемая остановкой скрипта
+
+        Цикл событий на время паузы не блокируется. Принимает и возвращает то же, что и wait.
+        """
+        if scaled:
+            seconds = self.scale(seconds)
+        if seconds <= 0:
+            return self.stop_event.is_set()
+        return await asyncio.get_running_loop().run_in_executor(None, self.stop_event.wait, seconds)
+
+
+delays = Delays()  # Создаем объект пауз
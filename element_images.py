@@ -14,13 +14,16 @@ https://pyimagesearch.com/2018/01/01/taking-screenshots-with-opencv-and-python/
 
 import os, sys
 import datetime
-import numpy as np
-import pyautogui
-import cv2
+import time
 from time import sleep
 
-from exceptions import TemplateNotFoundError, ElementNotFound
+from exceptions import TemplateNotFoundError, ElementNotFound, NoCommandOrStop
 from settings import settings
+from profiler import profiler
+from delays import delays
+
+# numpy, OpenCV и pyautogui загружаются долго и нужны только при работе с изображениями,
+# поэтому импортируются внутри функций при первом вызове
 
 
 def screenshot(x_reg: int = 0, y_reg: int = 0, region: int = 0):
@@ -30,11 +33,121 @@ def screenshot(x_reg: int = 0, y_reg: int = 0, region: int = 0):
     Если сторона на задана (равна 0) то делает скриншот всего экрана
 
     """
-    if region:
-        image = pyautogui.screenshot(region=(x_reg, y_reg, region, region))  # x, y, x+n, y+n (с верхнего левого угла)
-    else:
-        image = pyautogui.screenshot()
-    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    import cv2
+    import numpy as np
+    import pyautogui
+
+    with profiler.phase('capture'):
+        if region:
+            image = pyautogui.screenshot(region=(x_reg, y_reg, region, region))  # x, y, x+n, y+n (с верхнего левого угла)
+        else:
+            image = pyautogui.screenshot()
+        return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+
+# Кэш шаблонов изображений элементов: путь -> (время изменения файла, изображение в оттенках серого)
+templates = dict()
+
+
+def load_template(name_template: str):
+    """ Чтение шаблона изображения элемента в оттенках серого
+
+    Прочитанные шаблоны хранятся в кэше, файл читается заново, только если он изменился.
+    Может вызываться из нескольких потоков (предварительная загрузка шаблонов следующих команд).
+    """
+    import cv2
+
+    path = os.path.join(settings.path_to_elements, name_template)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        raise TemplateNotFoundError('Шаблон с таким именем не найден.')
+    cached = templates.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    template = cv2.imread(path, 0)
+    if template is None:
+        raise TemplateNotFoundError('Шаблон не удалось прочитать.')
+    templates[path] = (mtime, template)
+    return template
+
+
+class ConfirmationCache:
+    """ Недавние подтверждения присутствия изображений
+
+    Записанные скрипты часто проверяют одно и то же изображение дважды подряд: команда Проверка изображения,
+    а за ней клик с локальной проверкой того же шаблона в тех же координатах. Если между проверками
+    не было ввода с клавиатуры или мыши и прошло не больше settings.confirm_validity сек.,
+    повторная проверка считается выполненной без захвата экрана.
+    Любой ввод (Player.run_command, комбинации клавиш команд) очищает кэш.
+    """
+
+    def __init__(self):
+        self.results = dict()  # Ключ проверки -> (время подтверждения, координаты)
+
+    def get(self, key):
+        """ Координаты из действительного подтверждения или None """
+        result = self.results.get(key)
+        if result and time.perf_counter() - result[0] <= settings.confirm_validity:
+            return result[1]
+        return None
+
+    def put(self, key, point):
+        """ Запоминание подтверждения """
+        self.results[key] = (time.perf_counter(), point)
+
+    def invalidate(self):
+        """ Был ввод, изображение на экране могло измениться """
+        self.results.clear()
+
+
+confirmations = ConfirmationCache()
+
+
+def wait_screen_stable(x_point, y_point, max_pause: float):
+    """ Ожидание, пока изображение вокруг точки клика перестанет меняться
+
+    Снимает квадрат со стороной settings.settle_region с центром в точке клика каждые
+    settings.settle_interval сек. Как только settings.settle_frames сравнений подряд дали одинаковые кадры,
+    интерфейс считается успокоившимся и ожидание заканчивается. Первые settings.settle_min сек.
+    ждем в любом случае, чтобы приложение успело начать реагировать на клик.
+    Успокоиться экран может только после того, как изменился: пока изменений не было, приложение
+    может еще не начать реагировать, и ожидание длится settings.settle_quiet сек. без изменений.
+    Ожидание не длится дольше max_pause (пауза после клика из настроек).
+
+    """
+    import numpy as np
+    import pyautogui
+
+    start = time.perf_counter()
+    deadline = start + delays.scale(max_pause)
+
+    # Квадрат не должен выходить за пределы экрана
+    width, height = pyautogui.size()
+    side = min(settings.settle_region, width, height)
+    x_reg = min(max(int(x_point) - side // 2, 0), width - side)
+    y_reg = min(max(int(y_point) - side // 2, 0), height - side)
+
+    previous = None
+    stable = 0  # Сколько раз подряд кадр не изменился
+    changed = False  # Экран после клика уже менялся
+    while not delays.stopped:
+        frame = screenshot(x_reg, y_reg, side)
+        if previous is not None and np.array_equal(frame, previous):
+            stable += 1
+        else:
+            changed = changed or previous is not None
+            stable = 0
+        previous = frame
+
+        now = time.perf_counter()
+        if stable >= settings.settle_frames and now - start >= settings.settle_min and \
+                (changed or now - start >= settings.settle_quiet):
+            return  # Экран успокоился
+        if now >= deadline:
+            return  # Максимальная пауза истекла
+        with profiler.phase('sleep'):
+            delays.wait(min(settings.settle_interval, deadline - now), scaled=False)
 
 
 def generate_image_name() -> str:
@@ -55,6 +168,9 @@ def compare_2_images(small, big):
     и если оно одноцветное, то большое изображение обрезается до размера маленького и если оно тоже одноцветное и имеет
     тот же цвет, что и маленькое - они признаются одинаковыми.
     """
+    import cv2
+    import numpy as np
+
     threshold = 0.85 # Порог
     method = cv2.TM_CCOEFF_NORMED  # Метод расчёта корреляции между изображениями
 
@@ -79,9 +195,10 @@ def compare_2_images(small, big):
         else:
             return False
 
-    res = cv2.matchTemplate(big, small, method)
-    # Ищем координаты совпадающего местоположения в массиве numpy
-    loc = np.where(res >= threshold)
+    with profiler.phase('match'):
+        res = cv2.matchTemplate(big, small, method)
+        # Ищем координаты совпадающего местоположения в массиве numpy
+        loc = np.where(res >= threshold)
     if any(loc[-1]):
         return True
 
@@ -99,6 +216,8 @@ def save_image(x_point: int, y_point: int) -> str:
     Возвращает имя нового или существующего изображения.
 
     """
+    import cv2
+
     # Вычисляем координаты квадрата для скриншота
     x_reg = x_point - settings.first_region // 2
     y_reg = y_point - settings.first_region // 2
@@ -202,6 +321,9 @@ def pattern_search(*args) -> tuple:
     Не производит поиск и сообщает результат сразу, если пришло пустое имя файла или количество попыток 0.
     Вернет координаты центра найденного элемента (если не найден, вернет вошедшие координаты) или исключение.
     """
+    import cv2
+    import numpy as np
+
     x_point, y_point, name_template = args[:3]  # Получаем координаты и имя изображения
     local_check = args[4] if args[3] else settings.s_confirm_element  # Включить ли локальную проверку
     local_check_size = args[5] if args[3] else settings.s_local_check_size  # Размер квадрата локальной проверки
@@ -212,10 +334,16 @@ def pattern_search(*args) -> tuple:
         # Если нет изображения элемента или попыток 0, то проверка отменяется, подтверждаем наличие элемента
         return (x_point, y_point)
 
+    # Та же проверка недавно выполнена, а ввода после нее не было
+    local_key = ('local', name_template, x_point, y_point, local_check_size)
+    screen_key = ('screen', name_template, x_point, y_point)
+    if local_check and confirmations.get(local_key):
+        return (x_point, y_point)
+    if full_screen and confirmations.get(screen_key):
+        return confirmations.get(screen_key)
+
     # Получение шаблона
-    if not os.path.exists(os.path.join(settings.path_to_elements, name_template)):
-        raise TemplateNotFoundError('Шаблон с таким именем не найден.')
-    template = cv2.imread(os.path.join(settings.path_to_elements, name_template), 0)
+    template = load_template(name_template)
 
     # Сохранить ширину в переменной w и высоту в переменной h шаблона
     w, h = template.shape
@@ -230,7 +358,7 @@ def pattern_search(*args) -> tuple:
         # Проверка включена и попытки еще есть.
         if not settings.script_started:
             # Если скрипт остановлен, то прерываем проверку
-            raise ElementNotFound('Скрипт остановлен.')
+            raise NoCommandOrStop('Скрипт остановлен.')
 
         # Делаем скриншот нужного квадрата
         image = screenshot(x_reg, y_reg, local_check_size)
@@ -240,18 +368,25 @@ def pattern_search(*args) -> tuple:
 
         if compare_2_images(template, gray_img):
             # Элемент присутствует в этом месте, подтверждаем координаты
+            confirmations.put(local_key, (x_point, y_point))
             return (x_point, y_point)
 
         repeat -= 1
         if repeat:
             # После последнего поиска или если он единственный - пауза не нужна
-            sleep(1)
+            with profiler.phase('sleep'):
+                # Ожидание появления изображения зависит от приложения, поэтому не ускоряется
+                if delays.wait(1, scaled=False):
+                    raise NoCommandOrStop('Скрипт остановлен.')
 
     if not full_screen:
         raise ElementNotFound('Изображение не найдено в указанной области. Поиск по всему экрану отключен.')
     # Если поиск шаблона в заданных координатах не принес результата any(loc[-1] будет пустым.
     # Поиск элемента на всем экране
 
+    if delays.stopped:
+        raise NoCommandOrStop('Скрипт остановлен.')  # Не начинаем долгий поиск, если скрипт остановлен
+
     # Делаем скриншот экрана
     image = screenshot()
 
@@ -259,15 +394,17 @@ def pattern_search(*args) -> tuple:
     gray_img = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
     # Операция сопоставления
-    res = cv2.matchTemplate(gray_img, template, method)
+    with profiler.phase('match'):
+        res = cv2.matchTemplate(gray_img, template, method)
 
-    # Ищем координаты совпадающего местоположения в массиве numpy
-    loc = np.where(res >= threshold)
+        # Ищем координаты совпадающего местоположения в массиве numpy
+        loc = np.where(res >= threshold)
     xy = list(zip(*loc[::-1]))[-1] if list(zip(*loc[::-1])) else []
 
     # Проверка, найден ли шаблон на всем экране
     if xy:
         # Вернуть координаты центра нового положения элемента
+        confirmations.put(screen_key, (xy[0] + w / 2, xy[1] + h / 2))
         return (xy[0] + w / 2, xy[1] + h / 2)
 
     else:
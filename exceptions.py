@@ -37,6 +37,11 @@ class DataError(Error):
             f"{time.strftime('%d.%m.%Y %H:%M')}. {message}. Строка {settings.pointer_command}\n")
 
 
+class CommandTimeout(Error):
+    """ Команда выполнялась дольше допустимого и снята сторожевым потоком """
+    pass
+
+
 class NoCommandOrStop(Error):
     """ Нет команд для выполнения или команда Стоп """
     pass
@@ -51,3 +56,7 @@ class LoadError(Error):
     """ Ошибки при чтении и преобразовании данных """
     pass
 
+
+class BatchError(Error):
+    """ Ошибки пакетного выполнения скрипта """
+    pass
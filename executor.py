@@ -0,0 +1,113 @@
+# ---------------------------------------------------------------------------
+# Асинхронное ядро исполнителя скрипта
+# Поток выполнения скрипта держит постоянный цикл событий asyncio. Команда выполняется
+# как сопрограмма (CommandClasses.run_command_async), блокирующие вызовы (захват экрана,
+# сравнение изображений, pyautogui, pynput) уходят в пул потоков, паузы ожидаются без блокировки цикла.
+# Пока выполняется команда, в отдельном пуле читаются шаблоны изображений следующих команд.
+# Отмененный вызов (сторожевой поток снял зависшую команду) прервать нельзя, он остается в своем потоке.
+# Такой вызов помечается отмененным и перед вводом (check_cancelled) завершается, не нажимая клавиш
+# и не щелкая мышью, а пул заменяется новым, чтобы брошенный поток не занимал место следующих команд.
+# Синхронный DataForWorker.run_command остается оберткой над асинхронным выполнением.
+# ---------------------------------------------------------------------------
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from element_images import load_template
+from exceptions import TemplateNotFoundError, CommandTimeout
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+
+class Executor:
+    """ Цикл событий и пул потоков исполнителя """
+
+    prefetch_depth = 5  # Для скольких следующих команд заранее читать шаблоны изображений
+    workers = 4  # Потоков в пуле команд
+
+    def __init__(self):
+        self.loop = None  # Постоянный цикл событий, создается при первом выполнении
+        self.pool = self.new_pool()
+        self.prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+        self.prefetched = set()  # Шаблоны, загрузка которых уже запущена
+        self.local = threading.local()  # Флаг отмены вызова, который выполняет текущий поток пула
+        self.abandoned = 0  # Сколько потоков брошено с зависшими вызовами
+
+    def new_pool(self):
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='executor')
+
+    def run(self, coro):
+        """ Выполнение сопрограммы из синхронного кода в постоянном цикле событий
+
+        Цикл не привязан к потоку, но в каждый момент выполняется только в одном (в потоке скрипта).
+        """
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coro)
+
+    async def call(self, func, *args, **kwargs):
+        """ Выполнение блокирующей функции в пуле потоков
+
+        Если задача отменена, а функция уже выполняется, она помечается отмененной (см. check_cancelled),
+        а ее поток заменяется в новом пуле.
+        """
+        cancelled = threading.Event()
+
+        def run():
+            self.local.cancelled = cancelled
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.local.cancelled = None
+
+        future = self.pool.submit(run)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel() and not future.done():
+                cancelled.set()
+                self.abandon()
+            raise
+
+    def abandon(self):
+        """ Замена пула, в котором остался зависший вызов """
+        self.abandoned += 1
+        self.pool.shutdown(wait=False)
+        self.pool = self.new_pool()
+        logger.debug(f'Пул исполнителя заменен, брошено потоков: {self.abandoned}')
+
+    def check_cancelled(self):
+        """ Вызывается перед вводом: если вызов текущего потока отменен, ввод не отправляется
+
+        Вне пула исполнителя ничего не делает.
+        """
+        cancelled = getattr(self.local, 'cancelled', None)
+        if cancelled is not None and cancelled.is_set():
+            raise CommandTimeout('Команда снята, ввод отменен.')
+
+    def reset(self):
+        """ Сброс перед запуском скрипта (изображения элементов могли измениться) """
+        self.prefetched.clear()
+
+    @staticmethod
+    def preload(name):
+        """ Чтение шаблона в кэш, ошибки проявятся при выполнении самой команды """
+        try:
+            load_template(name)
+        except TemplateNotFoundError:
+            pass
+
+    def prefetch(self, data):
+        """ Запуск чтения шаблонов изображений следующих команд в пуле предзагрузки """
+        start = data.pointer_command + 1
+        for key in data.queue_command[start:start + self.prefetch_depth]:
+            image = getattr(data.obj_command[key], 'image', '')
+            if image and image not in self.prefetched:
+                self.prefetched.add(image)
+                self.prefetch_pool.submit(self.preload, image)
+
+
+executor = Executor()  # Создаем объект исполнителя
@@ -0,0 +1,158 @@
+# ---------------------------------------------------------------------------
+# История изменений скрипта (отмена и возврат)
+# Вместо полных копий скрипта хранится журнал операций над ним. DataForWorker сообщает
+# наблюдателям о каждой операции: вставка, удаление, замена команды, перенос строк, замена
+# всего скрипта. Операции между двумя вызовами SaveLoad.save_history образуют один шаг истории.
+# Отмена выполняет обратные операции шага, возврат - повторяет их, поэтому стоимость
+# отмены пропорциональна размеру изменения, а не длине скрипта.
+# Объекты команд в скрипте не изменяются на месте (редактор работает с копией), поэтому
+# шаги хранят ссылки на сами объекты.
+# Объем истории ограничен в байтах (settings.history_limit), старые шаги удаляются.
+# ---------------------------------------------------------------------------
+import sys
+import json
+
+from settings import settings
+
+
+class History:
+    """ Журнал операций над скриптом, сгруппированных в шаги
+
+    Операции (кортежи):
+    ('insert', позиция, id, команда) - команда вставлена;
+    ('delete', позиция, id, команда) - команда удалена;
+    ('replace', id, прежняя команда, новая команда) - команда заменена;
+    ('move', список id, их прежние позиции, новая позиция) - строки перенесены подряд на новую позицию;
+    ('unmove', список id, прежние позиции, новая позиция) - обратная переносу: строки возвращены на места;
+    ('load', прежний скрипт, новый скрипт) - скрипт заменен целиком, скрипт - список пар (id, команда).
+    """
+
+    def __init__(self):
+        self.steps = []  # Шаги: {'ops', 'selected', 'settings', 'size'}
+        self.pointer = -1  # Текущее состояние - после шага с этим индексом
+        self.pending = []  # Операции, еще не записанные в шаг
+        self.applying = False  # Выполняется отмена или возврат, операции не записываются
+        self.settings = None  # Настройки скрипта после последнего шага
+        self.size = 0  # Примерный объем истории в байтах
+
+    def record(self, op):
+        """ Наблюдатель изменений скрипта: запоминает операцию до конца шага """
+        if not self.applying:
+            self.pending.append(op)
+
+    def commit(self, selected, sett):
+        """ Завершение шага истории
+
+        Принимает номера выделенных строк и текущие настройки скрипта. Отмененные шаги
+        (которые можно было вернуть) удаляются. Шаг без изменений не записывается.
+        """
+        changed = self.settings is None or self.compare(self.settings) != self.compare(sett)
+        if not self.pending and not changed and self.steps:
+            self.steps[self.pointer]['selected'] = selected  # Изменилось только выделение
+            return
+        for step in self.steps[self.pointer + 1:]:
+            self.size -= step['size']
+        del self.steps[self.pointer + 1:]
+
+        step = {'ops': self.pending, 'selected': selected,
+                'settings': (self.settings, dict(sett)) if changed else None}
+        step['size'] = self.step_size(step)
+        self.steps.append(step)
+        self.size += step['size']
+        self.pending = []
+        self.settings = dict(sett)
+
+        while len(self.steps) > 1 and self.size > settings.history_limit:
+            self.size -= self.steps.pop(0)['size']  # Самое старое состояние больше не вернуть
+        self.pointer = len(self.steps) - 1
+
+    def can_undo(self) -> bool:
+        return self.pointer > 0
+
+    def can_redo(self) -> bool:
+        return self.pointer < len(self.steps) - 1
+
+    def undo(self, data):
+        """ Отмена шага, возвращает настройки и выделение предыдущего состояния """
+        step = self.steps[self.pointer]
+        self.applying = True
+        try:
+            for op in reversed(step['ops']):
+                self.apply(data, self.inverse(op))
+        finally:
+            self.applying = False
+        self.pointer -= 1
+        if step['settings']:
+            self.settings = step['settings'][0]
+        return (step['settings'][0] if step['settings'] else None), self.steps[self.pointer]['selected']
+
+    def redo(self, data):
+        """ Повтор отмененного шага, возвращает настройки и выделение нового состояния """
+        self.pointer += 1
+        step = self.steps[self.pointer]
+        self.applying = True
+        try:
+            for op in step['ops']:
+                self.apply(data, op)
+        finally:
+            self.applying = False
+        if step['settings']:
+            self.settings = step['settings'][1]
+        return (step['settings'][1] if step['settings'] else None), step['selected']
+
+    @staticmethod
+    def inverse(op):
+        """ Обратная операция """
+        kind = op[0]
+        if kind == 'insert':
+            return ('delete',) + op[1:]
+        if kind == 'delete':
+            return ('insert',) + op[1:]
+        if kind == 'replace':
+            return 'replace', op[1], op[3], op[2]
+        if kind == 'move':
+            return ('unmove',) + op[1:]
+        if kind == 'unmove':
+            return ('move',) + op[1:]
+        return 'load', op[2], op[1]
+
+    @staticmethod
+    def apply(data, op):
+        """ Выполнение операции над скриптом """
+        kind = op[0]
+        if kind == 'insert':
+            data.insert_command(op[1], op[2], op[3])
+        elif kind == 'delete':
+            data.del_command(op[2])
+        elif kind == 'replace':
+            data.replace_command(op[1], op[3])
+        elif kind == 'move':
+            data.move_commands(op[1], op[3])
+        elif kind == 'unmove':
+            data.unmove_commands(op[1], op[2])
+        else:
+            data.load_commands([obj for key, obj in op[2]], keys=[key for key, obj in op[2]])
+
+    @staticmethod
+    def compare(sett) -> dict:
+        """ Настройки в виде, пригодном для сравнения (eres и llist сравниваются по строке) """
+        return {key: str(value) for key, value in sett.items()}
+
+    @staticmethod
+    def step_size(step) -> int:
+        """ Примерный объем шага в байтах: команды оцениваются по их краткой записи """
+        def command_size(obj):
+            return sys.getsizeof(obj) + len(json.dumps(obj.command_to_dict(), default=str, ensure_ascii=False))
+
+        size = sys.getsizeof(step['ops']) + 200
+        for op in step['ops']:
+            if op[0] == 'load':
+                size += sum(command_size(obj) for key, obj in op[1] + op[2])
+            elif op[0] == 'replace':
+                size += command_size(op[2]) + command_size(op[3])
+            elif op[0] in ('insert', 'delete'):
+                size += command_size(op[3])
+            size += 100  # Сам кортеж операции
+        if step['settings']:
+            size += 2 * len(json.dumps(History.compare(step['settings'][1]), ensure_ascii=False))
+        return size
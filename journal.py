@@ -0,0 +1,271 @@
+# ---------------------------------------------------------------------------
+# Журнал правок проекта (автосохранение)
+# Между сохранениями проекта правки скрипта (операции DataForWorker, см. history.History)
+# и изменения настроек каждые несколько секунд дописываются в конец файла журнала
+# <имя проекта>.journal в папке проекта. Дописывается только то, что изменилось, поэтому
+# автосохранение не зависит от длины скрипта. Команды в журнале указываются позициями в очереди.
+# Когда журнал становится длинным, он сжимается в фоновом потоке: текущий скрипт записывается
+# снимком <имя проекта>.autosave.swd, а в журнале остаются только правки после снимка.
+# Записи журнала пронумерованы от сохранения проекта. Снимок помнит, сколько записей он уже
+# содержит, а журнал - номер своей первой записи, поэтому при сбое на любом шаге сжатия
+# снимок и журнал вместе дают одно и то же состояние.
+# Журнал и снимок относятся к сохраненному файлу проекта с тем же save_id. При открытии проекта
+# в редакторе несохраненные правки восстанавливаются, сохранение проекта удаляет журнал и снимок.
+# ---------------------------------------------------------------------------
+import os
+import json
+import logging
+import threading
+from collections import deque
+
+import project_file
+from commands import CommandClasses
+from settings import settings
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, default=lambda o: o.__json__(), ensure_ascii=False, separators=(',', ':'))
+
+
+class Journal:
+    """ Журнал правок скрипта между сохранениями проекта
+
+    Принимает объект с данными о скрипте. Записи журнала (списки):
+    ['insert', позиция, команда], ['delete', позиция], ['replace', позиция, команда],
+    ['move', прежние позиции, новая позиция], ['unmove', прежние позиции, позиция перед возвратом],
+    ['load', скрипт], ['settings', настройки]. Команда - краткая запись (command_to_dict).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.lock = threading.Lock()  # Запись файла журнала: автосохранение и сжатие
+        self.base = None  # save_id файла проекта, к которому относятся правки. None - журнал не ведется
+        self.pending = deque()  # Записи, еще не добавленные в файл (добавляются и из потока записи действий)
+        self.count = 0  # Номер следующей записи, от сохранения проекта
+        self.in_file = 0  # Сколько записей в файле журнала
+        self.settings = ''  # Настройки, записанные последними (json)
+        self.applying = False  # Выполняется восстановление, правки не записываются
+        self.compacting = None  # Поток сжатия журнала
+
+    @staticmethod
+    def paths(folder=None, name=None):
+        """ Пути к файлам журнала и снимка проекта (по умолчанию текущего) """
+        folder = folder or settings.path_to_script
+        name = name or settings.project_name
+        return os.path.join(folder, f'{name}.journal'), os.path.join(folder, f'{name}.autosave{project_file.COMPACT}')
+
+    def record(self, op):
+        """ Наблюдатель изменений скрипта: запоминает правку до ближайшего автосохранения """
+        if self.applying or self.base is None:
+            return
+        kind = op[0]
+        if kind == 'insert':
+            self.pending.append(['insert', op[1], op[3].command_to_dict()])
+        elif kind == 'delete':
+            self.pending.append(['delete', op[1]])
+        elif kind == 'replace':
+            self.pending.append(['replace', self.data.queue_command.index(op[1]), op[3].command_to_dict()])
+        elif kind in ('move', 'unmove'):
+            self.pending.append([kind, op[2], op[3]])
+        else:
+            self.pending.append(['load', [obj.command_to_dict() for key, obj in op[2]]])
+
+    def open(self, base, recover=None):
+        """ Начало журнала проекта после его загрузки
+
+        Принимает save_id загруженного файла и, для восстановления правок, объект сохранения
+        и загрузки (SaveLoad). Возвращает число восстановленных правок.
+        Без восстановления журнал ведется, только если от прошлых запусков ничего не осталось
+        (оставшиеся правки восстановятся при открытии проекта в редакторе).
+        """
+        self.stop()
+        self.settings = _dumps(settings.get_dict_settings())
+        journal, snapshot = self.paths()
+        if recover is None:
+            if not os.path.exists(journal) and not os.path.exists(snapshot):
+                self.count = self.in_file = 0
+                self.base = base
+            return 0
+
+        try:
+            self.applying = True
+            recovered = self.recover(base, recover)
+        except Exception as err:
+            logger.error(f'Не удалось восстановить несохраненные правки. {err}')
+            recovered = 0
+        finally:
+            self.applying = False
+        if not recovered:
+            self.remove()
+            self.count = self.in_file = 0
+        self.base = base
+        return recovered
+
+    def recover(self, base, save_load) -> int:
+        """ Восстановление правок из снимка и журнала, возвращает число восстановленных правок """
+        journal, snapshot = self.paths()
+        number = 0  # Сколько правок уже содержит снимок
+        recovered = 0
+        if os.path.exists(snapshot):
+            project = project_file.read(snapshot)
+            if project.get('base') != base:
+                return 0  # Снимок от другого сохранения проекта
+            save_load.change_script_and_settings(project)
+            number = recovered = project['journal']
+
+        self.count = self.in_file = 0
+        if os.path.exists(journal):
+            with open(journal, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            header = json.loads(lines[0])
+            if header['base'] != base or header['start'] > number:
+                return 0  # Журнал от другого сохранения или в нем не хватает правок
+            self.count = header['start']
+            for line in lines[1:]:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Последняя запись оборвана сбоем, убираем ее, чтобы дописывать журнал после целых записей
+                    project_file.replace(journal, '\n'.join(lines[:1 + self.in_file] + ['']).encode('utf-8'))
+                    break
+                if self.count >= number:
+                    self.apply(record, save_load)
+                    recovered += 1
+                self.count += 1
+                self.in_file += 1
+        self.count = max(self.count, number)
+        return recovered
+
+    def apply(self, record, save_load):
+        """ Выполнение записи журнала над скриптом """
+        kind, queue = record[0], self.data.queue_command
+
+        def create(cmd):
+            return CommandClasses.create_command(*cmd['val'], command=cmd['cmd'], description=cmd['des'])
+
+        if kind == 'insert':
+            self.data.insert_command(record[1], self.data.next_id(), create(record[2]))
+        elif kind == 'delete':
+            self.data.del_command(queue[record[1]])
+        elif kind == 'replace':
+            self.data.replace_command(queue[record[1]], create(record[2]))
+        elif kind == 'move':
+            self.data.move_commands([queue[position] for position in record[1]], record[2])
+        elif kind == 'unmove':
+            self.data.unmove_commands(queue[record[2]:record[2] + len(record[1])], record[1])
+        elif kind == 'load':
+            save_load.change_script_and_settings({'script': record[1], 'settings': settings.get_dict_settings()})
+        elif kind == 'settings':
+            settings.set_settings_from_dict(record[1])
+
+    def flush(self):
+        """ Автосохранение: накопленные правки дописываются в конец журнала
+
+        Если журнал стал длиннее settings.journal_limit записей, запускается его сжатие.
+        """
+        if self.base is None:
+            return
+        sett = _dumps(settings.get_dict_settings())
+        if sett != self.settings:
+            self.settings = sett
+            self.pending.append(['settings', json.loads(sett)])
+        if self.write_pending() and self.in_file > settings.journal_limit:
+            self.compact()
+
+    def write_pending(self) -> bool:
+        """ Накопленные правки дописываются в конец файла журнала, возвращает False при ошибке записи """
+        records = [self.pending.popleft() for _ in range(len(self.pending))]
+        if not records:
+            return True
+
+        journal = self.paths()[0]
+        try:
+            with self.lock:
+                new = not os.path.exists(journal)
+                with open(journal, 'a', encoding='utf-8') as f:
+                    if new:
+                        f.write(_dumps({'base': self.base, 'start': self.count}) + '\n')
+                        self.in_file = 0
+                    f.write(''.join(_dumps(record) + '\n' for record in records))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.count += len(records)
+                self.in_file += len(records)
+        except OSError as err:
+            logger.error(f'Не удалось записать журнал правок. {err}')
+            return False
+        return True
+
+    def compact(self):
+        """ Сжатие журнала в фоновом потоке
+
+        Снимок скрипта берется сразу (объекты команд в скрипте не меняются на месте),
+        краткая запись команд, запись снимка и журнала выполняются в потоке.
+        Снимок и число записей, которые он содержит, берутся под блокировкой правок скрипта
+        (data.edit_lock): правки, успевшие попасть в pending, сначала дописываются в журнал,
+        а новая правка из потока записи действий не может попасть между ними.
+        """
+        if self.compacting and self.compacting.is_alive():
+            return
+        with self.data.edit_lock:
+            if not self.write_pending():
+                return
+            objects = [self.data.obj_command[key] for key in self.data.queue_command]
+            project = {'settings': json.loads(self.settings), 'base': self.base, 'journal': self.count}
+        journal, snapshot = self.paths()
+
+        def run():
+            try:
+                project['script'] = [obj.command_to_dict() for obj in objects]
+                project_file.write(snapshot, project)
+                with self.lock:
+                    # В журнале оставляем правки, сделанные после снимка
+                    with open(journal, encoding='utf-8') as f:
+                        lines = f.read().splitlines()
+                    start = json.loads(lines[0])['start']
+                    lines = lines[1 + project['journal'] - start:]
+                    header = _dumps({'base': project['base'], 'start': project['journal']})
+                    project_file.replace(journal, '\n'.join([header] + lines + ['']).encode('utf-8'))
+                    self.in_file = len(lines)
+            except (OSError, ValueError, IndexError) as err:
+                logger.error(f'Не удалось сжать журнал правок. {err}')
+
+        self.compacting = threading.Thread(target=run, name='journal', daemon=True)
+        self.compacting.start()
+
+    def stop(self):
+        """ Журнал больше не ведется (проект закрывается), фоновое сжатие дожидается окончания """
+        if self.compacting:
+            self.compacting.join()
+            self.compacting = None
+        self.base = None
+        self.pending.clear()
+
+    def remove(self):
+        """ Удаление файлов журнала и снимка текущего проекта """
+        for path in self.paths():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def saved(self, base):
+        """ Проект сохранен целиком с новым save_id: журнал начинается заново """
+        self.stop()
+        self.remove()
+        self.count = self.in_file = 0
+        self.settings = _dumps(settings.get_dict_settings())
+        self.base = base
+
+    def discard(self):
+        """ Отказ от несохраненных правок: журнал и снимок удаляются """
+        self.stop()
+        self.remove()
+
+    def rename(self, old_name, new_name):
+        """ Переименование файлов журнала вместе с проектом """
+        for old, new in zip(self.paths(name=old_name), self.paths(name=new_name)):
+            if os.path.exists(old):
+                os.rename(old, new)
@@ -0,0 +1,148 @@
+# ---------------------------------------------------------------------------
+# Библиотеки подпрограмм
+# Команда Подпрограмма (IncludeCmd) выполняет блок команд (от Блок до Конец блока) из другого
+# проекта той же рабочей папки. Общие последовательности (вход в систему, открытие отчета, выгрузка)
+# записываются один раз в проекте-библиотеке, исправление в нем действует во всех проектах,
+# команды и изображения элементов не копируются.
+# Блок компилируется один раз: из файла проекта создаются объекты команд блока, имена изображений
+# заменяются полными путями в папке изображений библиотеки, проверяются команды и циклы блока.
+# Скомпилированные блоки хранятся в кэше процесса (libraries) и общие для всех проектов, которые
+# выполняются в этом процессе (в том числе в сервисе --daemon). Шаблоны изображений блока читаются
+# в общий кэш element_images.templates по полным путям. Если файл проекта-библиотеки изменился,
+# блок компилируется заново при следующем вызове.
+# Блок библиотеки не знает меток вызывающих проектов, поэтому в нем нельзя метки, блоки,
+# переходы (Выполнить) и реакции на ошибки с переходом к метке.
+# ---------------------------------------------------------------------------
+import os
+import threading
+
+import project_file
+from exceptions import LoadError
+from settings import settings
+
+FORBIDDEN = ('LabelCmd', 'BlockCmd', 'RunCmd')  # Команды, которым нужны метки проекта
+CYCLE_START = ('CycleCmd', 'CycleForField')
+FIELD_COMMANDS = ('WriteDataFromField', 'CycleForField', 'NextElementField')  # Зависят от источника данных
+MOUSE_COMMANDS = ('MouseClickRight', 'MouseClickLeft', 'MouseClickDouble', 'CheckImage')
+
+
+class Program:
+    """ Скомпилированный блок библиотеки
+
+    Объекты команд блока в порядке выполнения, файл проекта и время его изменения, имена полей
+    источника данных, с которыми созданы команды полей (None, если их в блоке нет).
+    """
+    __slots__ = ('commands', 'path', 'mtime', 'fields')
+
+    def __init__(self, commands, path, mtime, fields):
+        self.commands = commands
+        self.path = path
+        self.mtime = mtime
+        self.fields = fields
+
+
+class LibraryCache:
+    """ Кэш скомпилированных блоков библиотек, один на процесс """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # Блоки запрашивают и редактор, и поток выполнения скрипта
+        self.programs = dict()  # (путь к файлу проекта, имя блока) -> Program
+        self.names = dict()  # Путь к файлу проекта -> (время изменения, имена блоков)
+
+    @staticmethod
+    def projects() -> list:
+        """ Имена проектов рабочей папки, у которых есть файл скрипта """
+        try:
+            names = sorted(os.listdir(settings.work_dir))
+        except OSError:
+            return []
+        return [name for name in names if project_file.script_path(os.path.join(settings.work_dir, name), name)]
+
+    @staticmethod
+    def script(project):
+        """ Путь к файлу скрипта проекта рабочей папки и время его изменения """
+        path = project_file.script_path(os.path.join(settings.work_dir, project), project)
+        if not path:
+            raise LoadError(f'В рабочей папке нет проекта "{project}".')
+        return path, os.path.getmtime(path)
+
+    def blocks(self, project) -> list:
+        """ Имена блоков проекта (для выбора в редакторе) """
+        try:
+            path, mtime = self.script(project)
+            cached = self.names.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            script = project_file.read(path).get('script', [])
+        except (LoadError, OSError, ValueError):
+            return []
+        names = [str(cmd['val'][0]) for cmd in script if cmd['cmd'] == 'BlockCmd']
+        self.names[path] = (mtime, names)
+        return names
+
+    def get(self, project, block, data) -> Program:
+        """ Скомпилированный блок, при первом вызове или после изменения файла библиотеки - компиляция
+
+        Принимает имя проекта рабочей папки, имя блока и объект с данными о скрипте (источник данных).
+        Ошибки чтения и компиляции - LoadError.
+        """
+        path, mtime = self.script(project)
+        fields = tuple(data.data_source) if data.data_source else ()
+        with self.lock:
+            program = self.programs.get((path, block))
+            if program and program.mtime == mtime and program.fields in (None, fields):
+                return program
+            program = self.programs[(path, block)] = self.compile(path, mtime, block, fields)
+        return program
+
+    @staticmethod
+    def compile(path, mtime, block, fields) -> Program:
+        """ Компиляция блока из файла проекта-библиотеки """
+        from commands import CommandClasses  # commands импортирует этот модуль
+        from executor import executor
+
+        try:
+            script = project_file.read(path)['script']
+        except (OSError, ValueError, KeyError) as err:
+            raise LoadError(f'Не удалось прочитать проект-библиотеку. {err}')
+        starts = [i for i, cmd in enumerate(script) if cmd['cmd'] == 'BlockCmd' and str(cmd['val'][0]) == block]
+        if not starts:
+            raise LoadError(f'В проекте-библиотеке нет блока "{block}".')
+        body = []
+        for cmd in script[starts[0] + 1:]:
+            if cmd['cmd'] == 'BlockEnd':
+                break
+            body.append(cmd)
+        else:
+            raise LoadError(f'У блока "{block}" нет команды Конец блока.')
+
+        elements = os.path.join(os.path.dirname(path), settings.elements_folder)
+        commands, depth, uses_fields = [], 0, False
+        for number, cmd in enumerate(body, 1):
+            name, val = cmd['cmd'], list(cmd['val'])
+            place = f'Блок "{block}", команда {number}'
+            if name in FORBIDDEN:
+                raise LoadError(f'{place}: в блоке библиотеки нельзя метки, блоки и переходы.')
+            if name in MOUSE_COMMANDS and len(val) > 9 and not val[3]:
+                val[9] = ''  # Без локальных настроек реакция берется из настроек выполняемого скрипта
+            if name in ('ErrorNoElement', 'ErrorNoData') and str(val[0]).startswith('run:') or \
+                    name in MOUSE_COMMANDS and len(val) > 9 and str(val[9]).startswith('run:'):
+                raise LoadError(f'{place}: в блоке библиотеки нельзя переход к метке при ошибке.')
+            depth += name in CYCLE_START
+            depth -= name == 'CycleEnd'
+            if depth < 0:
+                raise LoadError(f'{place}: конец цикла без начала.')
+            uses_fields = uses_fields or name in FIELD_COMMANDS
+            if name in MOUSE_COMMANDS and len(val) > 2 and val[2]:
+                val[2] = os.path.join(elements, val[2])  # Изображение ищется в папке библиотеки
+                executor.prefetch_pool.submit(executor.preload, val[2])  # Шаблон читается в общий кэш заранее
+            try:
+                commands.append(CommandClasses.create_command(*val, command=name, description=cmd['des']))
+            except (ValueError, TypeError, KeyError) as err:
+                raise LoadError(f'{place}: {err}')
+        if depth:
+            raise LoadError(f'В блоке "{block}" цикл без команды Конец цикла.')
+        return Program(commands, path, mtime, fields if uses_fields else None)
+
+
+libraries = LibraryCache()  # Кэш блоков библиотек
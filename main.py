@@ -22,13 +22,25 @@
 Он передается методам объектов команд.
 
 """
+import time
+START = time.perf_counter()  # Начало запуска программы (для замера --bench-startup)
+
 import os
+import sys
+
+import daemon
+# Если запущен сервис (main.py --daemon), передаем ему запуск, не загружая тяжелые модули
+if __name__ == '__main__' and daemon.forward(sys.argv[1:]):
+    sys.exit()
+
+import threading
 from tkinter import *
 from tkinter import messagebox
 from tktooltip import ToolTip
 import logging
 import subprocess
 import argparse
+import json
 import webbrowser
 
 import components
@@ -36,10 +48,16 @@ from settings import settings
 from commands import CommandClasses
 from components import Editor, DisplayCommands, SaveLoad, data
 from tracker_and_player import Tracker, Player
-from exceptions import NoCommandOrStop, DataError, TemplateNotFoundError, ElementNotFound
+from exceptions import NoCommandOrStop, DataError, TemplateNotFoundError, ElementNotFound, BatchError
 from messages import Messages
 from define_platform import system
 from quick_start import dialog_quick_start, project_manager, ProjectList
+from batch_runner import RunReport, run_batch
+from profiler import profiler
+from checkpoint import checkpoint
+from watchdog import watchdog
+
+IMPORTED = time.perf_counter()  # Модули программы загружены
 
 
 def on_closing():
@@ -54,8 +72,13 @@ def on_closing():
             save_load.save_project()
         elif result is None:
             return
+        else:
+            save_load.journal.discard()  # Несохраненные правки больше не нужны
 
     settings.config_file(action='set', name=settings.project_name, path=settings.path_to_project)
+    if settings.daemon_mode:
+        root.withdraw()  # Сервис продолжает работать, скрываем только окно редактора
+        return
     root.destroy()
 
 
@@ -106,14 +129,15 @@ def run_script():
         data.pointer_command = 0
     while data.script_started:
         try:
-            children = display_commands.tree.get_children()
-            if len(children) <= data.pointer_command+1:
+            if len(data.queue_command) <= data.pointer_command:
+                data.finished = True
                 raise NoCommandOrStop('Нет команд для выполнения.')
-            display_commands.tree.selection_set(children[data.pointer_command + 1])  # Выделяем строку
+            display_commands.show_line(data.pointer_command + 1)  # Выделяем строку
             settings.pointer_command = data.pointer_command + 1
             data.run_command()  # Выполнить следующую в очереди команду
         except NoCommandOrStop as err:
-            logger.error(err)
+            # Конец списка команд - не ошибка, в отчет о выполнении попадает как предупреждение
+            (logger.warning if data.finished else logger.error)(err)
             data.script_started = False
             tracker.reset_kb()  # Сбросить клавиатуру
         except (DataError, TemplateNotFoundError, ElementNotFound) as err:
@@ -121,15 +145,23 @@ def run_script():
         except:
             data.script_started = False
             tracker.reset_kb()  # Сбросить клавиатуру
+            profiler.finish()
+            watchdog.finish()
             raise
 
+    profiler.finish()  # Сохранение результатов профилирования, если оно включено
+    watchdog.finish()  # Контроль времени больше не нужен
     return
 
-def run(project, file):
+def run(project, file, report=None, resume=False, speed=None):
     """ Запуск скрипта без окон. Ожидание завершения и закрытие программы
 
     Получает параметры для запуска скрипта. Загружает, сапрячет основное окно,
     выполняет скрипт, закрывает программу.
+    Если указан файл отчета, скрипт выполняется без диалогов, а по завершении в файл записывается отчет
+    (так работают исполнители пакетного выполнения).
+    Если resume, то выполнение продолжается с последней точки восстановления.
+    speed - скорость воспроизведения, заменяет настройку скрипта.
     """
     def check_work():
         """ Функция вызывая себя через промежутки времени,
@@ -137,13 +169,99 @@ def run(project, file):
         if settings.script_started:
             root.after(500, check_work)
         else:
+            if run_report:
+                run_report.save(data)  # Запись отчета
             root.destroy()  # Закрытие программы
             # exit()
 
+    run_report = None
+    if report:
+        run_report = RunReport(report)
+        logger.addHandler(run_report)
+        data.unattended = True  # Диалоги выводить некому
+        settings.run_from = 3  # Исполнитель не должен менять файл конфигурации редактора
+
     root.withdraw()  # Скрыть окно программы
-    player.load_and_run(path=project, data_source=file)  # Запускаем скрипт передавая путь к нему и источник данных
+    player.load_and_run(path=project, data_source=file, resume=resume, speed=speed)  # Запускаем скрипт передавая путь к нему и источник данных
     check_work()  # Ожидаем завершения программы
 
+def run_args(values, cwd=None):
+    """ Путь к проекту и имя файла данных из аргументов ключа --run
+
+    Аргументы - путь к проекту и файл данных (не обязательно) или цифровой код проекта.
+    cwd - папка, от которой отсчитывается относительный путь (папка клиента сервиса).
+    """
+    project = values[0]
+    file = values[1] if len(values) == 2 else ''
+    if len(values) == 1 and project.isdigit():
+        # Если аргумент 1 и это число, то это код проекта, получаем путь к проекту по коду и файл данных
+        projects = ProjectList(read_only=True)
+        projects.project_activation_by_number(values[0])
+        project = projects.get_path_to_project()
+        file = projects.active_file
+    elif cwd:
+        # Путь к проекту задан относительно папки, из которой запущен клиент, а не папки сервиса
+        project = os.path.join(cwd, project)
+    return project, file
+
+
+run_lock = threading.Lock()  # Сервис выполняет только один скрипт одновременно
+
+
+def daemon_request(message):
+    """ Обработка запроса к сервису от другого запуска программы
+
+    Выполняется в потоке сервиса, работа с окнами передается в главный поток.
+    Для запроса на выполнение скрипта ответ отправляется после его завершения.
+    """
+    if message['cmd'] == 'quick_start':
+        root.after(0, lambda: dialog_quick_start(
+            root, player.load_and_run, save_load.load_old_project, save_load.open_project))
+        return {'status': 'ok'}
+
+    if message['cmd'] == 'shutdown':
+        root.after(0, root.destroy)
+        return {'status': 'ok'}
+
+    if message['cmd'] != 'run':
+        return {'status': 'error', 'message': f'Неизвестный запрос {message["cmd"]}.'}
+
+    try:
+        args = parser.parse_args(message['argv'])
+    except SystemExit:
+        return {'status': 'error', 'message': 'Неверные аргументы запуска.'}
+    if data.script_started or data.is_listening:
+        return {'status': 'busy', 'message': 'В окне сервиса выполняется или записывается скрипт.'}
+    if not settings.is_saved:
+        return {'status': 'busy', 'message': 'В окне сервиса есть несохраненные изменения проекта.'}
+    if not run_lock.acquire(blocking=False):
+        return {'status': 'busy', 'message': 'Сервис уже выполняет скрипт.'}
+    try:
+        project, file = run_args(args.run, message.get('cwd'))
+        run_report = RunReport(None)
+        logger.addHandler(run_report)
+        loaded = threading.Event()
+
+        def start():
+            """ Загрузка проекта и запуск скрипта в главном потоке """
+            player.thread = None
+            try:
+                player.load_and_run(path=project, data_source=file, resume=args.resume, speed=args.speed)
+            except Exception as err:
+                logger.error(err)
+            finally:
+                loaded.set()
+
+        root.after(0, start)
+        loaded.wait()
+        if player.thread:
+            player.thread.join()  # Ожидание завершения скрипта
+        logger.removeHandler(run_report)
+        return {'status': 'finished', **run_report.result(data)}
+    finally:
+        run_lock.release()
+
+
 def open_file_explorer(path, file=None):
     """ Открыть папку в проводнике или файл в приложении по умолчанию """
     if data.script_started or data.is_listening:
@@ -179,6 +297,24 @@ def minimize_window_on_recording_change():
         menu_options.entryconfigure(8, label="Свернуть окно при записи: Да")
     settings.config_file(action='set', minimize_window=settings.minimize_window_on_recording)
 
+
+def compact_projects_change():
+    """ Изменение формата сохранения проектов через меню """
+    if settings.compact_projects:
+        settings.compact_projects = ''
+        menu_options.entryconfigure(13, label="Компактный формат проектов: Нет")
+    else:
+        settings.compact_projects = 'yes'
+        menu_options.entryconfigure(13, label="Компактный формат проектов: Да")
+    settings.config_file(action='set', compact=settings.compact_projects)
+
+
+def profiler_change():
+    """ Включение и выключение профилирования выполнения скрипта через меню """
+    profiler.enabled = not profiler.enabled
+    onoff = 'Включено' if profiler.enabled else 'Выключено'
+    menu_options.entryconfigure(10, label=f"Профилирование: {onoff}")
+
 # создание логгера и обработчика
 logger = logging.getLogger('logger')
 logger.setLevel(logging.DEBUG)
@@ -224,6 +360,7 @@ SaveLoad.editor = editor  # Передаем ссылку на редактор
 SaveLoad.display_commands = display_commands  # Передаем ссылку на список команд
 SaveLoad.data_source = data_source  # Передаем ссылку на источник данных
 player.data_source = data_source  # Передаем ссылку на источник данных
+checkpoint.data_source = data_source  # Передаем ссылку на источник данных
 
 save_load = SaveLoad(root)
 
@@ -242,8 +379,11 @@ filemenu.add_command(label="Открыть проект", command=save_load.menu
 filemenu.add_command(label="Сохранить проект", command=save_load.menu_save_project)
 filemenu.add_command(label="Сохранить проект как...", command=save_load.menu_save_as_project)
 filemenu.add_command(label="Переименовать проект", command=save_load.rename_project)
+filemenu.add_command(label="Экспорт в json...", command=save_load.menu_export_json)
+filemenu.add_command(label="Импорт из json...", command=save_load.menu_import_json)
 filemenu.add_separator()
 filemenu.add_command(label="Удалить лишние изображения", command=editor.menu_delete_images)
+filemenu.add_command(label="Оптимизировать скрипт", command=display_commands.optimize)
 filemenu.add_command(label="Просмотр изображений", command=lambda: open_file_explorer(settings.path_to_elements))
 filemenu.add_separator()
 filemenu.add_command(label="Выход", command=on_closing)
@@ -273,12 +413,20 @@ menu_options.add_command(label=f"Режим разработчика: {onoff}",
 menu_options.add_separator()
 onoff = 'Да' if settings.minimize_window_on_recording else 'Нет'
 menu_options.add_command(label=f"Свернуть окно при записи: {onoff}", command=minimize_window_on_recording_change)
+menu_options.add_separator()
+menu_options.add_command(label="Профилирование: Выключено", command=profiler_change)
+menu_options.add_command(label="Самые медленные строки", command=lambda: profiler.show_window_slowest(
+    root, display_commands.select_line))
+menu_options.add_separator()
+onoff = 'Да' if settings.compact_projects else 'Нет'
+menu_options.add_command(label=f"Компактный формат проектов: {onoff}", command=compact_projects_change)
 mainmenu.add_cascade(label="Опции", menu=menu_options)
 
 mainmenu.add_command(label="Настройки скрипта",
                      command=lambda root=root, w=w, h=h: settings.show_window_settings(root, w, h))
 mainmenu.add_command(label="Менеджер проектов", command=lambda: project_manager(
     root, player.load_and_run, save_load.load_old_project, save_load.open_project))
+mainmenu.add_command(label="Поиск", command=display_commands.menu_search)
 # Пункт меню Справка со ссылкой на документацию
 mainmenu.add_command(label="Справка", command=lambda: webbrowser.open_new_tab(
     'https://docs.google.com/document/d/1EG9BfxyQhN1i7vmblNY7w_wCkJSiApSfPphHcrab0bk/edit?usp=sharing'))
@@ -317,6 +465,25 @@ parser.add_argument('-r', '--run', nargs='+', metavar=('<Project>', '<File>'), h
                                           '--run C:\Scripts\Script_1 data.xlsx\n'
                                           'Для запуска скрипта из текущей рабочей папки\nможно указать 1 аргумент - '
                                           'цифровой код проекта.\nПример: --run 0101')
+parser.add_argument('--resume', action='store_true', help='Вместе с --run: продолжить выполнение\n'
+                                                          'с последней точки восстановления.')
+parser.add_argument('-s', '--speed', type=float, metavar='<Speed>',
+                    help='Вместе с --run: скорость воспроизведения, например 3 - паузы\n'
+                         'в 3 раза короче. Заменяет настройку скрипта.')
+parser.add_argument('--daemon', action='store_true', help='Запустить программу как сервис. Следующие запуски\n'
+                                                           'быстрого запуска и --run передаются ему.')
+parser.add_argument('--daemon-stop', action='store_true', help='Остановить сервис.')
+parser.add_argument('--report', metavar='<File>', help='Вместе с --run: выполнить скрипт без диалогов\n'
+                                                       'и записать отчет о выполнении в json файл.')
+parser.add_argument('-b', '--batch', nargs=2, metavar=('<Project>', '<File>'),
+                    help='Пакетное выполнение скрипта (только Linux, нужен Xvfb).\n'
+                         'Таблица данных делится на части, каждая выполняется\n'
+                         'отдельным процессом на своем виртуальном дисплее.\n'
+                         'Пример: --batch /home/user/Scripts/Script_1 data.xlsx --workers 4')
+parser.add_argument('-w', '--workers', type=int, default=2, help='Количество исполнителей для --batch.')
+parser.add_argument('--app', metavar='<Command>', help='Вместе с --batch: команда запуска приложения,\n'
+                                                       'с которым работает скрипт, на каждом дисплее.')
+parser.add_argument('--bench-startup', action='store_true', help=argparse.SUPPRESS)  # Замер времени запуска
 
 args = parser.parse_args()  # Получение аргументов командной строки
 
@@ -332,22 +499,53 @@ elif args.editor:
     save_load.load_old_project()  # Загрузка последнего проекта в редакторе
 
 elif args.run:
-    project = args.run[0]
-    file = args.run[1] if len(args.run) == 2 else ''
-    if len(args.run) == 1:
-        # Если аргумент 1, то это код проекта или путь к проекту. Код проекта - это число типа int
-        if project.isdigit():
-            # Если аргумент - число, то это код проекта, получаем путь к проекту по коду и файл данных
-            projects = ProjectList(read_only=True)
-            projects.project_activation_by_number(args.run[0])
-            project = projects.get_path_to_project()
-            file = projects.active_file
-    # Если аргумент - строка, то это путь к проекту. Тут уже только строки
-    run(project, file)  # Запуск скрипта
+    project, file = run_args(args.run)
+    run(project, file, args.report, args.resume, args.speed)  # Запуск скрипта
+
+elif args.daemon:
+    # Сервис: окно скрыто, запросы принимаются через локальный сокет
+    settings.daemon_mode = True
+    daemon_server = daemon.DaemonServer(daemon_request)
+    try:
+        daemon_server.start()
+    except OSError as err:
+        print(err)
+        root.destroy()
+        raise SystemExit
+    root.withdraw()
+
+elif args.daemon_stop:
+    print('Сервис не запущен.')
+    root.destroy()
+    raise SystemExit
+
+elif args.batch:
+    # Пакетное выполнение, окно программы не нужно
+    root.withdraw()
+    try:
+        # Виртуальные дисплеи делаем такими же, как экран, на котором записывался скрипт
+        run_batch(args.batch[0], args.batch[1], workers=args.workers, app=args.app,
+                  screen=f'{root.winfo_screenwidth()}x{root.winfo_screenheight()}x24')
+    except BatchError as err:
+        print(err)
+    root.destroy()
+    raise SystemExit
 
+elif args.bench_startup:
+    # Замер запуска (benchmark.py startup): открываем окно быстрого запуска, дожидаемся его отрисовки,
+    # выводим время в json и завершаемся
+    dialog_quick_start(root, player.load_and_run, save_load.load_old_project, save_load.open_project)
+    root.update()
+    print(json.dumps({'import': round(IMPORTED - START, 3),
+                      'first_window': round(time.perf_counter() - START, 3)}))
+    root.destroy()
+    raise SystemExit
 
 else:
     # Если программа запущена без ключей, то открывается окно быстрого запуска
     dialog_quick_start(root, player.load_and_run, save_load.load_old_project, save_load.open_project)
 
 root.mainloop()
+
+if settings.daemon_mode:
+    daemon_server.close()  # Удаление сокета сервиса
@@ -0,0 +1,176 @@
+# ---------------------------------------------------------------------------
+# Оптимизация скрипта
+# Работает с краткой записью команд {'cmd': 'ClassName', 'val': [параметры], 'des': 'Описание'}
+# и возвращает новый список команд и отчет о проделанной работе.
+# Правила:
+#   серия нажатий печатных клавиш (KeyDown/KeyUp) заменяется одной командой WriteCmd,
+#   соседние команды PauseCmd объединяются, нулевые паузы удаляются,
+#   удаляются пары нажатие/отпускание клавиш-модификаторов, которые ничего не делают.
+# Команды с пользовательским описанием не изменяются и не удаляются.
+# ---------------------------------------------------------------------------
+
+# Клавиши-модификаторы, пока они нажаты нажатия печатных клавиш не объединяются
+MODIFIERS = {'shift', 'shift_r', 'shift_l', 'control', 'ctrl', 'ctrl_r', 'ctrl_l',
+             'alt', 'alt_r', 'alt_gr', 'alt_l', 'cmd'}
+
+# Модификаторы, нажатие и отпускание которых без других клавиш ничего не делает.
+# Alt и Cmd сюда не входят, в Windows они открывают меню.
+NOOP_KEYS = {'shift', 'shift_r', 'shift_l', 'control', 'ctrl', 'ctrl_r', 'ctrl_l'}
+
+
+class OptimizationReport:
+    """ Отчет об оптимизации скрипта """
+
+    def __init__(self, before=0):
+        self.before = before  # Команд до оптимизации
+        self.after = before  # Команд после оптимизации
+        self.texts = 0  # Сколько команд WriteCmd с текстом из нажатий клавиш в итоговом скрипте
+        self.written = dict()  # id -> команды WriteCmd с текстом из нажатий клавиш (все версии, по проходам)
+        self.keys = 0  # Сколько команд нажатия/отпускания клавиш заменено
+        self.pauses = 0  # Сколько пауз объединено или удалено
+        self.noop = 0  # Сколько пустых нажатий модификаторов удалено
+        self.saved_time = 0.0  # Примерная экономия времени выполнения (сек.)
+
+    @property
+    def removed(self):
+        """ Сколько команд удалено """
+        return self.before - self.after
+
+    def __str__(self):
+        if not self.removed:
+            return 'Оптимизация не требуется.'
+        return f'Команд было {self.before}, стало {self.after} (удалено {self.removed}).\n' \
+               f'{self.keys} нажатий клавиш заменено на {self.texts} команд вывода текста, ' \
+               f'объединено пауз {self.pauses}, удалено пустых нажатий {self.noop}.\n' \
+               f'Экономия времени выполнения около {self.saved_time:.2f} сек.'
+
+
+def printable_char(key: str):
+    """ Возвращает символ, который печатает клавиша, или None для специальных клавиш """
+    if key == 'space':
+        return ' '
+    if len(key) == 1 and key.isprintable():
+        return key
+    return None
+
+
+def typed_text(script: list, start: int):
+    """ Поиск серии нажатий печатных клавиш начиная с позиции start
+
+    Серия может содержать перекрывающиеся нажатия (быстрый набор), но должна заканчиваться
+    в момент, когда все нажатые в ней клавиши отпущены.
+    Возвращает набранный текст и позицию за серией, если серии нет - пустую строку и start.
+    """
+    pressed = set()
+    text = ''
+    found_text, found_end = '', start
+    i = start
+    while i < len(script):
+        cmd = script[i]
+        if cmd['des'] or cmd['cmd'] not in ('KeyDown', 'KeyUp'):
+            break
+        key = cmd['val'][0]
+        char = printable_char(key)
+        if char is None:
+            break
+        if cmd['cmd'] == 'KeyDown':
+            if key in pressed:
+                break
+            pressed.add(key)
+            text += char
+        else:
+            if key not in pressed:
+                break
+            pressed.remove(key)
+        i += 1
+        if not pressed:
+            # Все клавиши отпущены, до этого места серию можно заменить
+            found_text, found_end = text, i
+    return found_text, found_end
+
+
+def one_pass(script: list, report: OptimizationReport, key_pause: float) -> list:
+    """ Один проход оптимизации """
+    out = []
+    held = set()  # Нажатые модификаторы
+    i = 0
+    while i < len(script):
+        cmd = script[i]
+        name = cmd['cmd']
+
+        if not held:
+            text, end = typed_text(script, i)
+            if text:
+                if out and out[-1]['cmd'] == 'WriteCmd' and not out[-1]['des']:
+                    # Перед серией уже выводится текст, дописываем к нему
+                    out[-1] = {'cmd': 'WriteCmd', 'val': [out[-1]['val'][0] + text], 'des': ''}
+                else:
+                    out.append({'cmd': 'WriteCmd', 'val': [text], 'des': ''})
+                report.written[id(out[-1])] = out[-1]
+                report.keys += end - i
+                report.saved_time += (end - i) // 2 * key_pause  # Паузы после отпускания клавиш
+                i = end
+                continue
+
+        if name in ('KeyDown', 'KeyUp'):
+            key = cmd['val'][0]
+            if name == 'KeyDown' and key in NOOP_KEYS and not cmd['des'] and i+1 < len(script):
+                nxt = script[i+1]
+                if nxt['cmd'] == 'KeyUp' and nxt['val'][0] == key and not nxt['des']:
+                    report.noop += 2
+                    report.saved_time += key_pause
+                    i += 2
+                    continue
+            if key in MODIFIERS:
+                if name == 'KeyDown':
+                    held.add(key)
+                else:
+                    held.discard(key)
+
+        if name == 'WriteCmd' and not cmd['des'] and out and out[-1]['cmd'] == 'WriteCmd' and not out[-1]['des']:
+            # Два вывода текста подряд
+            merged = {'cmd': 'WriteCmd', 'val': [out[-1]['val'][0] + cmd['val'][0]], 'des': ''}
+            if id(out[-1]) in report.written or id(cmd) in report.written:
+                report.written[id(merged)] = merged
+            out[-1] = merged
+            i += 1
+            continue
+
+        if name == 'PauseCmd' and not cmd['des']:
+            if not float(cmd['val'][0] or 0):
+                report.pauses += 1  # Нулевая пауза
+                i += 1
+                continue
+            if out and out[-1]['cmd'] == 'PauseCmd' and not out[-1]['des']:
+                # Предыдущая команда тоже пауза, прибавляем к ней
+                out[-1] = {'cmd': 'PauseCmd', 'val': [float(out[-1]['val'][0] or 0) + float(cmd['val'][0])],
+                           'des': ''}
+                report.pauses += 1
+                i += 1
+                continue
+
+        out.append(cmd)
+        i += 1
+    return out
+
+
+def optimize_script(script: list, key_pause: float = 0.0, command_pause: float = 0.0):
+    """ Оптимизация скрипта
+
+    Принимает список команд в краткой записи и текущие паузы между нажатиями клавиш и командами
+    (для оценки экономии времени). Проходы повторяются, пока скрипт меняется: удаление пустых
+    нажатий может сделать соседними две паузы или две серии набора текста.
+    Возвращает новый список команд и отчет OptimizationReport.
+    """
+    report = OptimizationReport(len(script))
+    while True:
+        new_script = one_pass(script, report, key_pause)
+        if len(new_script) == len(script):
+            break
+        script = new_script
+    report.after = len(script)
+    # Команды вывода текста считаются по итоговому скрипту: созданные в одном проходе
+    # могут быть объединены в следующем
+    report.texts = sum(1 for cmd in script if id(cmd) in report.written)
+    report.saved_time += report.removed * command_pause
+    return script, report
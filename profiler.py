@@ -0,0 +1,190 @@
+# ---------------------------------------------------------------------------
+# Профилирование выполнения скрипта
+# Включается в меню Опции. Для каждой выполненной команды запоминается время выполнения,
+# разделенное на фазы: захват экрана (capture), сравнение изображений (match),
+# паузы (sleep) и ввод с клавиатуры и мыши (input). Остальное время считается прочим (other).
+# Результат выгружается в формате Chrome Trace (открывается в chrome://tracing или ui.perfetto.dev)
+# и в виде сводной таблицы по строкам скрипта.
+# ---------------------------------------------------------------------------
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from tkinter import *
+from tkinter import ttk
+
+from settings import settings
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+PHASES = ('capture', 'match', 'sleep', 'input')  # Фазы выполнения команды
+PHASE_NAMES = {'capture': 'Захват', 'match': 'Сравнение', 'sleep': 'Паузы', 'input': 'Ввод', 'other': 'Прочее'}
+
+
+class Profiler:
+    """ Профилировщик выполнения скрипта
+
+    Команда выполняется внутри контекста command(), части ее работы - внутри контекстов phase().
+    Фазы могут быть вложенными (захват экрана во время ожидания), время вложенной фазы
+    не учитывается во внешней. Пока профилирование выключено, контексты ничего не делают.
+    """
+    enabled = False  # Профилирование включено пользователем
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Очистка результатов """
+        self.running = False  # Идет выполнение скрипта
+        self.origin = time.perf_counter()  # Начало отсчета времени для трассировки
+        self.events = []  # События для Chrome Trace
+        self.lines = dict()  # Сводные данные по строкам скрипта: номер строки -> словарь
+        self.current = None  # Сводные данные выполняемой сейчас строки
+        self.stack = []  # Стек открытых фаз: [имя, начало, время вложенных фаз]
+
+    def start(self):
+        """ Начало выполнения скрипта """
+        if self.enabled:
+            with self.lock:
+                self.reset()
+                self.running = True
+
+    def finish(self):
+        """ Окончание выполнения скрипта, результаты сохраняются в папку проекта """
+        if not self.running:
+            return
+        self.running = False
+        slowest = self.table()[:1]
+        if slowest:
+            row = slowest[0]
+            logger.warning(f'Профилирование: самая медленная строка {row["line"]} ({row["name"]}), '
+                           f'{row["total"]:.2f} сек. за {row["count"]} выполнений.')
+        try:
+            self.export()
+        except OSError as err:
+            logger.error(f'Не удалось сохранить результаты профилирования. {err}')
+
+    def _event(self, name, cat, start, end, args=None):
+        """ Событие полной длительности для Chrome Trace (время в микросекундах) """
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'ts': round((start - self.origin) * 1e6, 1), 'dur': round((end - start) * 1e6, 1)}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    @contextmanager
+    def command(self, line, obj):
+        """ Контекст выполнения одной команды, принимает номер строки и объект команды """
+        if not self.running:
+            yield
+            return
+        with self.lock:
+            stat = self.lines.setdefault(line, {'line': line, 'name': obj.command_name, 'count': 0, 'total': 0.0,
+                                                'max': 0.0, **dict.fromkeys(PHASES, 0.0)})
+        stat['name'] = obj.command_name  # Команда в строке могла измениться между запусками
+        self.current = stat
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                stat['count'] += 1
+                stat['total'] += end - start
+                stat['max'] = max(stat['max'], end - start)
+                self._event(f'{line}: {obj.command_name}', 'command', start, end,
+                            {'description': obj.description} if obj.description else None)
+            self.current = None
+
+    @contextmanager
+    def phase(self, name):
+        """ Контекст фазы выполнения команды: capture, match, sleep или input """
+        if not self.running:
+            yield
+            return
+        frame = [name, time.perf_counter(), 0.0]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.stack.pop()
+            duration = end - frame[1]
+            if self.stack:
+                self.stack[-1][2] += duration  # Время вложенной фазы не учитывается во внешней
+            with self.lock:
+                if self.current is not None:
+                    self.current[name] += duration - frame[2]
+                self._event(name, 'phase', frame[1], end)
+
+    def table(self) -> list:
+        """ Сводная таблица по строкам скрипта, от самых медленных к быстрым """
+        with self.lock:
+            rows = [dict(stat) for stat in self.lines.values()]
+        for row in rows:
+            row['other'] = max(0.0, row['total'] - sum(row[phase] for phase in PHASES))
+            row['mean'] = row['total'] / row['count'] if row['count'] else 0.0
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def export(self, path=None) -> str:
+        """ Запись трассировки (json) и сводной таблицы (csv), возвращает путь к трассировке """
+        if not path:
+            path = os.path.join(settings.path_to_script, f'profile_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+        with self.lock:
+            trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms',
+                     'otherData': {'project': settings.project_name}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False)
+
+        columns = ['line', 'name', 'count', 'total', 'mean', 'max', *PHASES, 'other']
+        with open(f'{os.path.splitext(path)[0]}.csv', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.table())
+        logger.warning(f'Результаты профилирования сохранены в {path}')
+        return path
+
+    def show_window_slowest(self, root, select_line=None):
+        """ Окно со строками скрипта, которые выполнялись дольше всего
+
+        select_line - функция, которая выделит строку в списке команд редактора (по двойному щелчку).
+        """
+        top = Toplevel(root)
+        top.title('Самые медленные строки скрипта')
+        top.geometry('760x400')
+        top.transient(root)
+
+        columns = ('line', 'name', 'count', 'total', 'mean', *PHASES, 'other')
+        headings = {'line': '№', 'name': 'Команда', 'count': 'Раз', 'total': 'Всего', 'mean': 'Среднее',
+                    **PHASE_NAMES}
+        tree = ttk.Treeview(top, columns=columns, show='headings', height=16)
+        for column in columns:
+            tree.heading(column, text=headings[column])
+            tree.column(column, width=200 if column == 'name' else 60, anchor='w' if column == 'name' else 'e')
+        for row in self.table():
+            tree.insert('', END, values=[row['line'], row['name'], row['count']] +
+                        [f'{row[column]:.3f}' for column in columns[3:]])
+        tree.place(x=10, y=10, width=740, height=340)
+
+        if select_line:
+            def on_double_click(event):
+                selected = tree.selection()
+                if selected:
+                    select_line(int(tree.item(selected[0])['values'][0]))
+            tree.bind('<Double-1>', on_double_click)
+
+        Button(top, text='Сохранить', width=12,
+               command=lambda: self.export() if self.events else None).place(x=530, y=360)
+        Button(top, text='Закрыть', width=12, command=top.destroy).place(x=645, y=360)
+        top.focus_set()
+
+
+profiler = Profiler()  # Создаем объект профилировщика
@@ -0,0 +1,130 @@
+# ---------------------------------------------------------------------------
+# Файл скрипта проекта
+# Скрипт проекта хранится в папке проекта в файле с именем проекта в одном из форматов:
+# - <имя>.json - json с отступами, удобен для правки вручную и сравнения версий;
+# - <имя>.swd  - компактный двоичный формат.
+# Компактный файл:
+#   b'SWDP' | версия (1 байт) | длина заголовка (4 байта) | заголовок | длина таблицы (4 байта) | таблица
+# Заголовок - json с датами, источником данных, настройками, числом команд и списком имен команд.
+# Таблица команд - сжатый zlib json-список строк [номер имени команды в заголовке, описание, параметры...].
+# Для списка проектов (менеджер проектов) читается только заголовок, таблица команд не читается.
+# Файл записывается атомарно: во временный файл рядом, сброс на диск, затем замена старого файла,
+# поэтому при сбое во время записи остается прежний файл целиком.
+# Словарь проекта в обоих форматах один и тот же: script, settings, data_source, saved, updated.
+# ---------------------------------------------------------------------------
+import os
+import json
+import zlib
+import struct
+
+MAGIC = b'SWDP'  # Признак компактного файла
+VERSION = 1  # Версия компактного формата
+JSON = '.json'
+COMPACT = '.swd'
+EXTENSIONS = (JSON, COMPACT)
+
+_prefix = struct.Struct('<4sBI')  # Признак, версия, длина заголовка
+_length = struct.Struct('<I')  # Длина таблицы команд
+
+
+def _dumps(obj, **kwargs) -> str:
+    """ json с объектами настроек (eres, llist) в их краткой записи """
+    return json.dumps(obj, default=lambda o: o.__json__(), ensure_ascii=False, **kwargs)
+
+
+def script_path(folder, name):
+    """ Путь к файлу скрипта проекта name в папке folder или None, если файла нет
+
+    Если есть файлы обоих форматов, берется более новый.
+    """
+    paths = [os.path.join(folder, name + ext) for ext in EXTENSIONS]
+    paths = [path for path in paths if os.path.isfile(path)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def new_path(folder, name, compact) -> str:
+    """ Путь к файлу скрипта в заданном формате """
+    return os.path.join(folder, name + (COMPACT if compact else JSON))
+
+
+def remove_other(path):
+    """ Удаление файла скрипта того же проекта в другом формате (остался от прошлых сохранений) """
+    base, ext = os.path.splitext(path)
+    for other in EXTENSIONS:
+        if other != ext and os.path.isfile(base + other):
+            os.remove(base + other)
+
+
+def replace(path, content: bytes):
+    """ Атомарная запись файла: временный файл, сброс на диск, замена """
+    temp = f'{path}.tmp'
+    try:
+        with open(temp, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def write(path, project: dict):
+    """ Атомарная запись словаря проекта в файл, формат определяется расширением """
+    if not path.endswith(COMPACT):
+        replace(path, _dumps(project, indent=4).encode('utf-8'))
+        return
+
+    script = project.get('script', [])
+    names = list(dict.fromkeys(cmd['cmd'] for cmd in script))  # Имена команд без повторов
+    number = {name: i for i, name in enumerate(names)}
+    header = {key: value for key, value in project.items() if key != 'script'}
+    header['count'] = len(script)
+    header['commands'] = names
+    header = _dumps(header, separators=(',', ':')).encode('utf-8')
+    table = [[number[cmd['cmd']], cmd.get('des', '')] + list(cmd.get('val', [])) for cmd in script]
+    table = zlib.compress(_dumps(table, separators=(',', ':')).encode('utf-8'))
+    replace(path, _prefix.pack(MAGIC, VERSION, len(header)) + header + _length.pack(len(table)) + table)
+
+
+def _read_header(f) -> dict:
+    """ Чтение заголовка компактного файла, файл остается на начале таблицы команд """
+    magic, version, length = _prefix.unpack(f.read(_prefix.size))
+    if magic != MAGIC:
+        raise ValueError('Файл не является скриптом проекта.')
+    if version > VERSION:
+        raise ValueError(f'Файл скрипта записан более новой версией программы (формат {version}).')
+    return json.loads(f.read(length).decode('utf-8'))
+
+
+def read_header(path) -> dict:
+    """ Данные проекта без скрипта: даты, источник данных, настройки
+
+    Из компактного файла читается только заголовок.
+    """
+    if not path.endswith(COMPACT):
+        project = read(path)
+        project.pop('script', None)
+        return project
+    with open(path, 'rb') as f:
+        header = _read_header(f)
+    del header['commands']
+    return header
+
+
+def read(path) -> dict:
+    """ Чтение словаря проекта из файла любого формата """
+    if not path.endswith(COMPACT):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    with open(path, 'rb') as f:
+        project = _read_header(f)
+        length, = _length.unpack(f.read(_length.size))
+        table = json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+    names = project.pop('commands')
+    if len(table) != project.pop('count'):
+        raise ValueError('Файл скрипта поврежден: число команд не совпадает.')
+    project['script'] = [{'cmd': names[row[0]], 'val': row[2:], 'des': row[1]} for row in table]
+    return project
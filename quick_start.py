@@ -6,15 +6,11 @@ from tkinter import messagebox, filedialog
 from tktooltip import ToolTip
 import re
 import os, sys
-from win32com.client import Dispatch
-import winshell
 import json
 import subprocess
-import barcode
-from barcode.writer import ImageWriter
-from PIL import Image
 
 from settings import settings
+import project_file
 from define_platform import system
 
 
@@ -35,7 +31,8 @@ def dialog_quick_start(root, run_script_func, load_old_script_func, open_project
         """ Закрыть программу """
         window.destroy()
         if not open_editor:
-            root.destroy()
+            if not settings.daemon_mode:
+                root.destroy()  # Сервис продолжает работать, закрывается только окно
             return
         load_old_script_func()  # Загрузка последнего редактированного проекта в редактор
         root.deiconify()  # Отобразить окно редактора
@@ -206,9 +203,9 @@ class ProjectList:
         projects_list = []
         for name in os.listdir(settings.work_dir):
             path = os.path.join(settings.work_dir, name)
-            # Папка признается проектом, если содержит json файл с таким же именем,
+            # Папка признается проектом, если содержит файл скрипта с таким же именем,
             # папку с изображениями и папку с данными
-            if os.path.isfile(os.path.join(path, name + ".json")) and \
+            if os.path.isdir(path) and project_file.script_path(path, name) and \
                     os.path.isdir(os.path.join(path, settings.elements_folder)) and \
                     os.path.isdir(os.path.join(path, settings.data_folder)):
                 projects_list.append(name)
@@ -223,11 +220,10 @@ class ProjectList:
         # Собираем новый словарь с описанием проектов из записей прошлого и новых, если их не было
         self.projects_dict = {}
         for name in projects_list:
-            # Считываем скрипт проекта из json файла
+            # Считываем данные проекта из файла скрипта, у компактного файла читается только заголовок
             try:
                 path = os.path.join(settings.work_dir, name)
-                with open(os.path.join(path, name + ".json"), "r", encoding="utf-8") as file:
-                    data = json.load(file)
+                data = project_file.read_header(project_file.script_path(path, name))
 
                 project_code = ""  # Код проекта
                 data_files_dict = {}  # Словарь с именами и кодами файлов данных
@@ -521,7 +517,8 @@ def project_manager(root, run_script_func, load_old_script_func, open_project_fu
         """ Закрыть программу """
         window.destroy()
         if not open_editor:
-            root.destroy()
+            if not settings.daemon_mode:
+                root.destroy()  # Сервис продолжает работать, закрывается только окно
             return
         if projects.only_project is None:
             load_old_script_func()  # Загрузка последнего редактированного проекта в редактор
@@ -624,6 +621,9 @@ def project_manager(root, run_script_func, load_old_script_func, open_project_fu
             filetypes=(("png files", "*.png"), ("all files", "*.*")))
 
         if filename:
+            import barcode  # Загружается только при сохранении штрих-кода
+            from barcode.writer import ImageWriter
+
             ean = barcode.get('ean8', f'{code}0000', writer=ImageWriter())
             ean.save(filename, options={'font_path': 'DejaVuSansMono.ttf'})
 
@@ -631,6 +631,9 @@ def project_manager(root, run_script_func, load_old_script_func, open_project_fu
         """ Создать ярлык на рабочем столе """
         if projects.only_project is None:
             return
+        import winshell  # Модули Windows загружаются только при создании ярлыка
+        from win32com.client import Dispatch
+
         # Получить абсолютный путь к текущему исполняемому файлу
         # если файл exe, то получим путь к нему, если py, то к pythonw.exe
         executable_path = sys.argv[0]
@@ -0,0 +1,201 @@
+# ---------------------------------------------------------------------------
+# Поиск и фильтр команд скрипта
+# Запрос - строка из условий вида имя:значение и слов без имени, например
+#   cmd:MouseClickLeft image:elem_12.png     - щелчки по изображению
+#   cmd:WriteDataFromField field:Телефон     - вывод из поля
+#   cmd:RunCmd label:Вход                    - запуски блока или метки
+#   x:100-200 y:300                          - команды мыши в области экрана
+#   отчет выгрузка                           - слова из текста строки (описание команды)
+# Условия: cmd (класс команды), image, field, label, x, y. Значение с пробелами берется в кавычки:
+# field:"Номер телефона". Значения cmd, image, field, label сравниваются без учета регистра и
+# могут содержать шаблоны * и ?. Все условия должны выполняться.
+# Слово без имени ищется как начало слова в тексте строки списка (при наличии описания - это описание).
+# Поиск не перебирает скрипт: CommandIndex хранит вторичные индексы значение -> id команд и
+# обновляется по операциям DataForWorker (наблюдатель, как история и журнал правок).
+# Координаты хранятся по ячейкам сетки CELL x CELL пикселей, поиск области проверяет только
+# команды из пересекающихся с ней ячеек.
+# ---------------------------------------------------------------------------
+import re
+import shlex
+import threading
+from fnmatch import fnmatchcase
+from collections import defaultdict
+
+CELL = 64  # Размер ячейки сетки координат, пикселей
+NAMED = ('cmd', 'image', 'field', 'label', 'x', 'y')  # Имена условий запроса
+FIELD_COMMANDS = ('WriteDataFromField', 'CycleForField', 'NextElementField')  # value - имя поля
+LABEL_COMMANDS = ('LabelCmd', 'BlockCmd', 'RunCmd', 'ErrorNoElement', 'ErrorNoData')  # value - метка
+
+_words = re.compile(r'\w+')
+_range = re.compile(r'^(\d+)(?:-(\d+))?$')
+
+
+def words(text: str) -> set:
+    """ Слова текста в нижнем регистре """
+    return set(_words.findall(text.lower()))
+
+
+def parse(query: str) -> dict:
+    """ Разбор строки запроса
+
+    Возвращает словарь условий: cmd, image, field, label - строки в нижнем регистре,
+    x, y - пары (от, до), words - список слов текста. Неверное условие - ValueError.
+    """
+    conditions = {'words': []}
+    try:
+        tokens = shlex.split(query)
+    except ValueError:
+        raise ValueError('В запросе не закрыты кавычки.') from None
+    for token in tokens:
+        name, sep, value = token.partition(':')
+        if not sep:
+            conditions['words'].extend(sorted(words(token)))
+            continue
+        name = name.lower()
+        if name not in NAMED:
+            raise ValueError(f'Неизвестное условие "{name}". Доступны: {", ".join(NAMED)}.')
+        if not value:
+            raise ValueError(f'Не указано значение условия "{name}".')
+        if name in ('x', 'y'):
+            match = _range.match(value)
+            if not match:
+                raise ValueError(f'Координата {name} задается числом или диапазоном, например {name}:100-200.')
+            low = int(match.group(1))
+            high = int(match.group(2)) if match.group(2) else low
+            conditions[name] = (min(low, high), max(low, high))
+        else:
+            conditions[name] = value.lower()
+    return conditions
+
+
+class CommandIndex:
+    """ Вторичные индексы команд скрипта
+
+    Принимает объект с данными о скрипте. Индексы (словари значение -> множество id):
+    cmd - имя класса, image - изображение, field - поле, label - метка или блок,
+    cell - ячейка сетки координат, word - слово текста строки.
+    Метод update подписывается на операции DataForWorker (data.listeners).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.lock = threading.Lock()  # Операции приходят и из потока записи действий
+        self.indexes = {name: defaultdict(set) for name in ('cmd', 'image', 'field', 'label', 'cell', 'word')}
+        self.entries = dict()  # id -> значения команды в индексах (для удаления без пересчета)
+        self.coordinates = dict()  # id -> (x, y) команд мыши
+        self.rebuild([(key, data.obj_command[key]) for key in data.queue_command])
+
+    @staticmethod
+    def entries_of(obj) -> list:
+        """ Пары (индекс, значение), по которым находится команда """
+        name = obj.__class__.__name__
+        entries = [('cmd', name.lower())]
+        image = getattr(obj, 'image', None)
+        if image:
+            entries.append(('image', str(image).lower()))
+        if name in FIELD_COMMANDS:
+            entries.append(('field', str(obj.value).lower()))
+        elif name in LABEL_COMMANDS:
+            label = str(getattr(obj.value, 'label', obj.value))
+            if label:
+                entries.append(('label', label.lower()))
+        if hasattr(obj, 'x'):
+            entries.append(('cell', (obj.x // CELL, obj.y // CELL)))
+        entries.extend(('word', word) for word in words(str(obj)))
+        return entries
+
+    def add(self, key, obj):
+        entries = self.entries[key] = self.entries_of(obj)
+        for name, value in entries:
+            self.indexes[name][value].add(key)
+        if hasattr(obj, 'x'):
+            self.coordinates[key] = (obj.x, obj.y)
+
+    def discard(self, key):
+        for name, value in self.entries.pop(key, ()):
+            keys = self.indexes[name][value]
+            keys.discard(key)
+            if not keys:
+                del self.indexes[name][value]  # Пустые значения не остаются в индексе
+        self.coordinates.pop(key, None)
+
+    def rebuild(self, pairs):
+        """ Индексы строятся заново по списку пар (id, команда) """
+        for index in self.indexes.values():
+            index.clear()
+        self.entries.clear()
+        self.coordinates.clear()
+        for key, obj in pairs:
+            self.add(key, obj)
+
+    def update(self, op):
+        """ Наблюдатель изменений скрипта (операции см. history.History)
+
+        Перенос строк не меняет состав команд, индексы при этом не трогаются.
+        """
+        kind = op[0]
+        with self.lock:
+            if kind == 'insert':
+                self.add(op[2], op[3])
+            elif kind == 'delete':
+                self.discard(op[2])
+            elif kind == 'replace':
+                self.discard(op[1])
+                self.add(op[1], op[3])
+            elif kind == 'load':
+                self.rebuild(op[2])
+
+    def lookup(self, name, pattern) -> set:
+        """ id команд, у которых значение индекса name подходит под шаблон """
+        index = self.indexes[name]
+        if not any(char in pattern for char in '*?['):
+            return set(index.get(pattern, ()))
+        return set().union(*(keys for value, keys in index.items() if fnmatchcase(value, pattern)))
+
+    def lookup_word(self, prefix) -> set:
+        """ id команд, в тексте которых есть слово, начинающееся с prefix """
+        index = self.indexes['word']
+        return set().union(*(keys for word, keys in index.items() if word.startswith(prefix)))
+
+    def lookup_area(self, xs, ys) -> set:
+        """ id команд мыши с координатами в диапазонах xs и ys (None - любая координата) """
+        xs = xs or (float('-inf'), float('inf'))
+        ys = ys or (float('-inf'), float('inf'))
+        found = set()
+        for (cx, cy), keys in self.indexes['cell'].items():
+            if cx * CELL > xs[1] or (cx + 1) * CELL <= xs[0] or cy * CELL > ys[1] or (cy + 1) * CELL <= ys[0]:
+                continue  # Ячейка не пересекается с областью
+            for key in keys:
+                x, y = self.coordinates[key]
+                if xs[0] <= x <= xs[1] and ys[0] <= y <= ys[1]:
+                    found.add(key)
+        return found
+
+    def find(self, query) -> list:
+        """ Поиск команд по строке запроса (см. parse) или словарю условий
+
+        Возвращает id найденных команд в порядке скрипта. Пустой запрос ничего не находит.
+        """
+        conditions = parse(query) if isinstance(query, str) else query
+        with self.lock:
+            candidates = [self.lookup(name, conditions[name]) for name in ('cmd', 'image', 'field', 'label')
+                          if name in conditions]
+            if 'x' in conditions or 'y' in conditions:
+                candidates.append(self.lookup_area(conditions.get('x'), conditions.get('y')))
+            candidates.extend(self.lookup_word(word) for word in conditions['words'])
+        if not candidates:
+            return []
+        candidates.sort(key=len)  # Пересечение начинаем с самого маленького множества
+        found = candidates[0].intersection(*candidates[1:])
+        return self.ordered(found)
+
+    def ordered(self, keys) -> list:
+        """ id в порядке скрипта
+
+        Немного найденных команд сортируются по позиции (O(log n) на команду),
+        много - выбираются проходом по очереди.
+        """
+        queue = self.data.queue_command
+        if len(keys) * max(len(queue).bit_length(), 1) < len(queue):
+            return sorted(keys, key=queue.index)
+        return [key for key in queue if key in keys]
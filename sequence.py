@@ -0,0 +1,229 @@
+# ---------------------------------------------------------------------------
+# Индексированная последовательность id команд (очередь команд скрипта)
+# Заменяет список в DataForWorker.queue_command. Вставка по позиции, удаление по id и
+# поиск позиции по id выполняются за O(log n) вместо O(n) у списка, поэтому массовые
+# удаления, переносы строк и поиск меток не становятся квадратичными на больших скриптах.
+# Внутри - декартово дерево (treap) с неявным ключом: порядок узлов в дереве и есть порядок
+# команд, в каждом узле хранится размер поддерева, у узлов есть ссылки на родителя,
+# а словарь id -> узел позволяет начинать поиск позиции прямо с узла.
+# Поддерживается та часть интерфейса списка, которой пользуется программа.
+# ---------------------------------------------------------------------------
+import random
+from itertools import islice
+
+
+class _Node:
+    """ Узел дерева: id команды, приоритет, потомки, родитель, размер поддерева """
+    __slots__ = ('id', 'priority', 'left', 'right', 'parent', 'size')
+
+    def __init__(self, id, priority):
+        self.id = id
+        self.priority = priority
+        self.left = self.right = self.parent = None
+        self.size = 1
+
+
+def _size(node) -> int:
+    return node.size if node else 0
+
+
+def _update(node):
+    """ Пересчет размера узла и ссылок потомков на него после изменения потомков """
+    node.size = 1 + _size(node.left) + _size(node.right)
+    if node.left:
+        node.left.parent = node
+    if node.right:
+        node.right.parent = node
+
+
+def _split(node, k):
+    """ Деление дерева на первые k элементов и остальные """
+    if node is None:
+        return None, None
+    if _size(node.left) >= k:
+        left, node.left = _split(node.left, k)
+        _update(node)
+        return left, node
+    node.right, right = _split(node.right, k - _size(node.left) - 1)
+    _update(node)
+    return node, right
+
+
+def _merge(left, right):
+    """ Объединение двух деревьев, все элементы left идут перед элементами right """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+class IndexedSequence:
+    """ Последовательность уникальных id с быстрым поиском позиции по id
+
+    Поддерживает len, перебор, in, получение по индексу и срезу, index, insert, append, extend,
+    remove, pop, clear, а также перенос блока move. Повторное добавление уже имеющегося id - ValueError.
+    """
+
+    def __init__(self, ids=()):
+        self.root = None
+        self.nodes = dict()  # id -> узел
+        self.extend(ids)
+
+    def __len__(self):
+        return _size(self.root)
+
+    def __contains__(self, id):
+        return id in self.nodes
+
+    def __iter__(self):
+        return self._iter_from(0)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({list(self)})'
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return list(self)[item]
+            return list(islice(self._iter_from(start), max(stop - start, 0)))
+        return self._node_at(self._position(item)).id
+
+    def _position(self, index) -> int:
+        """ Индекс с учетом отрицательных значений, IndexError за пределами последовательности """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Индекс за пределами очереди команд.')
+        return index
+
+    def _node_at(self, index):
+        """ Узел с заданной позицией """
+        node = self.root
+        while True:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node
+            else:
+                index -= left + 1
+                node = node.right
+
+    def _iter_from(self, start):
+        """ Перебор id в порядке последовательности, начиная с позиции start """
+        stack = []  # Узлы, которые еще предстоит выдать
+        node = self.root
+        while node:
+            left = _size(node.left)
+            if start < left:
+                stack.append(node)
+                node = node.left
+            elif start == left:
+                stack.append(node)
+                break
+            else:
+                start -= left + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.id
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def _new_node(self, id):
+        if id in self.nodes:
+            raise ValueError(f'{id} уже есть в очереди команд.')
+        node = self.nodes[id] = _Node(id, random.random())
+        return node
+
+    def index(self, id) -> int:
+        """ Позиция id: подъем от узла к корню, O(log n) """
+        try:
+            node = self.nodes[id]
+        except KeyError:
+            raise ValueError(f'{id} нет в очереди команд.') from None
+        index = _size(node.left)
+        while node.parent:
+            if node is node.parent.right:
+                index += _size(node.parent.left) + 1
+            node = node.parent
+        return index
+
+    def insert(self, index, id):
+        """ Вставка id перед позицией index (как list.insert) """
+        length = len(self)
+        if index < 0:
+            index = max(index + length, 0)
+        index = min(index, length)
+        node = self._new_node(id)
+        left, right = _split(self.root, index)
+        self._set_root(_merge(_merge(left, node), right))
+
+    def append(self, id):
+        self.insert(len(self), id)
+
+    def extend(self, ids):
+        """ Добавление id в конец, дерево из новых id строится за линейное время """
+        tree = self._build([self._new_node(id) for id in ids])
+        self._set_root(_merge(self.root, tree))
+
+    @staticmethod
+    def _build(nodes):
+        """ Построение дерева из узлов в заданном порядке за O(n) (стек правой ветви) """
+        stack = []
+        for node in nodes:
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                _update(last)
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        for node in reversed(stack):
+            _update(node)
+        return stack[0] if stack else None
+
+    def remove(self, id):
+        """ Удаление id из последовательности """
+        index = self.index(id)
+        self.pop(index)
+
+    def pop(self, index=-1):
+        """ Удаление и возврат id с позиции index """
+        index = self._position(index)
+        left, rest = _split(self.root, index)
+        node, right = _split(rest, 1)
+        del self.nodes[node.id]
+        self._set_root(_merge(left, right))
+        return node.id
+
+    def move(self, start, stop, position):
+        """ Перенос элементов с позиций от start до stop (не включая) одним блоком
+
+        Блок встает на позицию position в последовательности без него. Дерево разрезается и
+        склеивается заново, поэтому перенос занимает O(log n) независимо от размера блока.
+        """
+        left, rest = _split(self.root, start)
+        block, right = _split(rest, stop - start)
+        left, right = _split(_merge(left, right), position)
+        self._set_root(_merge(_merge(left, block), right))
+
+    def clear(self):
+        self.root = None
+        self.nodes.clear()
+
+    def _set_root(self, root):
+        self.root = root
+        if root:
+            root.parent = None
@@ -32,6 +32,9 @@ class Settings(object):
         # Сворачивать или нет окно редактора при начале записи
         self.minimize_window_on_recording = config['minimize_window']
 
+        # Сохранять скрипты проектов в компактном формате (.swd) вместо json
+        self.compact_projects = config['compact']
+
         # Настройки для программы
         self.data_folder = 'data'  # Папка с данными
         self.elements_folder = 'elements_img'  # Папка с изображениями элементов
@@ -58,6 +61,19 @@ class Settings(object):
         self.region = 48  # Сторона квадрата с сохраняемым элементом
         self.basename = "elem"  # Префикс для имени файла при сохранении изображения элемента
         self.region_for_search = 96  # Сторона квадрата в котором производится первоначальный поиск элемента
+        # Сколько секунд подтверждение изображения считается действительным, если не было ввода
+        self.confirm_validity = 1.0
+
+        # Ожидание стабилизации экрана после клика
+        self.settle_region = 200  # Сторона квадрата вокруг точки клика, который сравнивается
+        self.settle_interval = 0.03  # Интервал между снимками (сек.)
+        self.settle_frames = 3  # Сколько сравнений подряд без изменений считать стабильным экраном
+        self.settle_min = 0.05  # Минимальное ожидание после клика (сек.)
+        self.settle_quiet = 0.5  # Если экран после клика не менялся, сколько ждать, что он начнет меняться (сек.)
+
+        self.history_limit = 32 * 1024 * 1024  # Объем истории изменений скрипта (байт)
+        self.autosave_interval = 5  # Период автосохранения правок в журнал проекта (сек.)
+        self.journal_limit = 5000  # Длина журнала правок (записей), после которой он сжимается
 
         # Размер окна
         self.win_w = 800
@@ -66,9 +82,16 @@ class Settings(object):
         # Настройки скрипта по умолчанию
         self.default_settings()
 
+        # Настройки пакетного выполнения
+        self.batch_first_display = 100  # С какого номера искать свободный виртуальный дисплей
+        self.batch_screen = '1920x1080x24'  # Разрешение виртуальных дисплеев, если не задано другое
+
         # Настройки для быстрого запуска
         self.len_start_code = 4  # Длина кода для быстрого запуска
 
+        # Программа работает как сервис (--daemon), закрытие окон не завершает программу
+        self.daemon_mode = False
+
         # Дубликат флага запуска скрипта, позволяет узнавать, но не менять
         self.script_started = None
 
@@ -78,7 +101,9 @@ class Settings(object):
         # Все настройки скрипта начинаются с s_
         self.s_key_pause = (0.0, 'Пауза между нажатием клавиш клавиатуры')
         self.s_click_pause = (0.5, 'Пауза после клика мыши')
+        self.s_click_settle = (False, 'Ждать только пока экран не перестанет меняться')
         self.s_command_pause = (0.0, 'Пауза между командами (всеми)')
+        self.s_speed = (1.0, 'Скорость воспроизведения (2 - паузы вдвое короче)')
         self.s_reset_data_source = (True, 'Сбрасывать источник данных при запуске скрипта')
         self.s_confirm_element = (True, 'Включить локальную проверку')
         self.s_local_check_size = (96, 'Зона локальной проверки (сторона квадрата)')
@@ -86,6 +111,11 @@ class Settings(object):
         self.s_full_screen_search = (True, 'Искать на всем экране')
         self.s_error_no_element = (eres('dialog:'), "Какое действие выполнить если нет изображения")
         self.s_error_no_data = (eres('dialog:'), "Какое действие выполнить если нет данных")
+        self.s_command_timeout = (0.0, 'Предельное время выполнения команды, сек. (0 - без ограничения)')
+        self.s_script_timeout = (0.0, 'Предельное время выполнения скрипта, сек. (0 - без ограничения)')
+        self.s_error_timeout = (eres('stop:'), "Какое действие выполнить если команда зависла")
+        self.s_optimize_recording = (False, 'Оптимизировать скрипт после записи')
+        self.s_checkpoint = (True, 'Сохранять точку восстановления в конце каждого цикла')
         self.s_description = ('', 'Описание скрипта')
 
     def update_settings(self):
@@ -128,9 +158,9 @@ class Settings(object):
         self.top.iconbitmap('icon/edit.ico')
         self.top.transient(root)  # Поверх окна
 
-        # Размер окна
+        # Размер окна, высота зависит от количества настроек
         win_w = 700
-        win_h = 400
+        win_h = 135 + 25 * len([var for var in self.__dict__ if var[:2] == 's_'])
         self.top.geometry(f'{win_w}x{win_h}+{(w - win_w) // 2}+{(h - win_h) // 2}')  # Рисуем окно
         self.top.resizable(width=False, height=False)
 
@@ -182,6 +212,7 @@ class Settings(object):
         work_dir - рабочая директория
         developer - режим разработчика (True/False)
         minimize_window - Сворачивать или нет окно редактора при начале записи
+        compact - сохранять скрипты в компактном формате
 
         get - возвращается словарь с параметрами,
         set - в файл конфигурации записываются параметры kwargs.
@@ -193,7 +224,7 @@ class Settings(object):
             return
 
         cast = {'name': 'project_name', 'path': 'path_to_project', 'work_dir': 'work_dir', 'developer': 'developer',
-                'minimize_window': 'minimize_window'}
+                'minimize_window': 'minimize_window', 'compact': 'compact_projects'}
 
         config = ConfigParser()
         """ Получение файла конфигурации """
@@ -0,0 +1,197 @@
+# ---------------------------------------------------------------------------
+# Модуль для вывода текста на место курсора (команды Вывести текст и Вывод из поля)
+# Для каждой строки выбирается самый быстрый безопасный способ:
+#   набор символов через XTest (pynput) - короткие ASCII строки,
+#   набор одной командой xdotool - более длинные ASCII строки, если xdotool установлен,
+#   вставка через буфер обмена с подтверждением, что приложение забрало текст - все остальное.
+# Tk не допускает работу из других потоков, поэтому с буфером обмена работает главный поток
+# (root.after), поток скрипта ждет результата.
+# ---------------------------------------------------------------------------
+import shutil
+import string
+import subprocess
+import logging
+import threading
+from threading import Event
+
+from pynput.keyboard import Controller as kb_Controller, Key
+
+from define_platform import system
+from executor import executor
+from exceptions import CommandTimeout
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+kb = kb_Controller()
+
+
+class TextInjector:
+    """ Вывод текста в поле ввода
+
+    В Windows текст набирается напрямую, там это работает и для русских букв.
+    В Linux прямой набор надежен только для ASCII символов, поэтому остальные строки
+    вставляются через буфер обмена. Раньше после Ctrl+V выдерживалась пауза 0.2 сек.,
+    чтобы приложение успело забрать текст. Теперь буфер обмена занимает само окно программы
+    и ждет запроса выделения от приложения (событие X SelectionRequest), после которого сразу
+    возвращает прежнее содержимое буфера. Пауза ограничена сверху на случай, если запрос не придет.
+
+    """
+    root = None  # Ссылка на главное окно программы (через него работаем с буфером обмена)
+
+    type_limit = 32  # Максимальная длина строки для набора через XTest
+    xdotool_limit = 200  # Максимальная длина строки для набора через xdotool
+    paste_timeout = 1.0  # Сколько секунд максимум ждать, пока приложение заберет текст из буфера
+    main_timeout = 5.0  # Сколько секунд максимум ждать, пока главный поток выполнит работу с буфером
+
+    def __init__(self):
+        self.xdotool = shutil.which('xdotool')  # Путь к xdotool, если он установлен
+        self.text = ''  # Текст, который отдаем приложению через буфер обмена
+        self.served = Event()  # Устанавливается, когда приложение забрало текст из буфера обмена
+
+    @staticmethod
+    def is_ascii(text: str) -> bool:
+        """ Строка состоит только из печатных ASCII символов (без переводов строк и табуляции) """
+        return all(char in string.printable and char not in '\t\n\r\x0b\x0c' for char in text)
+
+    def strategy(self, text: str) -> str:
+        """ Выбор способа вывода строки: type, xdotool или clipboard """
+        if system.os == 'Windows':
+            return 'type'
+        if text and self.is_ascii(text):
+            if len(text) <= self.type_limit:
+                return 'type'
+            if self.xdotool and len(text) <= self.xdotool_limit:
+                return 'xdotool'
+        return 'clipboard'
+
+    def write(self, text):
+        """ Вывод текста на место курсора """
+        text = str(text)
+        if not text:
+            return
+        way = self.strategy(text)
+        if way == 'type':
+            kb.type(text)
+        elif way == 'xdotool':
+            try:
+                subprocess.run([self.xdotool, 'type', '--delay', '1', '--', text], check=True, timeout=10)
+            except (OSError, subprocess.SubprocessError) as err:
+                # xdotool не сработал, выводим через буфер обмена
+                logger.debug(f'xdotool: {err}')
+                self.paste(text)
+        else:
+            self.paste(text)
+
+    def serve(self, offset, length):
+        """ Обработчик запроса выделения CLIPBOARD от другого приложения
+
+        Tk вызывает его в главном потоке, возможно несколько раз для длинного текста.
+        Когда отдана последняя часть текста, сообщаем потоку скрипта, что можно продолжать.
+        """
+        offset, length = int(offset), int(length)
+        chunk = self.text[offset:offset + length]
+        if offset + length >= len(self.text):
+            self.served.set()
+        return chunk
+
+    def in_main_thread(self, func, *args):
+        """ Выполнение функции Tk в главном потоке программы
+
+        Поток скрипта ждет результат, но не дольше main_timeout (главный поток может быть занят).
+        Если время вышло, а функция еще не начала выполняться, она отменяется и позже не выполнится.
+        Возвращает (выполнено, результат), исключения функции передаются в вызывающий поток.
+        """
+        if threading.current_thread() is threading.main_thread():
+            return True, func(*args)
+        done = Event()
+        result = dict()
+        lock = threading.Lock()  # Отмена и начало выполнения не должны разминуться
+
+        def run():
+            with lock:
+                if result.get('cancelled'):
+                    return  # Поток скрипта больше не ждет
+                result['started'] = True
+            try:
+                result['value'] = func(*args)
+            except Exception as err:
+                result['error'] = err
+            finally:
+                done.set()
+
+        self.root.after(0, run)
+        if not done.wait(self.main_timeout):
+            with lock:
+                if not result.get('started'):
+                    result['cancelled'] = True
+                    return False, None
+            done.wait()  # Функция уже выполняется, ждем ее завершения
+        if 'error' in result:
+            raise result['error']
+        return True, result['value']
+
+    def take_clipboard(self, text):
+        """ Окно программы становится владельцем буфера обмена с текстом (в главном потоке)
+
+        Возвращает прежнее содержимое буфера и признак, что приложение сообщит о получении текста.
+        """
+        try:
+            mem = self.root.clipboard_get()
+        except:
+            mem = ''
+        try:
+            # Окно программы становится владельцем буфера обмена и само отвечает на запросы
+            self.root.selection_handle(self.serve, selection='CLIPBOARD')
+            self.root.selection_own(selection='CLIPBOARD')
+            confirmed = True
+        except:
+            # Не удалось занять буфер, работаем как раньше, через буфер обмена Tk
+            self.root.clipboard_clear()
+            self.root.clipboard_append(text)
+            confirmed = False
+        return mem, confirmed
+
+    def restore_clipboard(self, mem):
+        """ Возврат прежнего содержимого буфера обмена (в главном потоке) """
+        try:
+            self.root.clipboard_clear()
+            self.root.clipboard_append(mem)
+        except:
+            pass
+
+    def paste(self, text):
+        """ Вставка текста через буфер обмена с подтверждением """
+        self.text = text
+        self.served.clear()
+        done, result = self.in_main_thread(self.take_clipboard, text)
+        if not done:
+            # Главный поток не ответил, буфер обмена недоступен
+            if self.is_ascii(text):
+                logger.error('Буфер обмена недоступен, текст набирается напрямую.')
+                kb.type(text)
+                return
+            raise CommandTimeout('Буфер обмена недоступен (главный поток программы не ответил), текст не выведен.')
+        mem, confirmed = result
+
+        try:
+            executor.check_cancelled()  # Пока ждали главный поток, команду могли снять
+        except CommandTimeout:
+            self.in_main_thread(self.restore_clipboard, mem)
+            raise
+        kb.press(Key.ctrl)
+        kb.press('v')
+        kb.release('v')
+        kb.release(Key.ctrl)
+
+        if confirmed:
+            # Ждем пока приложение заберет текст, но не дольше paste_timeout
+            self.served.wait(self.paste_timeout)
+        else:
+            self.served.wait(0.2)  # Подтверждения не будет, старая пауза
+
+        self.in_main_thread(self.restore_clipboard, mem)
+
+
+text_injector = TextInjector()
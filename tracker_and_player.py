@@ -9,14 +9,20 @@ from tktooltip import ToolTip
 from pynput.mouse import Listener as MouseListener, Controller as mouse_Controller, Button as Btn
 from pynput.keyboard import Listener as KeyboardListener, Controller as kb_Controller, Key
 import logging
-import pyautogui
 from threading import Thread
 
 from settings import settings
+from data_types import eres
 from define_platform import system
-from element_images import save_image, pattern_search
+from element_images import save_image, pattern_search, wait_screen_stable, confirmations
 from exceptions import TemplateNotFoundError, ElementNotFound
 from hotkeys import hotkeys
+from text_injection import text_injector
+from profiler import profiler
+from checkpoint import checkpoint
+from delays import delays
+from executor import executor
+from watchdog import watchdog
 from define_platform import system
 
 
@@ -59,6 +65,7 @@ class Tracker:
         # Из очереди в программу события записываются только после завершения комбинации в виде одной команды. Или если
         # комбинация прервалась, то в неизменном виде. Так-же они могут не записываться, если комбинация специальная.
         self.queue_events = []  # Очередь событий, которые необходимо записать в программу
+        self.recorded = 0  # Сколько команд добавлено за время записи
 
 
         # Кнопки управления записью
@@ -91,6 +98,7 @@ class Tracker:
         self.data.is_listening = True  # Дублируем в data
         self.queue_events.clear()  # Очищаем очередь событий
         self.pressing_keys_set.clear()  # Очищаем множество нажатых клавиш
+        self.recorded = 0  # Счетчик записанных команд
 
         self.mouse_position = None  # Координаты мыши
         if self.only_screenshot != 'wait':
@@ -129,6 +137,9 @@ class Tracker:
             self.data.is_listening = False
             settings.is_saved = False  # Изменения в проекте не сохранены
             logger.error('Запись остановлена.')
+            if self.recorded and settings.s_optimize_recording:
+                # Оптимизация записанного скрипта, история сохраняется ниже
+                self.display_commands.optimize(history=False)
             self.save_load.save_history()  # Сохраняем историю
 
     def to_export(self, **kwargs):
@@ -258,6 +269,7 @@ class Tracker:
             for event in self.queue_events:
                 # Добавляем события в список программы
                 self.data.make_command(**event)  # Добавляем команду
+                self.recorded += 1
 
             self.display_commands.out_commands()  # Обновляем список
         self.queue_events.clear()  # Очищаем очередь
@@ -341,11 +353,13 @@ class Player:
     data = None  # Ссылка на класс с данными о скрипте
     tracker = None  # Ссылка на класс прослушивания клавиатуры и мыши
     data_source = None  # Ссылка на объект источник данных
+    thread = None  # Поток выполнения последнего запущенного скрипта
 
     def __init__(self, root, run_script):
         """ Принимает ссылку на главное окно и функцию, которую нужно запустить для выполнения скрипта """
         self.root = root
         self.run_script = run_script  # Функи выполнения скрипта
+        text_injector.root = root  # Через главное окно работаем с буфером обмена
         self.icon3 = PhotoImage(file="icon/play.png")
 
         play_button = Button(
@@ -354,16 +368,21 @@ class Player:
         play_button.place(x=262, y=settings.win_h - 43)
         ToolTip(play_button, msg="Выполнение скрипта", delay=0.5)
 
-    def load_and_run(self, path=None, data_source=None):
+    def load_and_run(self, path=None, data_source=None, resume=False, speed=None):
         """ Загрузка проекта и запуск скрипта
 
-        Принимает путь к проекту
+        Принимает путь к проекту. Если resume, то выполнение продолжается с точки восстановления.
+        speed - скорость воспроизведения из командной строки, только для этого запуска
         """
         self.tracker.save_load.open_project(path=path, data_source=data_source)  # Загрузка проекта
-        self.run_thread()  # Запуск выполнения скрипта
+        self.run_thread(resume=resume, speed=speed)  # Запуск выполнения скрипта
 
-    def run_thread(self):
-        """ Запуск функции выполнения скрипта в отдельном потоке """
+    def run_thread(self, resume=False, speed=None):
+        """ Запуск функции выполнения скрипта в отдельном потоке
+
+        Если resume, то состояние исполнителя восстанавливается из точки восстановления.
+        speed заменяет настройку скорости скрипта только для этого запуска
+        """
         if self.data.script_started or self.data.is_listening:
             return  # Операция невозможна при выполнении или записи скрипта
 
@@ -376,6 +395,13 @@ class Player:
         self.tracker.listener_kb.start()
 
         self.data.work_settings = settings.get_dict_settings()  # Рабочая копия настроек
+        self.data.finished = False
+        delays.set_speed(speed or self.data.work_settings['s_speed'])  # Множитель для всех пауз
+        if self.data.unattended:
+            # Отвечать на диалог некому, вместо него останавливаем скрипт
+            for key in ('s_error_no_element', 's_error_no_data', 's_error_timeout'):
+                if self.data.work_settings[key].react == 'dialog':
+                    self.data.work_settings[key] = eres('stop:')
         self.data.work_labels = dict()  # Заполняем словарь меток и названий блоков
         for key, obj in self.data.obj_command.items():
             if obj.__class__.__name__ == 'BlockCmd' or obj.__class__.__name__ == 'LabelCmd':
@@ -388,9 +414,18 @@ class Player:
             if self.data_source:
                 self.data_source.menu_reset_pointers()
 
+        checkpoint.start(self.data)
+        if resume:
+            checkpoint.restore(self.data)  # Продолжаем с места, где выполнение было прервано
+
+        profiler.start()  # Если профилирование включено, начинаем запись
+        executor.reset()
+        confirmations.invalidate()
+        watchdog.start(self.data)  # Контроль времени выполнения команд и скрипта
         new_thread = Thread(target=self.run_script)  # Создаём поток
         logger.warning('Выполнение скрипта')
         new_thread.start()  # Запускаем поток
+        self.thread = new_thread
 
     def run_command(self, cmd, val, des=None):
         """ Выполняет одну команду для мыши или клавиатуры
@@ -401,26 +436,36 @@ class Player:
         KeyDown, KeyUp, Write
 
         """
+        executor.check_cancelled()  # Команда снята сторожевым потоком, ввод не отправляем
+        confirmations.invalidate()  # После ввода прежние подтверждения изображений недействительны
         if cmd[:3] == 'Mou':
             # Команда мыши
-            # mouse.position = (val[0], val[1])  # Ставим указатель в нужную позицию
-            pyautogui.moveTo(val[0], val[1], 0.3)
+            import pyautogui  # Загружается при первой команде мыши, а не при запуске программы
 
-            if cmd == 'MouseClickRight':
-                # Клик правой копкой мыши
-                mouse.press(Btn.right)
-                mouse.release(Btn.right)
+            with profiler.phase('input'):
+                # mouse.position = (val[0], val[1])  # Ставим указатель в нужную позицию
+                pyautogui.moveTo(val[0], val[1], delays.scale(0.3))
 
-            if cmd == 'MouseClickLeft':
-                # Клик левой копкой мыши
-                mouse.press(Btn.left)
-                mouse.release(Btn.left)
+                if cmd == 'MouseClickRight':
+                    # Клик правой копкой мыши
+                    mouse.press(Btn.right)
+                    mouse.release(Btn.right)
 
-            elif cmd == 'MouseClickDouble':
-                # Двойной клик
-                mouse.click(Btn.left, 2)
+                if cmd == 'MouseClickLeft':
+                    # Клик левой копкой мыши
+                    mouse.press(Btn.left)
+                    mouse.release(Btn.left)
 
-            sleep(self.data.work_settings['s_click_pause']) # Пауза после клика мыши
+                elif cmd == 'MouseClickDouble':
+                    # Двойной клик
+                    mouse.click(Btn.left, 2)
+
+            if self.data.work_settings['s_click_settle']:
+                # Ждем, пока интерфейс отреагирует на клик, но не дольше паузы после клика
+                wait_screen_stable(val[0], val[1], self.data.work_settings['s_click_pause'])
+            else:
+                with profiler.phase('sleep'):
+                    delays.wait(self.data.work_settings['s_click_pause'])  # Пауза после клика мыши
 
         elif cmd[:3] == 'Key':
             # Подготовка к распознаванию как отдельных символов, так и специальных клавиш
@@ -433,42 +478,16 @@ class Player:
 
             if cmd == 'KeyDown':
                 # Нажать клавишу
-                exec(f"kb.press({insert})")
+                with profiler.phase('input'):
+                    exec(f"kb.press({insert})")
             else:
                 # Отпустить клавишу
-                exec(f"kb.release({insert})")
-                sleep(self.data.work_settings['s_key_pause'])  # Пауза между нажатием клавиш клавиатуры
+                with profiler.phase('input'):
+                    exec(f"kb.release({insert})")
+                with profiler.phase('sleep'):
+                    delays.wait(self.data.work_settings['s_key_pause'])  # Пауза между нажатием клавиш клавиатуры
 
         else:
-            # печатает используя костыли
-            # с помощью tkinter копируем в буфер обмена, а потом Ctrl+v
-            try:
-                mem = self.root.clipboard_get()
-            except:
-                mem = ''
-
-            # Функция работает для Windows, но для Linux русские буквы не работают
-            # определить операционную систему и реализовать вывод русского текста в Linux
-            if system.os == 'Windows':
-                # Для Windows
-                kb.type(str(val[0]))
-            else:
-                # Вывод русского текста в Linux
-                try:
-                    mem = self.root.clipboard_get()
-                    self.root.clipboard_clear()
-                    self.root.clipboard_append(val[0])
-                except:
-                    mem = ''
-                kb.press(Key.ctrl)
-                kb.press('v')
-                kb.release('v')
-                kb.release(Key.ctrl)
-                sleep(0.2)  # Без паузы видимо успевает очистить раньше, чем вставить
-                try:
-                    self.root.clipboard_clear()
-                    self.root.clipboard_append(mem)
-                except:
-                    pass
-                self.root.update()
-
+            # Вывод текста (WriteCmd, WriteDataFromField), способ выбирается для каждой строки
+            with profiler.phase('input'):
+                text_injector.write(val[0])
@@ -0,0 +1,237 @@
+# ---------------------------------------------------------------------------
+# Виртуальный список строк скрипта
+# ttk.Treeview не рассчитан на десятки тысяч строк: вывод и обновление списка занимали секунды.
+# Здесь в виджете существуют только видимые строки (height штук), остальные берутся из очереди
+# команд при прокрутке. Выделение хранится в списке (по id строк), а не в виджете, поэтому
+# выделять можно и строки, которые сейчас не видны.
+# Изменения скрипта передаются списку точечно (inserted, deleted, changed, refresh, reset):
+# они только поправляют выделение и положение прокрутки и планируют перерисовку видимых строк.
+# Перерисовка выполняется один раз, когда программа освобождается, сколько бы изменений ни было.
+# Первая строка списка - пустая строка 'zero' (позиция перед первой командой).
+# Строки можно отметить (mark) - например, найденные поиском, отмеченные строки выводятся с подсветкой.
+# ---------------------------------------------------------------------------
+from tkinter import ttk, NO, VERTICAL
+
+
+class VirtualList:
+    """ Список, в виджете которого существуют только видимые строки
+
+    Принимает родительский виджет, последовательность id строк (с len, срезами и index),
+    функцию текста строки по id, число видимых строк, ширину колонок номера и текста и
+    функцию, вызываемую после изменения выделения.
+    """
+    blank = 'zero'  # id пустой первой строки
+
+    def __init__(self, parent, keys, text, height=28, widths=(80, 300), on_select=None):
+        self.keys = keys
+        self.text = text
+        self.height = height
+        self.on_select = on_select
+        self.top = 0  # Номер первой видимой строки
+        self.selected = set()  # id выделенных строк
+        self.marked = set()  # id отмеченных (подсвеченных) строк
+        self.anchor = None  # Строка, от которой выделяется диапазон (Shift)
+        self.cursor = None  # Строка, с которой работают клавиши вверх и вниз
+        self.render_pending = False  # Перерисовка запланирована
+        self.select_pending = False  # Сообщение о смене выделения запланировано
+
+        self.tree = ttk.Treeview(parent, show="", columns=('number', 'command'), selectmode="extended",
+                                 height=height)
+        self.tree.column("#1", stretch=NO, width=widths[0])
+        self.tree.column("#2", stretch=NO, width=widths[1])
+        self.tree.tag_configure('marked', background='#fff3b0')
+        self.tree.place(x=0, y=0)
+        self.scrollbar = ttk.Scrollbar(parent, orient=VERTICAL, command=self.yview)
+        self.scrollbar.place(x=sum(widths) + 2, y=0, height=self.tree.winfo_reqheight())
+
+        # Свои обработчики мыши и клавиш идут после обработчиков самого виджета и вместо
+        # стандартных обработчиков Treeview, которые знают только о видимых строках
+        tag = f'VirtualList{id(self)}'
+        self.tree.bindtags((str(self.tree), tag) + self.tree.bindtags()[1:])
+        self.tree.bind_class(tag, '<ButtonPress-1>', self.click)
+        self.tree.bind_class(tag, '<Double-ButtonPress-1>', self.click)
+        self.tree.bind_class(tag, '<B1-Motion>', lambda event: 'break')
+        self.tree.bind_class(tag, '<ButtonRelease-1>', lambda event: 'break')
+        self.tree.bind_class(tag, '<KeyPress-Up>', lambda event: self.step(event, -1))
+        self.tree.bind_class(tag, '<KeyPress-Down>', lambda event: self.step(event, 1))
+        self.tree.bind_class(tag, '<KeyPress-Prior>', lambda event: self.step(event, -self.height))
+        self.tree.bind_class(tag, '<KeyPress-Next>', lambda event: self.step(event, self.height))
+        self.tree.bind_class(tag, '<KeyPress-Home>', lambda event: self.step(event, -len(self)))
+        self.tree.bind_class(tag, '<KeyPress-End>', lambda event: self.step(event, len(self)))
+        self.tree.bind_class(tag, '<MouseWheel>', lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.tree.bind_class(tag, '<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind_class(tag, '<Button-5>', lambda event: self.scroll(3))
+        self.refresh()
+
+    def __len__(self):
+        """ Число строк вместе с пустой """
+        return len(self.keys) + 1
+
+    def index(self, key) -> int:
+        """ Номер строки по id """
+        return 0 if key == self.blank else self.keys.index(key) + 1
+
+    def rows(self, start, stop) -> list:
+        """ id строк с номерами от start до stop (не включая) """
+        start = max(start, 0)
+        if stop <= start:
+            return []
+        rows = [self.blank] if start == 0 else []
+        return rows + self.keys[max(start - 1, 0):stop - 1]
+
+    # ----------------------------- Изменения скрипта -----------------------------
+
+    def inserted(self, position, key):
+        """ В очередь вставлена строка на позицию position """
+        if position + 1 < self.top:
+            self.top += 1  # Вставка выше видимой части не сдвигает видимые строки
+        self.refresh()
+
+    def deleted(self, position, key):
+        """ Из очереди удалена строка, стоявшая на позиции position """
+        self.selected.discard(key)
+        self.marked.discard(key)
+        if self.anchor == key:
+            self.anchor = None
+        if self.cursor == key:
+            self.cursor = None
+        if position + 1 < self.top:
+            self.top -= 1
+        self.refresh()
+
+    def changed(self, key):
+        """ Изменился текст строки """
+        self.refresh()
+
+    def reset(self):
+        """ Скрипт заменен целиком: выделение сбрасывается, список прокручивается в начало """
+        self.selected.clear()
+        self.marked.clear()
+        self.anchor = self.cursor = None
+        self.top = 0
+        self.refresh()
+
+    def refresh(self):
+        """ Планирует перерисовку видимых строк """
+        if not self.render_pending:
+            self.render_pending = True
+            self.tree.after_idle(self.render)
+
+    def render(self):
+        """ Вывод видимых строк в виджет """
+        self.render_pending = False
+        total = len(self)
+        self.top = max(min(self.top, total - self.height), 0)
+        self.tree.delete(*self.tree.get_children())
+        visible = []
+        for row, key in enumerate(self.rows(self.top, self.top + self.height), self.top):
+            if key == self.blank:
+                self.tree.insert('', 'end', key, values=('', ''))
+            else:
+                self.tree.insert('', 'end', key, values=(row, self.text(key)),
+                                 tags=('marked',) if key in self.marked else ())
+            if key in self.selected:
+                visible.append(key)
+        self.tree.selection_set(visible)
+        self.scrollbar.set(self.top / total, min((self.top + self.height) / total, 1.0))
+
+    def mark(self, keys):
+        """ Отметить строки по id (пустой список снимает отметку) """
+        self.marked = set(keys)
+        self.refresh()
+
+    # ----------------------------- Прокрутка -----------------------------
+
+    def yview(self, *args):
+        """ Обработчик полосы прокрутки """
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self))
+        elif args[0] == 'scroll':
+            self.top += int(args[1]) * (self.height if args[2] == 'pages' else 1)
+        self.refresh()
+
+    def scroll(self, rows):
+        """ Прокрутка на rows строк """
+        self.top += rows
+        self.refresh()
+        return 'break'
+
+    def see(self, key):
+        """ Прокрутка, при которой строка видна """
+        row = self.index(key)
+        if row < self.top:
+            self.top = row
+        elif row >= self.top + self.height:
+            self.top = row - self.height + 1
+        self.refresh()
+
+    # ----------------------------- Выделение -----------------------------
+
+    def selection(self) -> list:
+        """ id выделенных строк в порядке списка """
+        return sorted(self.selected, key=self.index)
+
+    def first_selected(self):
+        """ id первой выделенной строки (None, если выделения нет), без сортировки всего выделения """
+        return min(self.selected, key=self.index) if self.selected else None
+
+    def selection_set(self, keys):
+        """ Выделение строк по id, первая становится текущей """
+        keys = list(keys)
+        self.selected = set(keys)
+        self.anchor = self.cursor = keys[0] if keys else None
+        self.selection_changed()
+
+    def select_all(self):
+        """ Выделение всех строк """
+        self.selected = set(self.keys)
+        self.selected.add(self.blank)
+        self.selection_changed()
+
+    def selection_changed(self):
+        """ Перерисовка и сообщение о смене выделения, когда программа освободится """
+        self.refresh()
+        if self.on_select and not self.select_pending:
+            self.select_pending = True
+            self.tree.after_idle(self.notify_select)
+
+    def notify_select(self):
+        self.select_pending = False
+        self.on_select()
+
+    def click(self, event):
+        """ Выделение мышью: щелчок, с Ctrl - добавить или убрать строку, с Shift - диапазон """
+        self.tree.focus_set()
+        key = self.tree.identify_row(event.y)
+        if not key:
+            return 'break'
+        if event.state & 0x0004:  # Ctrl
+            self.selected ^= {key}
+            self.anchor = self.cursor = key
+            self.selection_changed()
+        elif event.state & 0x0001 and self.anchor is not None:  # Shift
+            self.select_range(key)
+        else:
+            self.selection_set([key])
+        return 'break'
+
+    def step(self, event, rows):
+        """ Перемещение текущей строки клавишами, с Shift - расширение выделения """
+        if event.state & 0x0004:
+            return 'break'  # Ctrl со стрелками обрабатывает сам список команд (перенос строк)
+        row = self.index(self.cursor) if self.cursor is not None else self.top
+        row = max(min(row + rows, len(self) - 1), 0)
+        key = self.rows(row, row + 1)[0]
+        if event.state & 0x0001 and self.anchor is not None:
+            self.select_range(key)
+        else:
+            self.selection_set([key])
+        self.see(key)
+        return 'break'
+
+    def select_range(self, key):
+        """ Выделение строк от начальной (anchor) до key """
+        first, last = sorted((self.index(self.anchor), self.index(key)))
+        self.selected = set(self.rows(first, last + 1))
+        self.cursor = key
+        self.selection_changed()
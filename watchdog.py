@@ -0,0 +1,152 @@
+# ---------------------------------------------------------------------------
+# Сторожевой поток исполнителя скрипта
+# Следит за временем выполнения текущей команды (настройка s_command_timeout) и всего
+# скрипта (s_script_timeout). При превышении записывает отчет о зависании в папку проекта:
+# снимок экрана и стеки всех потоков программы. Зависшая команда снимается (задача асинхронного
+# исполнителя отменяется), и применяется реакция на ошибку s_error_timeout. Превышение времени
+# скрипта всегда останавливает скрипт.
+# Сам зависший вызов (например, буфер обмена) прервать нельзя, он остается в своем потоке пула:
+# исполнитель помечает его отмененным (ввод от него больше не отправляется) и заменяет пул.
+# Время диалога с пользователем не входит во время команды, диалог ограничен отдельно (stop_for_dialog).
+# ---------------------------------------------------------------------------
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from datetime import datetime
+
+from settings import settings
+
+
+# создание логгера и обработчика
+logger = logging.getLogger('logger')
+
+
+class Watchdog:
+    """ Контроль времени выполнения команд и скрипта """
+
+    interval = 0.2  # Период проверки, сек.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.finished.set()  # Скрипт не выполняется
+        self.data = None  # Объект с данными о скрипте, передается при запуске
+        self.command_timeout = 0  # Предельное время команды, 0 - без ограничения
+        self.script_deadline = None  # Момент, когда истекает время скрипта
+        self.task = None  # Задача исполнителя с текущей командой
+        self.loop = None  # Цикл событий, в котором выполняется задача
+        self.line = 0  # Номер строки текущей команды
+        self.command = None  # Объект текущей команды
+        self.deadline = None  # Момент, когда истекает время текущей команды
+        self.suspended_at = None  # Начало диалога, на время которого отсчет остановлен
+        self.breach = None  # Причина последнего срабатывания: ('command' | 'script', сообщение)
+
+    def start(self, data):
+        """ Запуск сторожевого потока, принимает объект с данными о скрипте (рабочие настройки уже созданы) """
+        self.finish()
+        self.data = data
+        self.command_timeout = data.work_settings['s_command_timeout']
+        script_timeout = data.work_settings['s_script_timeout']
+        self.script_deadline = time.monotonic() + script_timeout if script_timeout > 0 else None
+        self.breach = None
+        if self.command_timeout <= 0 and self.script_deadline is None:
+            return  # Ограничений нет, следить не за чем
+        self.finished.clear()
+        threading.Thread(target=self.run, name='watchdog', daemon=True).start()
+
+    def finish(self):
+        """ Остановка сторожевого потока после завершения скрипта """
+        self.finished.set()
+        self.release()
+
+    def run(self):
+        """ Периодическая проверка времени """
+        while not self.finished.wait(self.interval):
+            self.check()
+
+    def watch(self, line, command, task, loop):
+        """ Начало отсчета времени команды
+
+        Принимает номер строки, объект команды, задачу, в которой она выполняется, и ее цикл событий.
+        """
+        with self.lock:
+            self.line, self.command, self.task, self.loop = line, command, task, loop
+            self.deadline = time.monotonic() + self.command_timeout if self.command_timeout > 0 else None
+            self.suspended_at = None
+
+    def release(self):
+        """ Команда завершена """
+        with self.lock:
+            self.task = self.loop = self.command = self.deadline = None
+
+    def suspend(self):
+        """ Остановка отсчета времени команды на время диалога с пользователем """
+        with self.lock:
+            self.suspended_at = time.monotonic()
+
+    def resume(self):
+        """ Продолжение отсчета, время диалога добавляется к сроку команды """
+        with self.lock:
+            if self.suspended_at is not None and self.deadline is not None:
+                self.deadline += time.monotonic() - self.suspended_at
+            self.suspended_at = None
+
+    def check(self):
+        """ Проверка сроков, выполняется сторожевым потоком """
+        now = time.monotonic()
+        with self.lock:
+            if self.script_deadline is not None and now > self.script_deadline:
+                self.script_deadline = None  # Срабатывает один раз
+                kind, message = 'script', f'Превышено время выполнения скрипта ' \
+                                          f'({self.data.work_settings["s_script_timeout"]} сек.).'
+            elif self.task is not None and self.deadline is not None and self.suspended_at is None \
+                    and now > self.deadline:
+                kind, message = 'command', f'Команда в строке {self.line} ({self.command.command_name}) ' \
+                                           f'выполняется дольше {self.command_timeout} сек.'
+            else:
+                return
+            self.breach = (kind, message)
+            stacks = self.stacks()  # Стеки снимаем до отмены, пока зависший вызов на месте
+            task, loop = self.task, self.loop
+            self.task = self.loop = self.deadline = None
+
+        if kind == 'script':
+            self.data.script_started = False  # Останавливает цикл выполнения и прерывает паузы
+        if task is not None:
+            loop.call_soon_threadsafe(task.cancel)
+        self.report(message, stacks)
+
+    @staticmethod
+    def stacks() -> str:
+        """ Стеки всех потоков программы """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        text = []
+        for ident, frame in sys._current_frames().items():
+            text.append(f'Поток {names.get(ident, ident)}:\n{"".join(traceback.format_stack(frame))}')
+        return '\n'.join(text)
+
+    def report(self, message, stacks=None):
+        """ Запись отчета о зависании: текст со стеками потоков и снимок экрана
+
+        Возвращает путь к текстовому файлу отчета.
+        """
+        path = os.path.join(settings.path_to_script, f'hang_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
+        try:
+            with open(f'{path}.txt', 'w', encoding='utf-8') as f:
+                f.write(f'Скрипт {settings.project_name}. {datetime.now().strftime("%d.%m.%Y %H:%M:%S")}\n'
+                        f'{message}\n\n{stacks or self.stacks()}')
+        except OSError as err:
+            logger.error(f'Не удалось записать отчет о зависании. {err}')
+        try:
+            import pyautogui
+            pyautogui.screenshot(f'{path}.png')
+        except Exception as err:  # Снимок экрана не обязателен, экран может быть недоступен
+            logger.error(f'Не удалось сохранить снимок экрана. {err}')
+        logger.error(f'{message}\nОтчет о зависании: {path}.txt')
+        return f'{path}.txt'
+
+
+watchdog = Watchdog()  # Создаем объект сторожевого потока